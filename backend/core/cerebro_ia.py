@@ -1,5 +1,8 @@
 import os
 import json
+import time
+import asyncio
+import hashlib
 import chromadb
 from typing import Dict, Any, List, Optional
 from pathlib import Path
@@ -24,6 +27,8 @@ from chromadb.config import Settings
 from thefuzz import fuzz
 
 from core.shared import IA_MODELS, print_error, print_info, print_success, print_warning
+from services.embedding_cache import CachedEmbeddings
+from services.json_stream import JsonStringField
 
 # --- CONFIGURAÇÕES ---
 CORE_DIR = Path(__file__).parent.resolve()
@@ -31,10 +36,60 @@ BACKEND_DIR = CORE_DIR.parent.resolve()
 DATA_DIR = BACKEND_DIR / "data"
 PLAYBOOK_PATH = str(DATA_DIR / "playbook_vendas.json")
 GEMINI_MODEL_NAME = "gemini-2.5-flash"
+EMBEDDING_MODEL_NAME = "models/text-embedding-004"
+COLLECTION_NAME = "evolution"
 env_path = BACKEND_DIR / ".env"
 load_dotenv(dotenv_path=env_path)
 
 
+# Chamadas simultâneas ao LLM (o resto espera na fila, sem ocupar o event loop)
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+
+
+class AIConcurrencyLimiter:
+    """ Semáforo com métricas: quantas chamadas em andamento, na fila e quanto esperaram. """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self.total = 0
+        self.max_wait_s = 0.0
+        self._wait_total = 0.0
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - started
+        self.in_flight += 1
+        self.total += 1
+        self._wait_total += waited
+        self.max_wait_s = max(self.max_wait_s, waited)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "total": self.total,
+            "avg_wait_s": round(self._wait_total / self.total, 3) if self.total else None,
+            "max_wait_s": round(self.max_wait_s, 3)
+        }
+
+
+ai_limiter = AIConcurrencyLimiter(AI_MAX_CONCURRENCY)
+
+
 # --- CLASSES DE SAÍDA ---
 class AIResponse(BaseModel):
     sugestao_resposta: str = Field(description="A sugestão de resposta para o vendedor enviar.")
@@ -99,91 +154,207 @@ class SalesCopilot:
         """)
         self.context_chain = self.context_prompt | self.llm.with_structured_output(SalesContextResponse)
 
+        # Prompt Específico para Consultas Internas
+        self.internal_prompt = ChatPromptTemplate.from_template("""
+        Você é o VENAI, um assistente sênior de vendas.
+        
+        CONTEXTO DA CONVERSA (Últimas mensagens):
+        {history_context}
+        
+        CONTEXTO TÉCNICO (RAG):
+        {tech_context}
+        
+        PERGUNTA DO VENDEDOR:
+        "{query}"
+        
+        OBJETIVO: Responder a dúvida do vendedor de forma direta, técnica e informativa.
+        Use o histórico da conversa para entender o contexto da pergunta.
+        NÃO sugira uma resposta para o cliente.
+        NÃO sugira próximos passos.
+        Apenas responda a pergunta.
+        
+        Responda ESTRITAMENTE neste formato JSON:
+        {{
+            "sugestao_resposta": "Sua resposta informativa para o vendedor...",
+            "proximo_passo": null
+        }}
+        """)
+        self.internal_chain = self.internal_prompt | self.llm.with_structured_output(AIResponse)
+
+    @staticmethod
+    def _history_text(history, limit):
+        recent_msgs = history[-limit:] if history else []
+        return "\n".join([f"{m.get('sender', '?').upper()}: {m.get('content', '')}" for m in recent_msgs])
+
+    @staticmethod
+    def _tech_text(docs):
+        if docs:
+            print_success(f"📚 [IA] Encontrados {len(docs)} documentos técnicos.")
+            return "\n\n".join([d.page_content for d in docs])
+        return "Nenhuma informação técnica encontrada."
+
+    @staticmethod
+    def _suggestion_result(resp):
+        return {
+            "status": "success",
+            "suggestions": {
+                "immediate_answer": resp.sugestao_resposta,
+                "follow_up_options": [
+                    {"text": resp.proximo_passo, "is_recommended": True}] if resp.proximo_passo else []
+            }
+        }
+
     # 💡 CORREÇÃO AQUI: Argumentos renomeados para bater com o main.py
     def generate_sales_suggestions(self, query, full_conversation_history, current_stage_id, is_private_query,
                                    client_data):
+        """ Versão síncrona (scripts). Dentro do FastAPI use agenerate_sales_suggestions. """
         print_info(f"🤖 [IA] Gerando sugestão para: '{query}'")
 
-        # Usa a variável com o nome novo
-        history = full_conversation_history
-
         # 1. Prepara o Histórico
-        recent_msgs = history[-10:] if history else []
-        history_text = "\n".join([f"{m.get('sender', '?').upper()}: {m.get('content', '')}" for m in recent_msgs])
+        history_text = self._history_text(full_conversation_history, 10)
 
         # 2. Busca Conhecimento Técnico (RAG)
-        tech_text = "Nenhuma informação técnica encontrada."
+        docs = None
         if self.retriever:
             try:
                 docs = self.retriever.invoke(query)
-                if docs:
-                    tech_text = "\n\n".join([d.page_content for d in docs])
-                    print_success(f"📚 [IA] Encontrados {len(docs)} documentos técnicos.")
             except Exception as e:
                 print_warning(f"⚠️ [IA] Erro no retriever: {e}")
+        tech_text = self._tech_text(docs)
 
         # 3. Chama o LLM
         try:
-            if is_private_query:
-                # Prompt Específico para Consultas Internas
-                internal_prompt = ChatPromptTemplate.from_template("""
-                Você é o VENAI, um assistente sênior de vendas.
-                
-                CONTEXTO DA CONVERSA (Últimas mensagens):
-                {history_context}
-                
-                CONTEXTO TÉCNICO (RAG):
-                {tech_context}
-                
-                PERGUNTA DO VENDEDOR:
-                "{query}"
-                
-                OBJETIVO: Responder a dúvida do vendedor de forma direta, técnica e informativa.
-                Use o histórico da conversa para entender o contexto da pergunta.
-                NÃO sugira uma resposta para o cliente.
-                NÃO sugira próximos passos.
-                Apenas responda a pergunta.
-                
-                Responda ESTRITAMENTE neste formato JSON:
-                {{
-                    "sugestao_resposta": "Sua resposta informativa para o vendedor...",
-                    "proximo_passo": null
-                }}
-                """)
-                chain = internal_prompt | self.llm.with_structured_output(AIResponse)
-                resp = chain.invoke({
+            chain = self.internal_chain if is_private_query else self.chain
+            resp = chain.invoke({
+                "history_context": history_text,
+                "tech_context": tech_text,
+                "query": query
+            })
+            return self._suggestion_result(resp)
+        except Exception as e:
+            print_error(f"❌ [IA] Erro ao gerar resposta: {e}")
+            traceback.print_exc()
+            return {"status": "error", "suggestions": {"immediate_answer": "Erro ao processar IA."}}
+
+    async def agenerate_sales_suggestions(self, query, full_conversation_history, current_stage_id,
+                                          is_private_query, client_data):
+        """
+        Mesma coisa, sem travar o event loop: retriever e LLM via ainvoke, dentro do limitador
+        global (AI_MAX_CONCURRENCY chamadas simultâneas ao Gemini; as demais esperam na fila).
+        """
+        print_info(f"🤖 [IA] Gerando sugestão (async) para: '{query}'")
+        history_text = self._history_text(full_conversation_history, 10)
+
+        async with ai_limiter:
+            docs = None
+            if self.retriever:
+                try:
+                    docs = await self.retriever.ainvoke(query)
+                except Exception as e:
+                    print_warning(f"⚠️ [IA] Erro no retriever: {e}")
+            tech_text = self._tech_text(docs)
+
+            try:
+                chain = self.internal_chain if is_private_query else self.chain
+                resp = await chain.ainvoke({
                     "history_context": history_text,
                     "tech_context": tech_text,
                     "query": query
                 })
-            else:
-                # Prompt Padrão (Sugestão de Resposta)
-                resp = self.chain.invoke({
+                return self._suggestion_result(resp)
+            except Exception as e:
+                print_error(f"❌ [IA] Erro ao gerar resposta: {e}")
+                traceback.print_exc()
+                return {"status": "error", "suggestions": {"immediate_answer": "Erro ao processar IA."}}
+
+    async def astream_sales_suggestions(self, query, full_conversation_history, current_stage_id,
+                                        is_private_query, client_data):
+        """
+        Streaming: gera ("token", trecho) com o texto de sugestao_resposta à medida que o LLM
+        escreve o JSON e, no fim, ("final", resultado) no mesmo formato de agenerate_sales_suggestions.
+        O LLM é drenado para uma fila dentro do limitador; o cliente lê a fila fora dele, então um
+        consumidor lento não segura a vaga do Gemini (o slot volta assim que a geração termina).
+        """
+        print_info(f"🤖 [IA] Gerando sugestão (streaming) para: '{query}'")
+        queue: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.create_task(self._produce_stream(queue, query, full_conversation_history,
+                                                            is_private_query))
+
+        def _failed(task: asyncio.Task):
+            # erro inesperado fora do try da geração: o consumidor não pode ficar esperando para sempre
+            if not task.cancelled() and task.exception() is not None:
+                print_error(f"❌ [IA] Streaming interrompido: {task.exception()}")
+                queue.put_nowait(("final", {"status": "error",
+                                            "suggestions": {"immediate_answer": "Erro ao processar IA."}}))
+
+        producer.add_done_callback(_failed)
+        try:
+            while True:
+                kind, payload = await queue.get()
+                yield kind, payload
+                if kind == "final":
+                    return
+        finally:
+            # cliente desistiu no meio: não faz sentido continuar gerando
+            if not producer.done():
+                producer.cancel()
+
+    async def _produce_stream(self, queue: asyncio.Queue, query, full_conversation_history, is_private_query):
+        history_text = self._history_text(full_conversation_history, 10)
+        async with ai_limiter:
+            docs = None
+            if self.retriever:
+                try:
+                    docs = await self.retriever.ainvoke(query)
+                except Exception as e:
+                    print_warning(f"⚠️ [IA] Erro no retriever: {e}")
+            tech_text = self._tech_text(docs)
+
+            prompt = self.internal_prompt if is_private_query else self.prompt
+            field = JsonStringField("sugestao_resposta")
+            raw, streamed = [], []
+            try:
+                # Texto cru (sem with_structured_output, que só entrega o objeto pronto no fim)
+                async for chunk in (prompt | self.llm).astream({
                     "history_context": history_text,
                     "tech_context": tech_text,
                     "query": query
-                })
-
-            return {
-                "status": "success",
-                "suggestions": {
-                    "immediate_answer": resp.sugestao_resposta,
-                    "follow_up_options": [
-                        {"text": resp.proximo_passo, "is_recommended": True}] if resp.proximo_passo else []
-                }
-            }
-        except Exception as e:
-            print_error(f"❌ [IA] Erro ao gerar resposta: {e}")
-            traceback.print_exc()
-            return {"status": "error", "suggestions": {"immediate_answer": "Erro ao processar IA."}}
+                }):
+                    text = chunk.content if isinstance(chunk.content, str) else "".join(
+                        part.get("text", "") if isinstance(part, dict) else str(part) for part in chunk.content)
+                    raw.append(text)
+                    delta = field.feed(text)
+                    if delta:
+                        streamed.append(delta)
+                        queue.put_nowait(("token", delta))
+            except Exception as e:
+                print_error(f"❌ [IA] Erro ao gerar resposta (streaming): {e}")
+                traceback.print_exc()
+                queue.put_nowait(("final", {"status": "error",
+                                            "suggestions": {"immediate_answer": "Erro ao processar IA."}}))
+                return
+
+        queue.put_nowait(("final", self._suggestion_result(self._parse_streamed("".join(raw), "".join(streamed)))))
+
+    @staticmethod
+    def _parse_streamed(raw_text, streamed_answer):
+        """ JSON completo -> AIResponse; se o modelo fugiu do formato, fica o texto já enviado. """
+        cleaned = raw_text.strip()
+        if cleaned.startswith("```"):
+            cleaned = cleaned.split("\n", 1)[-1].rsplit("```", 1)[0]
+        start, end = cleaned.find("{"), cleaned.rfind("}")
+        for candidate in (cleaned, cleaned[start:end + 1]):
+            try:
+                return AIResponse(**{"proximo_passo": None, **json.loads(candidate)})
+            except Exception:
+                continue
+        return AIResponse(sugestao_resposta=streamed_answer or raw_text.strip(), proximo_passo=None)
 
     def analyze_sales_context(self, full_conversation_history):
         print_info(f"🤖 [IA] Analisando contexto de vendas...")
         
-        history = full_conversation_history
         # Pega mais contexto para análise (20 msgs)
-        recent_msgs = history[-20:] if history else []
-        history_text = "\n".join([f"{m.get('sender', '?').upper()}: {m.get('content', '')}" for m in recent_msgs])
+        history_text = self._history_text(full_conversation_history, 20)
         
         try:
             resp = self.context_chain.invoke({
@@ -198,8 +369,19 @@ class SalesCopilot:
             print_error(f"❌ [IA] Erro ao analisar contexto: {e}")
             return {"status": "error", "analysis": None}
 
+    async def aanalyze_sales_context(self, full_conversation_history):
+        print_info(f"🤖 [IA] Analisando contexto de vendas (async)...")
+        history_text = self._history_text(full_conversation_history, 20)
+
+        async with ai_limiter:
+            try:
+                resp = await self.context_chain.ainvoke({"history_context": history_text})
+                return {"status": "success", "analysis": resp.dict()}
+            except Exception as e:
+                print_error(f"❌ [IA] Erro ao analisar contexto: {e}")
+                return {"status": "error", "analysis": None}
+
 
-# --- FACTORY ---
 def initialize_chroma_client():
     """
     Inicializa cliente Chroma LOCAL (PersistentClient).
@@ -245,8 +427,10 @@ def load_models(client):
 
     try:
         print_info("📝 [IA] Inicializando Embeddings...")
-        embed = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004", google_api_key=api_key)
-        print_success("✅ [IA] Embeddings carregados")
+        # Cache persistente (services/embedding_cache.py): pergunta repetida não chama o Gemini de novo
+        embed = CachedEmbeddings(GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL_NAME, google_api_key=api_key),
+                                 EMBEDDING_MODEL_NAME)
+        print_success("✅ [IA] Embeddings carregados (com cache)")
     except Exception as e:
         print_error(f"❌ [IA] Erro ao carregar Embeddings: {e}")
         return llm, None, None, None
@@ -254,7 +438,7 @@ def load_models(client):
     retriever = None
     try:
         print_info("🔍 [IA] Configurando Retriever...")
-        db = Chroma(client=client, collection_name="evolution", embedding_function=embed)
+        db = Chroma(client=client, collection_name=COLLECTION_NAME, embedding_function=embed)
         try:
             # Verifica se tem dados
             count = db._collection.count()
@@ -283,6 +467,33 @@ def load_models(client):
     return llm, retriever, embed, {}
 
 
+def knowledge_base_version(client) -> Optional[str]:
+    """
+    Versão da base de conhecimento: hash dos modelos + ids da collection (o create_db gera ids
+    novos a cada recriação). Entra nas entradas do cache de sugestões para invalidá-las.
+    """
+    if not client:
+        return None
+    try:
+        ids = client.get_collection(COLLECTION_NAME).get(include=[])["ids"]
+    except Exception as e:
+        print_warning(f"⚠️ [IA] Não consegui calcular a versão da base de conhecimento: {e}")
+        return None
+    digest = hashlib.sha1(f"{GEMINI_MODEL_NAME}|{EMBEDDING_MODEL_NAME}".encode())
+    for doc_id in sorted(ids):
+        digest.update(doc_id.encode())
+    return f"{len(ids)}-{digest.hexdigest()[:12]}"
+
+
+_COPILOT_CACHE: Dict[str, Any] = {}
+
+
 def get_sales_copilot():
     if not IA_MODELS.get("llm"): return None
-    return SalesCopilot(IA_MODELS["llm"], IA_MODELS["retriever"], IA_MODELS["playbook"], IA_MODELS["embeddings"])
\ No newline at end of file
+    # Reaproveita prompts/chains enquanto os modelos carregados forem os mesmos
+    key = (id(IA_MODELS["llm"]), id(IA_MODELS["retriever"]))
+    if _COPILOT_CACHE.get("key") != key:
+        _COPILOT_CACHE["key"] = key
+        _COPILOT_CACHE["copilot"] = SalesCopilot(IA_MODELS["llm"], IA_MODELS["retriever"], IA_MODELS["playbook"],
+                                                 IA_MODELS["embeddings"])
+    return _COPILOT_CACHE["copilot"]
\ No newline at end of file
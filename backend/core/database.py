@@ -97,4 +97,12 @@ def create_tenant_and_user(tenant_data: dict, user_data: dict):
         print(f"❌ Erro ao criar tenant/user: {e}")
         return False
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_tenant_by_instance(instance_name: str):
+    """Busca a empresa dona de uma instância da Evolution"""
+    db = SessionLocal()
+    try:
+        return db.query(TenantDB).filter(TenantDB.instance_name == instance_name).first()
+    finally:
+        db.close()
@@ -4,3 +4,13 @@ from typing import Dict, Any
 # --- Estado Global ---
 STATE_LOCK = asyncio.Lock()
 CONVERSATION_STATE_STORE: Dict[str, Any] = {}
+
+# Locks por conversa: seções críticas curtas (merge de uma conversa) sem travar o store inteiro
+CONVERSATION_LOCKS: Dict[str, asyncio.Lock] = {}
+
+
+def conversation_lock(jid: str) -> asyncio.Lock:
+    lock = CONVERSATION_LOCKS.get(jid)
+    if lock is None:
+        lock = CONVERSATION_LOCKS[jid] = asyncio.Lock()
+    return lock
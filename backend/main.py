@@ -1,4 +1,4 @@
-import os, time, httpx, uuid, json, uvicorn, asyncio, copy, redis, traceback
+import os, time, httpx, uuid, json, uvicorn, asyncio, copy, redis, traceback, base64
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -8,6 +8,7 @@ load_dotenv(dotenv_path=env_path)
 
 from fastapi import FastAPI, Request, BackgroundTasks, HTTPException, WebSocket, WebSocketDisconnect, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, Field
 from typing import Dict, Any, List, Optional
@@ -97,6 +98,18 @@ def save_to_redis(jid: str):
     except Exception as e:
         print_error(f"Erro ao salvar no Redis: {e}")
 
+def save_many_to_redis(jids: List[str]):
+    """Salva várias conversas num único round-trip (pipeline)"""
+    if not redis_client or not jids: return
+    try:
+        pipe = redis_client.pipeline()
+        for jid in jids:
+            if jid in CONVERSATION_STATE_STORE:
+                pipe.setex(f"chat:{jid}", timedelta(days=7), json.dumps(CONVERSATION_STATE_STORE[jid]))
+        pipe.execute()
+    except Exception as e:
+        print_error(f"Erro ao salvar lote no Redis: {e}")
+
 def load_redis_cache():
     """Carrega tudo do Redis para a memória ao iniciar"""
     if not redis_client: return
@@ -301,14 +314,13 @@ async def send_whatsapp_message(recipient_jid: str, message_text: str, user: Use
     print_info(f"📤 Enviando mensagem para {number_only} via instância {instance_name}")
     
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, headers=headers, json=payload, timeout=20.0)
-            if resp.status_code in [200, 201]:
-                print_success(f"✅ Mensagem enviada com sucesso para {number_only}")
-                return True
-            else:
-                print_error(f"❌ Evolution API retornou status {resp.status_code}: {resp.text}")
-                return False
+        resp = await evolution_client.post(url, headers=headers, json=payload, timeout=20.0)
+        if resp.status_code in [200, 201]:
+            print_success(f"✅ Mensagem enviada com sucesso para {number_only}")
+            return True
+        else:
+            print_error(f"❌ Evolution API retornou status {resp.status_code}: {resp.text}")
+            return False
     except Exception as e:
         print_error(f"❌ Falha ao enviar mensagem: {e}")
         traceback.print_exc()
@@ -316,25 +328,68 @@ async def send_whatsapp_message(recipient_jid: str, message_text: str, user: Use
 
 
 # --- Gerenciador de Conexões WebSocket ---
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+# Eventos carimbados com seq por empresa + buffer de replay (ver services/websocket_manager.py)
+from services.websocket_manager import manager
+
+# Pool HTTP compartilhado com a Evolution API (ver services/evolution_client.py)
+from services.evolution_client import evolution_client
+from services.evolution_resilience import EvolutionUnavailable, policy as evolution_policy
+from services.instance_state import instance_states
+from services.contact_directory import CONTACT_EVENTS, contact_directories
+from services.profile_resolver import profile_resolver
+from services.media_cache import MediaDownloadError, media_cache, media_fingerprint
+from services.webhook_media import WEBHOOK_BASE64, read_webhook
+from services.import_service import ChatImporter
+from services.sync_service import ActiveConversationSync, TenantHistorySync
+from services.initial_load import InitialLoader
+from services.jobs import jobs
+from services.suggestion_cache import SuggestionLookup, suggestion_cache
+from services.embedding_cache import embedding_store
+manager.attach_redis(redis_client)
+
+# instância -> (empresa ou None, expira_em); positivo vale até a próxima edição de empresa
+_INSTANCE_TENANT_CACHE: Dict[str, tuple] = {}
+INSTANCE_TENANT_NEGATIVE_TTL = float(os.getenv("INSTANCE_TENANT_NEGATIVE_TTL", "60"))
+
+
+def conversation_summary(jid: str) -> Optional[Dict[str, Any]]:
+    """Resumo compacto de uma conversa para o canal 'list' do WebSocket."""
+    data = CONVERSATION_STATE_STORE.get(jid)
+    if not data:
+        return None
+    messages = data.get("messages", [])
+    return {
+        "conversation_id": jid,
+        "name": data.get("name"),
+        "avatar_url": data.get("avatar_url", ""),
+        "preview": messages[-1].get("content", "") if messages else "",
+        "unread": data.get("unread", False),
+        "unreadCount": data.get("unreadCount", 0),
+        "lastUpdated": data.get("lastUpdated", 0)
+    }
 
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print_error(f"Erro no broadcast WS: {e}")
 
-manager = ConnectionManager()
+async def tenant_id_for_instance(instance_name: Optional[str]) -> Optional[str]:
+    """
+    Resolve a empresa dona de uma instância (webhooks só trazem o nome da instância).
+    A consulta ao banco roda fora do event loop; instância desconhecida fica em cache negativo
+    por INSTANCE_TENANT_NEGATIVE_TTL segundos para um webhook órfão não bater no banco a cada evento.
+    """
+    if not instance_name:
+        return None
+    cached = _INSTANCE_TENANT_CACHE.get(instance_name)
+    if cached and (cached[1] is None or cached[1] > time.monotonic()):
+        return cached[0]
+    try:
+        tenant = await asyncio.to_thread(database.get_tenant_by_instance, instance_name)
+    except Exception as e:
+        print_error(f"Erro ao buscar empresa da instância {instance_name}: {e}")
+        return None
+    if not tenant:
+        _INSTANCE_TENANT_CACHE[instance_name] = (None, time.monotonic() + INSTANCE_TENANT_NEGATIVE_TTL)
+        return None
+    _INSTANCE_TENANT_CACHE[instance_name] = (tenant.id, None)
+    return tenant.id
 
 
 async def create_evolution_instance(instance_name: str):
@@ -349,59 +404,65 @@ async def create_evolution_instance(instance_name: str):
     }
 
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, headers=headers, json=payload, timeout=30.0)
+        resp = await evolution_client.post(url, headers=headers, json=payload, timeout=30.0)
 
-            # Debug: Mostra o que a Evolution respondeu
-            print_info(f"Evolution Create Resp: {resp.status_code} - {resp.text}")
+        # Debug: Mostra o que a Evolution respondeu
+        print_info(f"Evolution Create Resp: {resp.status_code} - {resp.text}")
 
-            if resp.status_code == 201:
-                instance_data = resp.json()
+        if resp.status_code == 201:
+            instance_data = resp.json()
                 
-                # 🔥 CONFIGURAR WEBHOOK AUTOMATICAMENTE
-                print_info(f"🔗 Configurando webhook para {instance_name}...")
-                webhook_url = "https://cosmos-backend-129644477821.us-central1.run.app/webhook/evolution"
-                webhook_payload = {
-                    "webhook": {
-                        "enabled": True,
-                        "url": webhook_url,
-                        "webhookByEvents": False,
-                        "webhookBase64": False,
-                        "events": [
-                            "QRCODE_UPDATED",
-                            "MESSAGES_UPSERT",
-                            "MESSAGES_UPDATE",
-                            "SEND_MESSAGE",
-                            "CONNECTION_UPDATE"
-                        ]
-                    }
+            # 🔥 CONFIGURAR WEBHOOK AUTOMATICAMENTE
+            print_info(f"🔗 Configurando webhook para {instance_name}...")
+            webhook_url = "https://cosmos-backend-129644477821.us-central1.run.app/webhook/evolution"
+            webhook_payload = {
+                "webhook": {
+                    "enabled": True,
+                    "url": webhook_url,
+                    "webhookByEvents": False,
+                    "webhookBase64": WEBHOOK_BASE64,
+                    "events": [
+                        "QRCODE_UPDATED",
+                        "MESSAGES_UPSERT",
+                        "MESSAGES_UPDATE",
+                        "SEND_MESSAGE",
+                        "CONNECTION_UPDATE",
+                        "CONTACTS_UPSERT",
+                        "CONTACTS_UPDATE",
+                        "CONTACTS_SET",
+                        "CHATS_UPSERT",
+                        "CHATS_UPDATE",
+                        "CHATS_DELETE",
+                        "CHATS_SET"
+                    ]
                 }
+            }
                 
-                webhook_resp = await client.post(
-                    f"{EVO_URL}/webhook/set/{instance_name}",
-                    headers=headers,
-                    json=webhook_payload,
-                    timeout=10.0
-                )
+            webhook_resp = await evolution_client.post(
+                f"{EVO_URL}/webhook/set/{instance_name}",
+                headers=headers,
+                json=webhook_payload,
+                timeout=10.0
+            )
                 
-                if webhook_resp.status_code in [200, 201]:
-                    print_success(f"✅ Webhook configurado: {webhook_url}")
-                else:
-                    print_warning(f"⚠️ Webhook não configurado: {webhook_resp.status_code} - {webhook_resp.text}")
+            if webhook_resp.status_code in [200, 201]:
+                print_success(f"✅ Webhook configurado: {webhook_url}")
+            else:
+                print_warning(f"⚠️ Webhook não configurado: {webhook_resp.status_code} - {webhook_resp.text}")
                 
-                return instance_data  # Sucesso: Retorna Dict
+            return instance_data  # Sucesso: Retorna Dict
                 
-            elif resp.status_code == 403 and "already exists" in resp.text:
-                # Se já existe, tentamos buscar os dados dela para não travar
-                print_warning("Instância já existe, tentando recuperar dados...")
-                fetch_resp = await client.get(f"{EVO_URL}/instance/fetchInstances", headers=headers)
-                if fetch_resp.status_code == 200:
-                    instances = fetch_resp.json()
-                    # Procura a instância na lista
-                    found = next((i for i in instances if i['instance']['instanceName'] == instance_name), None)
-                    return found  # Retorna Dict ou None
-
-            return None  # Falha
+        elif resp.status_code == 403 and "already exists" in resp.text:
+            # Se já existe, tentamos buscar os dados dela para não travar
+            print_warning("Instância já existe, tentando recuperar dados...")
+            fetch_resp = await evolution_client.get(f"{EVO_URL}/instance/fetchInstances", headers=headers, timeout=10.0)
+            if fetch_resp.status_code == 200:
+                instances = fetch_resp.json()
+                # Procura a instância na lista
+                found = next((i for i in instances if i['instance']['instanceName'] == instance_name), None)
+                return found  # Retorna Dict ou None
+
+        return None  # Falha
 
     except Exception as e:
         print_error(f"Falha crítica ao criar instância: {e}")
@@ -418,16 +479,10 @@ async def get_dashboard_data(current_user: User = Depends(get_current_active_use
     # 1. Buscar status na Evolution API
     if current_user.tenant.instance_name:
         try:
-            # Usa o nome da instância da empresa
-            url = f"{EVO_URL}/instance/connectionState/{current_user.tenant.instance_name}"
-            headers = {"apikey": EVO_TOKEN}
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                resp = await client.get(url, headers=headers)
-                if resp.status_code == 200:
-                    state_data = resp.json()
-                    # Tenta pegar de vários lugares dependendo da versão da API
-                    state = state_data.get("instance", {}).get("state") or state_data.get("state")
-                    instance_status = state or "DESCONECTADO"
+            # Usa o nome da instância da empresa (cache curto, ver services/instance_state.py)
+            instance = await instance_states.get(current_user.tenant.instance_name)
+            if instance.status_code == 200:
+                instance_status = instance.state or "DESCONECTADO"
         except Exception as e:
             print(f"Erro ao buscar status evolution: {e}")
             instance_status = "ERRO_API"
@@ -547,120 +602,25 @@ async def list_available_chats(
 
     instance_name = current_user.tenant.instance_name
     api_token = current_user.tenant.instance_token or EVO_TOKEN
-    headers = {"apikey": api_token}
-
-    all_items = []
-
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        # TENTATIVA 1: CHATS (Mantemos caso o banco da Evo volte a funcionar um dia)
-        try:
-            url_chats = f"{EVO_URL}/chat/findChats/{instance_name}"
-            resp = await client.post(url_chats, headers=headers, json={})
-
-            if resp.status_code == 200:
-                raw_chats = resp.json()
-                if isinstance(raw_chats, dict): raw_chats = raw_chats.get('records') or []
-
-                for chat in raw_chats:
-                    jid = chat.get("id") or chat.get("remoteJid")
-
-                    # --- FILTRO ANTI-GRUPO E ANTI-LIXO ---
-                    if not jid or not str(jid).endswith("@s.whatsapp.net"):
-                        continue  # Pula se for grupo ou lixo
-
-                    # Filtro de Arquivadas (se disponível no endpoint de chats)
-                    if chat.get("archive") or chat.get("isArchived"):
-                        continue
-
-                    all_items.append({
-                        "id": jid,
-                        "name": chat.get("name") or chat.get("pushName") or jid.split('@')[0],
-                        "picture": chat.get("profilePictureUrl") or "",
-                        "unread": chat.get("unreadCount", 0),
-                        "subtitle": jid.split('@')[0]
-                    })
-            else:
-                raise Exception("Force Fallback")
 
-        except Exception:
-            # TENTATIVA 2: CONTATOS (Onde estamos operando agora)
-            print_info("🔄 Fallback: Buscando e FILTRANDO contatos...")
-            try:
-                url_contacts = f"{EVO_URL}/chat/findContacts/{instance_name}"
-                resp_c = await client.post(url_contacts, headers=headers, json={})
-
-                if resp_c.status_code == 200:
-                    payload = resp_c.json()
-                    contacts_list = []
-
-                    if isinstance(payload, list):
-                        contacts_list = payload
-                    elif isinstance(payload, dict):
-                        contacts_list = payload.get('contacts') or payload.get('records') or []
-
-                    for contact in contacts_list:
-                        # Pega o ID
-                        raw_id = contact.get("id")
-                        remote_jid = contact.get("remoteJid")
-                        final_jid = remote_jid or raw_id
-
-                        # --- FILTRO RIGOROSO ---
-                        # 1. Deve existir
-                        # 2. Deve ser string
-                        # 3. DEVE terminar com @s.whatsapp.net (Pessoas apenas)
-                        if not final_jid or not isinstance(final_jid, str):
-                            continue
-
-                        if not final_jid.endswith("@s.whatsapp.net"):
-                            continue  # Tchau grupos, tchau cmia..., tchau broadcast!
-
-                        # Nome Bonito
-                        name = (
-                                contact.get("pushName") or
-                                contact.get("name") or
-                                contact.get("verifiedName") or
-                                contact.get("notify")
-                        )
-                        if not name: name = final_jid.split('@')[0]
-
-                        all_items.append({
-                            "id": final_jid,
-                            "name": name,
-                            "picture": contact.get("profilePictureUrl") or "",
-                            "unread": 0,
-                            "subtitle": final_jid.split('@')[0]
-                        })
-
-                    # Ordena alfabeticamente para facilitar
-                    all_items.sort(key=lambda x: x['name'].lower() if x['name'] else "")
-
-                    print_success(f"✅ Filtrados e Recuperados: {len(all_items)} contatos reais.")
-                else:
-                    print_error(f"❌ Erro Contatos: {resp_c.status_code}")
-            except Exception as e_cont:
-                print_error(f"Erro crítico no fallback: {e_cont}")
+    # Lista cacheada/indexada por instância (services/contact_directory.py)
+    try:
+        directory = await contact_directories.get(instance_name, api_token)
+    except EvolutionUnavailable:
+        raise
+    except Exception as e:
+        print_error(f"Erro crítico ao listar contatos: {e}")
+        return {"data": [], "total": 0, "page": page, "has_more": False}
 
-    # Filtro de busca (se fornecido)
     if search and search.strip():
-        search_lower = search.strip().lower()
         print_info(f"🔍 Filtrando por: '{search}'")
-        all_items = [
-            item for item in all_items
-            if search_lower in item["name"].lower() or search_lower in item["id"].lower()
-        ]
-        print_info(f"📊 {len(all_items)} resultados encontrados")
-
-    # Paginação
-    total = len(all_items)
-    start = (page - 1) * limit
-    end = start + limit
-    paged_items = all_items[start:end]
+    paged_items, total = directory.page(page, limit, search)
 
     return {
         "data": paged_items,
         "total": total,
         "page": page,
-        "has_more": end < total
+        "has_more": page * limit < total
     }
 
 
@@ -673,141 +633,16 @@ async def import_selected_chats(
     if not current_user.tenant or not current_user.tenant.instance_name:
         raise HTTPException(status_code=400, detail="Erro de Tenant")
 
-    print_info(f"📥 Iniciando importação OTIMIZADA de {len(req.jids)} conversas...")
-
-    async def run_import_task(jids_to_import):
-        instance_name = current_user.tenant.instance_name
-        api_token = current_user.tenant.instance_token or EVO_TOKEN
-        headers = {"apikey": api_token}
-
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            for jid in jids_to_import:
-                # Verifica se é JID válido de pessoa
-                if "@g.us" in jid or "@broadcast" in jid: continue
-
-                processed_msgs = []
-                chat_name = jid.split('@')[0]
-                avatar = ""
-
-                try:
-                    # 1. Tenta buscar mensagens (Aumentado para 100 para garantir histórico recente completo)
-                    payload = {
-                        "where": {"key": {"remoteJid": jid}},
-                        "limit": 100,
-                        "page": 1
-                    }
-                    resp = await client.post(
-                        f"{EVO_URL}/chat/findMessages/{instance_name}",
-                        headers=headers, json=payload
-                    )
-
-                    if resp.status_code == 200:
-                        data = resp.json()
-                        messages_data = data.get("messages", {}).get("records", [])
-
-                        if not messages_data:
-                            print_warning(f"   ⚠️ {jid}: Sem mensagens. Ignorando salvamento.")
-                            continue  # <--- PULA SE NÃO TIVER MENSAGENS (ECONOMIA REDIS)
-
-                        for m in messages_data:
-                            if m.get("pushName"): chat_name = m.get("pushName")
-
-                            msg_content = m.get("message", {})
-                            content = (
-                                    msg_content.get("conversation") or
-                                    msg_content.get("extendedTextMessage", {}).get("text") or
-                                    msg_content.get("imageMessage", {}).get("caption")
-                            )
-
-                            if not content:
-                                if "imageMessage" in msg_content:
-                                    content = "📷 [Imagem]"
-                                elif "audioMessage" in msg_content:
-                                    content = "🎤 [Áudio]"
-                                else:
-                                    content = "📝 [Mensagem]"
-
-                            if content:
-                                # Log para debug de mensagens perdidas
-                                if "opa ja vejo" in content.lower():
-                                    print_success(f"   🎯 ENCONTRADA: {content} (ID: {m.get('key', {}).get('id')})")
-                                
-                                processed_msgs.append({
-                                    "content": content,
-                                    "sender": "vendedor" if m.get("key", {}).get("fromMe") else "cliente",
-                                    "timestamp": m.get("messageTimestamp") or int(time.time()),
-                                    "message_id": m.get("key", {}).get("id")
-                                })
-
-                        processed_msgs.sort(key=lambda x: x["timestamp"])
-
-                    else:
-                        # Se a API falhar (Erro 500), NÃO IMPORTAMOS NADA.
-                        # Melhor não ter a conversa do que ter lixo vazio consumindo banco.
-                        print_error(f"   ❌ Erro API Evolution ({resp.status_code}) para {jid}. Pulando.")
-                        continue
-
-                    # 2. Tenta buscar Foto (Opcional, falha silenciosa)
-                    try:
-                        pic_resp = await client.post(
-                            f"{EVO_URL}/chat/fetchProfilePictureUrl/{instance_name}",
-                            headers=headers, json={"number": jid}
-                        )
-                        if pic_resp.status_code == 200:
-                            avatar = pic_resp.json().get("profilePictureUrl", "")
-                    except:
-                        pass
-
-                    # 3. SÓ SALVA SE TIVER CONTEÚDO REAL
-                    if processed_msgs:
-                        async with STATE_LOCK:
-                            # --- LÓGICA DELTA (OTIMIZAÇÃO) ---
-                            existing_data = CONVERSATION_STATE_STORE.get(jid)
-                            
-                            if existing_data:
-                                # 1. Recupera mensagens antigas
-                                old_msgs = existing_data.get("messages", [])
-                                old_ids = {m["message_id"] for m in old_msgs}
-                                
-                                # 2. Filtra apenas as novas (que não temos)
-                                new_msgs = [m for m in processed_msgs if m["message_id"] not in old_ids]
-                                
-                                if not new_msgs:
-                                    print_info(f"   ⏩ {chat_name}: Nenhuma mensagem nova. Pulando update.")
-                                    continue # Pula para o próximo JID
-                                    
-                                # 3. Mescla e Ordena
-                                final_msgs = old_msgs + new_msgs
-                                final_msgs.sort(key=lambda x: x["timestamp"])
-                                
-                                # 4. Atualiza Estado
-                                CONVERSATION_STATE_STORE[jid]["messages"] = final_msgs
-                                CONVERSATION_STATE_STORE[jid]["lastUpdated"] = final_msgs[-1]["timestamp"] * 1000
-                                # Atualiza metadados se mudaram
-                                if chat_name: CONVERSATION_STATE_STORE[jid]["name"] = chat_name
-                                if avatar: CONVERSATION_STATE_STORE[jid]["avatar_url"] = avatar
-                                
-                                print_success(f"   ➕ {chat_name}: Adicionadas {len(new_msgs)} novas msgs (Total: {len(final_msgs)}).")
-                                
-                            else:
-                                # Se não existe, cria do zero
-                                CONVERSATION_STATE_STORE[jid] = {
-                                    "name": chat_name,
-                                    "avatar_url": avatar,
-                                    "messages": processed_msgs,
-                                    "unread": False,
-                                    "lastUpdated": processed_msgs[-1]["timestamp"] * 1000
-                                }
-                                print_success(f"   💾 {chat_name}: Criado com {len(processed_msgs)} msgs.")
-
-                        # Salva no Redis (ÚNICO PONTO DE ESCRITA)
-                        save_to_redis(jid)
-
-                except Exception as exc:
-                    print_error(f"   ❌ Erro processando {jid}: {exc}")
+    print_info(f"📥 Iniciando importação paralela de {len(req.jids)} conversas...")
 
-    background_tasks.add_task(run_import_task, req.jids)
-    return {"status": "import_started"}
+    importer = ChatImporter(
+        instance_name=current_user.tenant.instance_name,
+        api_token=current_user.tenant.instance_token or EVO_TOKEN,
+        username=current_user.username,
+        persist=save_many_to_redis
+    )
+    background_tasks.add_task(importer.run, req.jids)
+    return {"status": "import_started", "job_id": importer.job_id, "total": len(req.jids)}
 
 # ===================================================================
 # ROTAS DE ADMINISTRAÇÃO AVANÇADA (CRUD TOTAL)
@@ -856,6 +691,7 @@ async def update_tenant(tenant_id: str, req: UpdateTenantSchema, admin: User = D
             tenant.instance_token = req.instance_token
 
         db.commit()
+        _INSTANCE_TENANT_CACHE.clear()
         return {"status": "success", "message": "Empresa atualizada"}
     except Exception as e:
         db.rollback()
@@ -887,8 +723,7 @@ async def delete_tenant(tenant_id: str, admin: User = Depends(verify_super_admin
                 # Tenta deletar na Evolution para liberar recurso (Fire & Forget)
                 url = f"{EVO_URL}/instance/delete/{tenant.instance_name}"
                 headers = {"apikey": EVO_TOKEN}
-                async with httpx.AsyncClient() as client:
-                    await client.delete(url, headers=headers)
+                await evolution_client.delete(url, headers=headers, timeout=10.0)
             except Exception as e:
                 print_error(f"Erro ao deletar instância Evolution: {e}")
 
@@ -899,6 +734,7 @@ async def delete_tenant(tenant_id: str, admin: User = Depends(verify_super_admin
         db.delete(tenant)
 
         db.commit()
+        _INSTANCE_TENANT_CACHE.clear()
         return {"status": "success", "message": f"Empresa {tenant_id} e seus usuários foram removidos."}
     except Exception as e:
         db.rollback()
@@ -1077,49 +913,30 @@ async def register_user(req: UserCreateRequest, current_user: User = Depends(get
     else:
         raise HTTPException(status_code=500, detail="Erro ao salvar no banco")
 
-async def fetch_profile_picture_background(jid: str, instance_name: str):
+async def apply_profile_picture(instance_name: str, jid: str, picture_url: Optional[str]):
     """
-    Busca a foto do perfil em background e atualiza o estado.
+    Callback do atualizador de perfis (services/profile_resolver.py): grava a foto no estado
+    e avisa o front só se ela mudou.
     """
-    if not instance_name or not EVO_URL:
-        return
-
-    # Evita busca repetida se já tiver URL (double check)
-    if jid in CONVERSATION_STATE_STORE and CONVERSATION_STATE_STORE[jid].get("avatar_url"):
-        return
+    async with STATE_LOCK:
+        conversation = CONVERSATION_STATE_STORE.get(jid)
+        if conversation is None:
+            return
+        conversation["last_profile_check"] = int(time.time())
+        changed = bool(picture_url) and conversation.get("avatar_url") != picture_url
+        if changed:
+            conversation["avatar_url"] = picture_url
+        save_to_redis(jid)
 
-    print_info(f"📸 Buscando foto para {jid} em background...")
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {"apikey": EVO_TOKEN} # Usa token global por enquanto
-            
-            # Busca foto
-            number = jid.split('@')[0]
-            resp = await client.get(
-                f"{EVO_URL}/chat/findPicture/{instance_name}/{number}",
-                headers=headers
-            )
-            
-            if resp.status_code == 200:
-                data = resp.json()
-                picture_url = data.get("picture")
-                
-                if picture_url:
-                    async with STATE_LOCK:
-                        if jid in CONVERSATION_STATE_STORE:
-                            CONVERSATION_STATE_STORE[jid]["avatar_url"] = picture_url
-                            save_to_redis(jid)
-                            
-                            # Broadcast update de perfil
-                            await manager.broadcast({
-                                "type": "profile_update",
-                                "conversation_id": jid,
-                                "avatar_url": picture_url,
-                                "name": CONVERSATION_STATE_STORE[jid].get("name")
-                            })
-                    print_success(f"📸 Foto atualizada para {jid}")
-    except Exception as e:
-        print_error(f"Erro ao buscar foto em background: {e}")
+    if changed:
+        # Broadcast update de perfil
+        await manager.broadcast({
+            "type": "profile_update",
+            "conversation_id": jid,
+            "avatar_url": picture_url,
+            "name": CONVERSATION_STATE_STORE[jid].get("name")
+        }, tenant_id=await tenant_id_for_instance(instance_name), summary=conversation_summary(jid))
+        print_success(f"📸 Foto atualizada para {jid}")
 
 
 async def process_and_broadcast_message(conversation_id: str, message_obj: Dict[str, Any], instance_name: str = None):
@@ -1162,171 +979,28 @@ async def process_and_broadcast_message(conversation_id: str, message_obj: Dict[
             "name": CONVERSATION_STATE_STORE[conversation_id].get("name"),
             "avatar_url": CONVERSATION_STATE_STORE[conversation_id].get("avatar_url"),
             "unreadCount": CONVERSATION_STATE_STORE[conversation_id].get("unreadCount", 0)
-        })
+        }, tenant_id=await tenant_id_for_instance(instance_name), summary=conversation_summary(conversation_id))
 
-        # 📸 Se não tem avatar e temos instance_name, agenda busca em background
-        if not CONVERSATION_STATE_STORE[conversation_id].get("avatar_url") and instance_name:
-            asyncio.create_task(fetch_profile_picture_background(conversation_id, instance_name))
+        # 📸 Sem avatar (ou avatar velho): entra na fila de baixa prioridade (dedup + rate limit)
+        if instance_name and profile_resolver.needs_refresh(CONVERSATION_STATE_STORE[conversation_id]):
+            profile_resolver.enqueue(instance_name, conversation_id)
 
     except Exception as e:
         print_error(f"Erro processando mensagem: {e}")
 
 
 async def sync_tenant_history(instance_name: str, api_token: str, tenant_id: str):
-    """Sincroniza histórico de uma empresa específica sob demanda"""
+    """
+    Sincroniza histórico de uma empresa específica sob demanda.
+    Pipeline paginado (ver services/sync_service.TenantHistorySync): não segura o STATE_LOCK
+    durante a rede; cada conversa é mesclada com o lock dela.
+    """
     print_info(f"🔄 Sincronizando histórico para empresa: {tenant_id} (Instância: {instance_name})")
-
-    url = f"{EVO_URL}/chat/findMessages/{instance_name}"  # Usa o nome da instância do cliente
-    headers = {"apikey": api_token}
-
-    async with STATE_LOCK:
-        try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                headers = {"apikey": EVO_TOKEN}
-
-                # 1. Busca Mensagens (Aumentei o limite para pegar mais contexto)
-                # Vamos usar as mensagens para descobrir nomes que não estão na lista de contatos
-                msgs_resp = await client.post(f"{EVO_URL}/chat/findMessages/{instance_name}", headers=headers,
-                                              json={"limit": 500, "page": 1})
-                messages_data = msgs_resp.json().get("messages", {}).get("records",
-                                                                         []) if msgs_resp.status_code == 200 else []
-
-                print_info(f"📥 Carregadas {len(messages_data)} mensagens da Evolution API")
-
-                # Mapa auxiliar: JID -> Nome Descoberto nas Mensagens (PushName)
-                discovered_names = {}
-
-                # Processa mensagens primeiro para extrair nomes
-                messages_by_jid = {}
-
-                for m in messages_data:
-                    key = m.get("key", {})
-                    # 🔧 FIX: Usa remoteJidAlt se disponível (WhatsApp Business)
-                    remote_jid_original = key.get("remoteJid")
-                    remote_jid_alt = key.get("remoteJidAlt")
-                    remote_jid = remote_jid_alt or remote_jid_original
-
-                    # Debug: mostra quando há diferença
-                    if remote_jid_original and remote_jid_alt and remote_jid_original != remote_jid_alt:
-                        print_info(f"🔄 Convertendo {remote_jid_original} → {remote_jid_alt}")
-
-                    if not remote_jid: continue
-
-                    # Tenta capturar o nome do perfil (pushName)
-                    if m.get("pushName"):
-                        discovered_names[remote_jid] = m.get("pushName")
-
-                    if remote_jid not in messages_by_jid:
-                        messages_by_jid[remote_jid] = []
-
-                    # Extração Robusta de Conteúdo
-                    msg_content = m.get("message", {})
-                    content = (
-                            msg_content.get("conversation") or
-                            msg_content.get("extendedTextMessage", {}).get("text") or
-                            msg_content.get("imageMessage", {}).get("caption")
-                    )
-
-                    # Fallbacks para mídia sem legenda
-                    if not content:
-                        if "imageMessage" in msg_content:
-                            content = "📷 [Imagem]"
-                        elif "audioMessage" in msg_content:
-                            content = "🎤 [Áudio]"
-                        elif "videoMessage" in msg_content:
-                            content = "🎥 [Vídeo]"
-                        elif "documentMessage" in msg_content:
-                            content = "📄 [Documento]"
-                        elif "stickerMessage" in msg_content:
-                            content = "👾 [Figurinha]"
-
-                    if content:
-                        messages_by_jid[remote_jid].append({
-                            "content": content,
-                            "sender": "vendedor" if key.get("fromMe") else "cliente",
-                            "timestamp": m.get("messageTimestamp"),
-                            "message_id": key.get("id")
-                        })
-
-                # 2. Busca Contatos
-                contacts_resp = await client.post(f"{EVO_URL}/chat/findContacts/{instance_name}", headers=headers,
-                                                  json={})
-                contacts = contacts_resp.json() if contacts_resp.status_code == 200 else []
-
-                # 3. Monta o Estado Final
-                # Adiciona contatos da lista oficial
-                for contact in contacts:
-                    jid = contact.get("remoteJid")
-                    if not jid or "@g.us" in jid: continue  # Ignora grupos
-
-                    # Decide o nome: Nome salvo > PushName descoberto > Número
-                    official_name = contact.get("name") or contact.get("pushName")
-                    final_name = official_name or discovered_names.get(jid) or jid.split('@')[0]
-
-                    # Formata se for número puro (Ex: 5541...)
-                    if final_name.isdigit() and len(final_name) > 10:
-                        final_name = f"+{final_name}"
-
-                    processed_msgs = messages_by_jid.get(jid, [])
-                    
-                    # --- LÓGICA DELTA (OTIMIZAÇÃO) ---
-                    if jid in CONVERSATION_STATE_STORE:
-                        old_msgs = CONVERSATION_STATE_STORE[jid].get("messages", [])
-                        old_ids = {m["message_id"] for m in old_msgs}
-                        
-                        # Filtra novas
-                        new_msgs = [m for m in processed_msgs if m["message_id"] not in old_ids]
-                        
-                        if new_msgs:
-                            final_msgs = old_msgs + new_msgs
-                            final_msgs.sort(key=lambda x: x["timestamp"])
-                            CONVERSATION_STATE_STORE[jid]["messages"] = final_msgs
-                            CONVERSATION_STATE_STORE[jid]["lastUpdated"] = final_msgs[-1]["timestamp"] * 1000
-                        
-                        # Atualiza metadados sempre (pode ter mudado foto/nome)
-                        CONVERSATION_STATE_STORE[jid]["name"] = final_name
-                        CONVERSATION_STATE_STORE[jid]["avatar_url"] = contact.get("profilePicUrl") or ""
-                        
-                    else:
-                        processed_msgs.sort(key=lambda x: x["timestamp"])
-                        CONVERSATION_STATE_STORE[jid] = {
-                            "name": final_name,
-                            "avatar_url": contact.get("profilePicUrl") or "",
-                            "messages": processed_msgs,
-                            "unread": False,
-                            "unreadCount": 0,
-                            "lastUpdated": int(time.time()) * 1000
-                        }
-
-                # Adiciona conversas que existem nas mensagens mas não na lista de contatos
-                for jid, msgs in messages_by_jid.items():
-                    if jid not in CONVERSATION_STATE_STORE and "@g.us" not in jid:
-                        final_name = discovered_names.get(jid) or jid.split('@')[0]
-                        msgs.sort(key=lambda x: x["timestamp"])
-                        CONVERSATION_STATE_STORE[jid] = {
-                            "name": final_name,
-                            "avatar_url": "",  # Não temos foto aqui fácil
-                            "messages": msgs,
-                            "unread": False,
-                            "unreadCount": 0,
-                            "lastUpdated": msgs[-1]["timestamp"] * 1000 if msgs else 0
-                        }
-
-
-                print_success(f"✅ Sincronização Concluída! {len(CONVERSATION_STATE_STORE)} conversas carregadas.")
-
-                if redis_client:
-                    print_info("💾 Salvando sincronização no Redis...")
-                    for jid in CONVERSATION_STATE_STORE:
-                        save_to_redis(jid)
-
-                # Log detalhado de cada conversa
-                for jid, data in CONVERSATION_STATE_STORE.items():
-                    msg_count = len(data.get("messages", []))
-                    name = data.get("name", "Sem nome")
-                    print_info(f"   📱 {name} ({jid}): {msg_count} mensagens")
-        except Exception as e:
-            print_error(f"Erro na sincronização: {e}")
+    try:
+        history = TenantHistorySync(instance_name, api_token or EVO_TOKEN, persist=save_many_to_redis)
+        return await history.run()
+    except Exception as e:
+        print_error(f"Erro na sincronização: {e}")
 
 
 # ===================================================================
@@ -1336,6 +1010,17 @@ async def sync_tenant_history(instance_name: str, api_token: str, tenant_id: str
 @app.on_event("startup")
 async def startup_event():
 
+    # --- POOL HTTP EVOLUTION (conexões reaproveitadas entre requisições) ---
+    await evolution_client.start()
+    await media_cache.load()
+    profile_resolver.start(on_picture=apply_profile_picture)
+    media_scheduler.start(on_result=apply_media_transcription)
+    if whisper_configured() and whisper_transcriber.available():
+        whisper_transcriber.warmup()
+
+    # --- HEARTBEAT WEBSOCKET (ping + remoção de conexões mortas) ---
+    manager.start_heartbeat()
+
     # --- INICIALIZAÇÃO IA ---
     print_info("🧠 Inicializando Cérebro IA...")
     try:
@@ -1345,7 +1030,9 @@ async def startup_event():
         IA_MODELS["llm"] = llm
         IA_MODELS["retriever"] = retriever
         IA_MODELS["embeddings"] = embed
-        print_success("🧠 Cérebro IA Carregado!")
+        IA_MODELS["chroma_client"] = client
+        IA_MODELS["kb_version"] = cerebro_ia.knowledge_base_version(client)
+        print_success(f"🧠 Cérebro IA Carregado! (base de conhecimento {IA_MODELS['kb_version']})")
     except Exception as e:
         print_error(f"Falha ao carregar IA: {e}")
 
@@ -1369,49 +1056,64 @@ async def startup_event():
                 "webhook": {
                     "enabled": True,
                     "url": webhook_url,
-                    "webhook_by_events": False,
-                    "webhook_base64": False,
+                    "webhookByEvents": False,
+                    "webhookBase64": WEBHOOK_BASE64,
                     "events": [
                         "QRCODE_UPDATED",
                         "MESSAGES_UPSERT",
                         "MESSAGES_UPDATE",
                         "MESSAGES_DELETE",
                         "SEND_MESSAGE",
-                        "CONNECTION_UPDATE"
+                        "CONNECTION_UPDATE",
+                        "CONTACTS_UPSERT",
+                        "CONTACTS_UPDATE",
+                        "CONTACTS_SET",
+                        "CHATS_UPSERT",
+                        "CHATS_UPDATE",
+                        "CHATS_DELETE",
+                        "CHATS_SET"
                     ]
                 }
             }
             
             # Usa httpx para fazer a requisição async
-            async with httpx.AsyncClient() as client:
-                # Primeiro busca instâncias se EVO_INSTANCE não estiver definido
-                target_instance = EVO_INSTANCE
-                if not target_instance:
-                    resp = await client.get(f"{EVO_URL}/instance/fetchInstances", headers=headers)
-                    if resp.status_code == 200:
-                        instances = resp.json()
-                        if instances:
-                            target_instance = instances[0].get("instance", {}).get("instanceName") or instances[0].get("name")
+            # Primeiro busca instâncias se EVO_INSTANCE não estiver definido
+            target_instance = EVO_INSTANCE
+            if not target_instance:
+                resp = await evolution_client.get(f"{EVO_URL}/instance/fetchInstances", headers=headers, timeout=10.0)
+                if resp.status_code == 200:
+                    instances = resp.json()
+                    if instances:
+                        target_instance = instances[0].get("instance", {}).get("instanceName") or instances[0].get("name")
                 
-                if target_instance:
-                    resp = await client.post(
-                        f"{EVO_URL}/webhook/set/{target_instance}",
-                        headers=headers,
-                        json=webhook_config,
-                        timeout=10.0
-                    )
+            if target_instance:
+                resp = await evolution_client.post(
+                    f"{EVO_URL}/webhook/set/{target_instance}",
+                    headers=headers,
+                    json=webhook_config,
+                    timeout=10.0
+                )
                     
-                    if resp.status_code in [200, 201]:
-                        print_success(f"✅ Webhook configurado para: {webhook_url}")
-                    else:
-                        print_error(f"❌ Falha ao configurar webhook: {resp.text}")
+                if resp.status_code in [200, 201]:
+                    print_success(f"✅ Webhook configurado para: {webhook_url}")
                 else:
-                    print_warning("⚠️ Nenhuma instância encontrada para configurar webhook.")
+                    print_error(f"❌ Falha ao configurar webhook: {resp.text}")
+            else:
+                print_warning("⚠️ Nenhuma instância encontrada para configurar webhook.")
                     
         except Exception as e:
             print_error(f"❌ Erro na auto-configuração do webhook: {e}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await manager.stop_heartbeat()
+    await profile_resolver.stop()
+    await media_scheduler.stop()
+    whisper_transcriber.shutdown()
+    await evolution_client.close()
+
+
 # --- Auth ---
 @app.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
@@ -1426,34 +1128,90 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
 
 
 # --- WebSocket ---
+def resolve_ws_user(token: str):
+    """Valida o token JWT do WebSocket e retorna (username, tenant_id) ou None."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username = payload.get("sub")
+    except JWTError:
+        return None
+    user_db = database.get_user_with_tenant(username) if username else None
+    if not user_db or not user_db.tenant_id:
+        return None
+    return user_db.username, user_db.tenant_id
+
+
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, token: Optional[str] = None,
+                             last_seq: Optional[int] = None, stream_id: Optional[str] = None,
+                             subscriptions: Optional[str] = None):
+    """
+    Conexão em tempo real.
+    - token (opcional): associa a conexão ao stream da empresa. Sem token = cliente legado (recebe tudo).
+    - last_seq + stream_id: reconexão; o servidor reenvia só os eventos perdidos
+      ou manda 'resync_required' se a lacuna já saiu do buffer.
+    - subscriptions (opcional): "list,<jid>,..." -> resumos da lista + eventos completos só das
+      conversas abertas. Depois o cliente ajusta com {"type": "subscribe"/"unsubscribe", ...}.
+    """
     print(f"🔌 Nova conexão WebSocket recebida: {websocket.client}")
-    await manager.connect(websocket)
-    print(f"✅ WebSocket aceito e conectado!")
+    username, tenant_id = None, None
+    if token:
+        resolved = resolve_ws_user(token)
+        if not resolved:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        username, tenant_id = resolved
+    initial_subscriptions = [t for t in (subscriptions or "").split(",") if t]
+    await manager.connect(websocket, tenant_id=tenant_id, last_seq=last_seq, stream_id=stream_id,
+                          subscriptions=initial_subscriptions, username=username)
+    print(f"✅ WebSocket aceito e conectado! (tenant={tenant_id}, last_seq={last_seq})")
     try:
         while True:
-            await websocket.receive_text()
+            manager.handle_client_message(websocket, await websocket.receive_text())
     except WebSocketDisconnect:
         print(f"🔴 WebSocket desconectado")
+    except Exception as e:
+        # Conexão half-open / reaped pelo heartbeat: qualquer erro de leitura encerra o loop
+        print_warning(f"🔴 WebSocket encerrado: {type(e).__name__} {e}")
+    finally:
         manager.disconnect(websocket)
 
 
+@app.get("/ws/metrics")
+async def websocket_metrics(admin: User = Depends(verify_super_admin)):
+    """Gauges do WebSocket (todas as empresas, só super admin): conexões vivas, latência de envio (p50/p99), frames descartados."""
+    return manager.metrics()
+
+
+@app.exception_handler(EvolutionUnavailable)
+async def evolution_unavailable_handler(request: Request, exc: EvolutionUnavailable):
+    """Circuito aberto: responde na hora em vez de esperar o timeout da Evolution."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "instance": exc.instance},
+        headers={"Retry-After": str(int(exc.retry_after) + 1)}
+    )
+
+
+@app.get("/evolution/resilience")
+async def evolution_resilience_metrics(admin: User = Depends(verify_super_admin)):
+    """Chamadas à Evolution: circuit breakers por instância, retries e hedges + os caches que as evitam."""
+    return {**evolution_policy.metrics(), "instance_state_cache": instance_states.metrics(),
+            "contact_directories": contact_directories.metrics(), "profiles": profile_resolver.metrics()}
+
+
 # --- Instância ---
 @app.get("/evolution/instance/status")
 async def get_instance_status(current_user: User = Depends(get_current_active_user)):
     if not current_user.tenant or not current_user.tenant.instance_name:
         raise HTTPException(status_code=400, detail="Instância não configurada")
     
-    url = f"{EVO_URL}/instance/connectionState/{current_user.tenant.instance_name}"
-    headers = {"apikey": EVO_TOKEN}
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, headers=headers)
-            if resp.status_code == 200:
-                return resp.json()
-            elif resp.status_code == 404:
-                return {"instance": {"state": "close", "notFound": True}}
+        instance = await instance_states.get(current_user.tenant.instance_name)
+        if instance.status_code == 200:
+            return instance.data
+        elif instance.status_code == 404:
+            return {"instance": {"state": "close", "notFound": True}}
     except Exception:
         pass
     return {"instance": {"state": "close"}}
@@ -1476,30 +1234,16 @@ async def download_media(
     api_token = current_user.tenant.instance_token or EVO_TOKEN
     
     try:
-        url = f"{EVO_URL}/chat/getBase64FromMediaMessage/{instance_name}"
-        headers = {"apikey": api_token, "Content-Type": "application/json"}
-        
-        # print_info(f"📥 Baixando mídia da Evolution API para instância {instance_name}...")
-        # print_info(f"📦 Payload (resumo): {str(request)[:200]}...") # Descomente se necessário
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(url, headers=headers, json=request)
-            
-            if resp.status_code in [200, 201]:
-                data = resp.json()
-                if data and "base64" in data:
-                    # print_success(f"✅ Mídia baixada com sucesso")
-                    return data
-                else:
-                    print_warning(f"⚠️ Evolution retornou {resp.status_code} mas sem 'base64': {data}")
-                    return data # Retorna mesmo assim para debug
-            else:
-                print_error(f"❌ Evolution retornou status {resp.status_code}: {resp.text}")
-                raise HTTPException(
-                    status_code=resp.status_code,
-                    detail=f"Erro ao baixar mídia: {resp.text}"
-                )
-    
+        # Cache em disco (services/media_cache.py): só a primeira visualização vai à Evolution
+        entry = await media_cache.fetch(instance_name, request.get("message") or request, api_token)
+
+        def encode() -> str:
+            return base64.b64encode(media_cache.read(entry)).decode()
+
+        return {"base64": await asyncio.to_thread(encode), "mimetype": entry.mimetype, "sha256": entry.sha256}
+
+    except MediaDownloadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except httpx.TimeoutException:
         print_error("❌ Timeout ao baixar mídia")
         raise HTTPException(status_code=504, detail="Timeout ao baixar mídia")
@@ -1509,6 +1253,65 @@ async def download_media(
         raise HTTPException(status_code=500, detail=f"Erro ao baixar mídia: {str(e)}")
 
 
+@app.get("/evolution/media/{message_id}")
+async def get_media_file(
+    message_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Mídia em binário (sem base64), servida direto do arquivo em cache.
+    ETag = sha256 do conteúdo; If-None-Match igual devolve 304 sem corpo.
+    """
+    if not current_user.tenant or not current_user.tenant.instance_name:
+        raise HTTPException(status_code=400, detail="Instância não configurada")
+
+    instance_name = current_user.tenant.instance_name
+    api_token = current_user.tenant.instance_token or EVO_TOKEN
+    try:
+        entry = await media_cache.fetch(instance_name, {"key": {"id": message_id}}, api_token)
+    except MediaDownloadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="Timeout ao baixar mídia")
+
+    return media_cache.serve(entry, request)
+
+
+@app.get("/evolution/media/{message_id}/link")
+async def get_media_link(
+    message_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    URL assinada e temporária para usar direto em <audio>/<video> src: o player pede só os
+    bytes que precisa (Range) e o elemento não consegue mandar o header Authorization.
+    """
+    if not current_user.tenant or not current_user.tenant.instance_name:
+        raise HTTPException(status_code=400, detail="Instância não configurada")
+    return {"url": media_cache.link(current_user.tenant.instance_name, message_id)}
+
+
+@app.get("/media/{instance_name}/{message_id}")
+async def get_signed_media(instance_name: str, message_id: str, exp: int, sig: str, request: Request):
+    """ Mídia por link assinado (ver /evolution/media/{id}/link). Sem JWT: vale a assinatura. """
+    if not media_cache.verify(instance_name, message_id, exp, sig):
+        raise HTTPException(status_code=403, detail="Link de mídia inválido ou expirado")
+
+    key = f"{instance_name}:{message_id}"
+    entry = await media_cache.alookup(key)
+    if entry is None:
+        tenant = await asyncio.to_thread(database.get_tenant_by_instance, instance_name)
+        api_token = (tenant.instance_token if tenant else None) or EVO_TOKEN
+        try:
+            entry = await media_cache.fetch(instance_name, {"key": {"id": message_id}}, api_token)
+        except MediaDownloadError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        except httpx.TimeoutException:
+            raise HTTPException(status_code=504, detail="Timeout ao baixar mídia")
+    return media_cache.serve(entry, request)
+
+
 @app.post("/evolution/instance/create_and_get_qr")
 async def create_and_get_qr(request: InstanceCreateRequest = None,
                             current_user: User = Depends(get_current_active_user)):
@@ -1523,49 +1326,48 @@ async def create_and_get_qr(request: InstanceCreateRequest = None,
 
     headers = {"apikey": api_key}
 
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        try:
-            # 1. Tenta PEGAR o QR Code direto (Rota /instance/connect)
-            # Essa rota retorna o QR se a instância existe e está desconectada
-            connect_url = f"{EVO_URL}/instance/connect/{instance_name}"
-            resp = await client.get(connect_url, headers=headers)
-
-            if resp.status_code == 200:
-                return resp.json()  # Sucesso! Retorna o QR
-
-            # 2. Se der 404 (Não encontrada), tenta CRIAR
-            if resp.status_code == 404:
-                print_warning(f"Instância {instance_name} não encontrada. Tentando recriar...")
-                create_url = f"{EVO_URL}/instance/create"
-                payload = {
-                    "instanceName": instance_name,
-                    "token": "",
-                    "qrcode": True,  # Já pede o QR na criação
-                    "integration": "WHATSAPP-BAILEYS"
-                }
-                create_resp = await client.post(create_url, headers=headers, json=payload)
+    try:
+        # 1. Tenta PEGAR o QR Code direto (Rota /instance/connect)
+        # Essa rota retorna o QR se a instância existe e está desconectada
+        connect_url = f"{EVO_URL}/instance/connect/{instance_name}"
+        resp = await evolution_client.get(connect_url, headers=headers, timeout=20.0)
+
+        if resp.status_code == 200:
+            return resp.json()  # Sucesso! Retorna o QR
+
+        # 2. Se der 404 (Não encontrada), tenta CRIAR
+        if resp.status_code == 404:
+            print_warning(f"Instância {instance_name} não encontrada. Tentando recriar...")
+            create_url = f"{EVO_URL}/instance/create"
+            payload = {
+                "instanceName": instance_name,
+                "token": "",
+                "qrcode": True,  # Já pede o QR na criação
+                "integration": "WHATSAPP-BAILEYS"
+            }
+            create_resp = await evolution_client.post(create_url, headers=headers, json=payload, timeout=20.0)
 
-                if create_resp.status_code == 201:
-                    # Se criou, já devolve o QR que vem na resposta de criação
-                    return create_resp.json()
-                else:
-                    # Se falhar a criação
-                    print_error(f"Falha ao recriar: {create_resp.text}")
-                    raise HTTPException(status_code=502, detail="Erro ao criar instância na Evolution.")
+            if create_resp.status_code == 201:
+                # Se criou, já devolve o QR que vem na resposta de criação
+                return create_resp.json()
+            else:
+                # Se falhar a criação
+                print_error(f"Falha ao recriar: {create_resp.text}")
+                raise HTTPException(status_code=502, detail="Erro ao criar instância na Evolution.")
 
-            # Se der outro erro (Ex: 400 se já estiver conectada)
-            error_detail = resp.json() if resp.content else {"error": resp.text}
+        # Se der outro erro (Ex: 400 se já estiver conectada)
+        error_detail = resp.json() if resp.content else {"error": resp.text}
 
-            # Se já estiver conectada, retorna um status fake para o frontend entender
-            if "already connected" in str(error_detail).lower():
-                return {"instance": {"state": "open"}}
+        # Se já estiver conectada, retorna um status fake para o frontend entender
+        if "already connected" in str(error_detail).lower():
+            return {"instance": {"state": "open"}}
 
-            print_error(f"Erro Evolution: {resp.status_code} - {resp.text}")
-            raise HTTPException(status_code=resp.status_code, detail=f"Erro Evolution: {resp.text}")
+        print_error(f"Erro Evolution: {resp.status_code} - {resp.text}")
+        raise HTTPException(status_code=resp.status_code, detail=f"Erro Evolution: {resp.text}")
 
-        except httpx.ConnectError as e:
-            print_error(f"Erro Conexão: {e}")
-            raise HTTPException(status_code=504, detail="Timeout na Evolution API")
+    except httpx.ConnectError as e:
+        print_error(f"Erro Conexão: {e}")
+        raise HTTPException(status_code=504, detail="Timeout na Evolution API")
 
 
 @app.delete("/evolution/instance/logout")
@@ -1573,8 +1375,8 @@ async def logout_instance(current_user: User = Depends(get_current_active_user))
     if not current_user.tenant or not current_user.tenant.instance_name:
         raise HTTPException(status_code=400, detail="Instância não configurada")
     
-    async with httpx.AsyncClient() as client:
-        await client.delete(f"{EVO_URL}/instance/logout/{current_user.tenant.instance_name}", headers={"apikey": EVO_TOKEN})
+    await evolution_client.delete(f"{EVO_URL}/instance/logout/{current_user.tenant.instance_name}", headers={"apikey": EVO_TOKEN}, timeout=10.0)
+    instance_states.invalidate(current_user.tenant.instance_name)
     return {"status": "logged_out"}
 
 
@@ -1588,6 +1390,8 @@ async def initial_load(current_user: User = Depends(get_current_active_user)):
     """
     Carga inicial LGPD-compliant com verificação de instância.
     ⚠️ ATENÇÃO: Só carrega se NÃO houver conversas antigas!
+    Roda como job de fundo: responde na hora com job_id; as conversas chegam pelo WebSocket
+    (conversation_summary, mais recentes primeiro) e o status fica em GET /sync/jobs/{job_id}.
     """
     if not current_user.tenant or not current_user.tenant.instance_name:
         raise HTTPException(status_code=400, detail="Instância não configurada")
@@ -1609,207 +1413,86 @@ async def initial_load(current_user: User = Depends(get_current_active_user)):
     
     # Verifica se a instância está conectada
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            status_resp = await client.get(
-                f"{EVO_URL}/instance/connectionState/{instance_name}",
-                headers={"apikey": api_token}
-            )
+        instance = await instance_states.get(instance_name, api_key=api_token)
             
-            print_info(f"Status code: {status_resp.status_code}")
+        print_info(f"Status code: {instance.status_code} ({instance.source})")
             
-            if status_resp.status_code == 404:
-                print_error(f"Instância {instance_name} não encontrada na Evolution API")
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Instância '{instance_name}' não existe. Verifique o nome da instância ou crie uma nova."
-                )
+        if instance.status_code == 404:
+            print_error(f"Instância {instance_name} não encontrada na Evolution API")
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Instância '{instance_name}' não existe. Verifique o nome da instância ou crie uma nova."
+            )
             
-            if status_resp.status_code != 200:
-                error_text = status_resp.text
-                print_error(f"Erro ao verificar instância: {status_resp.status_code} - {error_text}")
-                raise HTTPException(
-                    status_code=500, 
-                    detail=f"Evolution API retornou erro {status_resp.status_code}: {error_text}"
-                )
+        if instance.status_code != 200:
+            error_text = instance.data.get("error") or json.dumps(instance.data)
+            print_error(f"Erro ao verificar instância: {instance.status_code} - {error_text}")
+            raise HTTPException(
+                status_code=500, 
+                detail=f"Evolution API retornou erro {instance.status_code}: {error_text}"
+            )
             
-            status_data = status_resp.json()
-            state = status_data.get("state", status_data.get("instance", {}).get("state"))
+        state = instance.state
             
-            print_info(f"Estado da instância: {state}")
+        print_info(f"Estado da instância: {state}")
             
-            if state != "open":
-                print_warning(f"WhatsApp não conectado. Estado atual: {state}")
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"WhatsApp não conectado! Estado: {state}. Conecte o QR code primeiro."
-                )
+        if state != "open":
+            print_warning(f"WhatsApp não conectado. Estado atual: {state}")
+            raise HTTPException(
+                status_code=400,
+                detail=f"WhatsApp não conectado! Estado: {state}. Conecte o QR code primeiro."
+            )
             
-            print_success(f"✅ Instância {instance_name} conectada e verificada")
+        print_success(f"✅ Instância {instance_name} conectada e verificada")
     
     except httpx.HTTPError as e:
         print_error(f"Erro de rede ao verificar instância: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro de conexão com Evolution API: {str(e)}")
     
+    # Uma carga por empresa de cada vez
+    running = jobs.find_active("initial_load", current_user.tenant_id)
+    if running:
+        return {"status": "running", **running.to_dict()}
+
     print_info(f"🚀 Carga inicial LGPD para {instance_name}...")
-    
-    try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            headers = {"apikey": api_token}
-            
-            # 🔥 APENAS mensagens recentes (últimas 48h)
-            import time
-            two_days_ago = int(time.time()) - (48 * 3600)
-            
-            print_info(f"📥 Buscando mensagens das últimas 48h (desde {two_days_ago})...")
-            msgs_resp = await client.post(
-                f"{EVO_URL}/chat/findMessages/{instance_name}",
-                headers=headers,
-                json={
-                    "where": {
-                        "messageTimestamp": {"$gte": two_days_ago}
-                    },
-                    "limit": 200  # Mais mensagens para pegar mais conversas
-                }
-            )
-            
-            if msgs_resp.status_code != 200:
-                raise HTTPException(status_code=500, detail="Erro ao buscar mensagens")
-            
-            messages_data = msgs_resp.json().get("messages", {}).get("records", [])
-            print_info(f"📊 {len(messages_data)} mensagens recentes encontradas")
-            
-            # Agrupa por JID
-            conversations_map = {}
-            for m in messages_data:
-                key = m.get("key", {})
-                
-                # Extrai JID
-                possible_jids = []
-                if key.get("remoteJid"): possible_jids.append(key.get("remoteJid"))
-                if key.get("remoteJidAlt"): possible_jids.append(key.get("remoteJidAlt"))
-                
-                # Filtra JIDs válidos
-                valid_jids = [j for j in possible_jids if "@s.whatsapp.net" in j and "232" not in j[:3]]
-                
-                if not valid_jids:
-                    continue
-                
-                jid = min(valid_jids, key=len)  # Menor JID (phone number)
-                
-                # Filtros
-                if "@g.us" in jid or "status@broadcast" in jid:
-                    continue
-                
-                number = jid.split('@')[0]
-                if not number.isdigit() or len(number) < 10 or len(number) > 15:
-                    continue
-                
-                # REMOVIDO FILTRO DE APENAS BRASILEIROS (554)
-                # if not number.startswith('554'):
-                #     continue
-                
-                # Adiciona à conversa
-                if jid not in conversations_map:
-                    conversations_map[jid] = []
-                
-                # Extrai conteúdo
-                msg_content = m.get("message", {})
-                content = (
-                    msg_content.get("conversation") or
-                    msg_content.get("extendedTextMessage", {}).get("text") or
-                    msg_content.get("imageMessage", {}).get("caption")
-                )
-                
-                if not content:
-                    if "imageMessage" in msg_content:
-                        content = "📷 [Imagem]"
-                    elif "audioMessage" in msg_content:
-                        content = "🎤 [Áudio]"
-                    elif "videoMessage" in msg_content:
-                        content = "🎥 [Vídeo]"
-                    elif "documentMessage" in msg_content:
-                        content = "📄 [Documento]"
-                    elif "stickerMessage" in msg_content:
-                        content = "👾 [Figurinha]"
-                
-                if content:
-                    conversations_map[jid].append({
-                        "content": content,
-                        "sender": "vendedor" if key.get("fromMe") else "cliente",
-                        "timestamp": m.get("messageTimestamp"),
-                        "message_id": key.get("id"),
-                        "pushName": m.get("pushName", "")
-                    })
-            
-            # Limita a 20 conversas mais ativas
-            sorted_jids = sorted(
-                conversations_map.keys(),
-                key=lambda j: len(conversations_map[j]),
-                reverse=True
-            )[:20]
-            
-            print_info(f"📊 Carregando {len(sorted_jids)} conversas com mensagens recentes...")
-            
-            loaded_count = 0
-            async with STATE_LOCK:
-                for jid in sorted_jids:
-                    try:
-                        msgs = conversations_map[jid]
-                        number = jid.split('@')[0]
-                        
-                        # Ordena e limita a 40
-                        msgs.sort(key=lambda x: x["timestamp"])
-                        msgs = msgs[-40:]  # Últimas 40
-                        
-                        # Nome (pega do pushName da última mensagem)
-                        name = None
-                        for msg in reversed(msgs):
-                            if msg.get("pushName"):
-                                name = msg["pushName"]
-                                break
-                        
-                        if not name:
-                            name = f"+{number}"
-                        
-                        # Remove pushName das mensagens
-                        for msg in msgs:
-                            msg.pop("pushName", None)
-                        
-                        # Salva no store
-                        CONVERSATION_STATE_STORE[jid] = {
-                            "name": name,
-                            "avatar_url": "",  # Não buscar foto para ser mais rápido
-                            "messages": msgs,
-                            "unread": False,
-                            "unreadCount": 0,
-                            "lastUpdated": msgs[-1]["timestamp"] * 1000 if msgs else int(time.time() * 1000)
-                        }
-                        
-                        save_to_redis(jid)
-                        loaded_count += 1
-                        print_success(f"✅ {name} ({number}): {len(msgs)} mensagens")
-                    
-                    except Exception as e:
-                        print_error(f"❌ Erro ao processar {jid}: {e}")
-                        continue
-            
-            print_success(f"🎉 {loaded_count} conversas recentes carregadas!")
-            return {
-                "status": "success",
-                "loaded": loaded_count,
-                "period": "últimas 48 horas"
-            }
-    
-    except Exception as e:
-        print_error(f"❌ Erro na carga inicial: {e}")
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+
+    username = current_user.username
+    loader = InitialLoader(instance_name, api_token, username,
+                           persist=save_many_to_redis, summarize=conversation_summary)
+
+    async def notify_finished(job):
+        await manager.send_to_user(username, {"type": "initial_load_finished", **job.to_dict()})
+
+    job = jobs.start("initial_load", loader.run, username=username,
+                     tenant_id=current_user.tenant_id, on_finish=notify_finished)
+    return {"status": "started", **job.to_dict()}
+
+
+@app.get("/sync/jobs/{job_id}")
+async def get_sync_job(job_id: str, current_user: User = Depends(get_current_active_user)):
+    """Status/progresso de um job de fundo (polling)."""
+    job = jobs.get(job_id)
+    if not job or job.tenant_id != current_user.tenant_id:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job.to_dict()
+
+
+@app.delete("/sync/jobs/{job_id}")
+async def cancel_sync_job(job_id: str, current_user: User = Depends(get_current_active_user)):
+    """Cancela um job em andamento (o que já foi carregado permanece)."""
+    job = jobs.get(job_id)
+    if not job or job.tenant_id != current_user.tenant_id:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    if not jobs.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job já finalizado ({job.status})")
+    return {"status": "cancelling", "job_id": job_id}
 
 @app.post("/sync/active_conversations")
 async def sync_active_conversations(current_user: User = Depends(get_current_active_user)):
     """
     Sincroniza APENAS conversas que já existem no Redis/memória.
     Evita pegar TODOS os contatos da Evolution API.
+    Incremental: só chats com atividade depois do cursor salvo, e só as mensagens novas.
     """
     if not current_user.tenant or not current_user.tenant.instance_name:
         raise HTTPException(status_code=400, detail="Instância não configurada")
@@ -1828,56 +1511,9 @@ async def sync_active_conversations(current_user: User = Depends(get_current_act
     print_info(f"🔄 Sincronizando {len(existing_jids)} conversas ativas...")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            headers = {"apikey": api_token}
-            
-            for jid in existing_jids:
-                try:
-                    # Busca mensagens desse JID específico
-                    number = jid.split('@')[0]
-                    resp = await client.post(
-                        f"{EVO_URL}/chat/findMessages/{instance_name}",
-                        headers=headers,
-                        json={"where": {"key": {"remoteJid": jid}}, "limit": 50}
-                    )
-                    
-                    if resp.status_code == 200:
-                        messages_data = resp.json().get("messages", {}).get("records", [])
-                        
-                        if messages_data:
-                            async with STATE_LOCK:
-                                old_msgs = CONVERSATION_STATE_STORE[jid].get("messages", [])
-                                old_ids = {m["message_id"] for m in old_msgs}
-                                
-                                # Processa novas mensagens
-                                new_msgs = []
-                                for m in messages_data:
-                                    msg_id = m.get("key", {}).get("id")
-                                    if msg_id not in old_ids:
-                                        content = (
-                                            m.get("message", {}).get("conversation") or
-                                            m.get("message", {}).get("extendedTextMessage", {}).get("text") or
-                                            "📷 [Mídia]"
-                                        )
-                                        new_msgs.append({
-                                            "content": content,
-                                            "sender": "vendedor" if m.get("key", {}).get("fromMe") else "cliente",
-                                            "timestamp": m.get("messageTimestamp"),
-                                            "message_id": msg_id
-                                        })
-                                
-                                if new_msgs:
-                                    final_msgs = old_msgs + new_msgs
-                                    final_msgs.sort(key=lambda x: x["timestamp"])
-                                    CONVERSATION_STATE_STORE[jid]["messages"] = final_msgs
-                                    save_to_redis(jid)
-                                    print_success(f"✅ {number}: +{len(new_msgs)} mensagens")
-                
-                except Exception as e:
-                    print_error(f"Erro ao sincronizar {jid}: {e}")
-                    continue
-        
-        return {"status": "success", "message": f"{len(existing_jids)} conversas sincronizadas"}
+        sync = ActiveConversationSync(instance_name, api_token, persist=save_many_to_redis)
+        stats = await sync.run(existing_jids)
+        return {"status": "success", "message": f"{stats['updated']} de {len(existing_jids)} conversas atualizadas", **stats}
     
     except Exception as e:
         print_error(f"Erro geral na sincronização: {e}")
@@ -2038,100 +1674,99 @@ async def get_conversation_messages(jid: str, current_user: User = Depends(get_c
             "page": 1
         }
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, headers=headers, json=payload, timeout=30.0)
+        resp = await evolution_client.post(url, headers=headers, json=payload, timeout=30.0)
 
-            messages_data = []
-            if resp.status_code == 200:
-                data = resp.json()
-                messages_data = data.get("messages", {}).get("records", [])
-                print_info(f"📥 [API] Evolution retornou {len(messages_data)} mensagens")
-            else:
-                print_error(f"❌ [API] Evolution retornou status {resp.status_code}")
-
-            # Se ainda vier vazio, é possível que o histórico não tenha baixado na VM.
-            # Nesse caso, não há muito o que fazer via API além de esperar a sincronização nativa.
-
-            processed_msgs = []
-            for m in messages_data:
-                msg_content = m.get("message", {})
-                content = (
-                        msg_content.get("conversation") or
-                        msg_content.get("extendedTextMessage", {}).get("text") or
-                        msg_content.get("imageMessage", {}).get("caption")
-                )
+        messages_data = []
+        if resp.status_code == 200:
+            data = resp.json()
+            messages_data = data.get("messages", {}).get("records", [])
+            print_info(f"📥 [API] Evolution retornou {len(messages_data)} mensagens")
+        else:
+            print_error(f"❌ [API] Evolution retornou status {resp.status_code}")
+
+        # Se ainda vier vazio, é possível que o histórico não tenha baixado na VM.
+        # Nesse caso, não há muito o que fazer via API além de esperar a sincronização nativa.
+
+        processed_msgs = []
+        for m in messages_data:
+            msg_content = m.get("message", {})
+            content = (
+                    msg_content.get("conversation") or
+                    msg_content.get("extendedTextMessage", {}).get("text") or
+                    msg_content.get("imageMessage", {}).get("caption")
+            )
                 
-                # Extrai URLs de mídia
-                media_url = None
-                media_type = None
+            # Extrai URLs de mídia
+            media_url = None
+            media_type = None
                 
-                if not content:
-                    if "imageMessage" in msg_content:
-                        content = "📷 [Imagem]"
-                        media_type = "image"
-                        media_url = msg_content.get("imageMessage", {}).get("url")
-                    elif "audioMessage" in msg_content:
-                        content = "🎤 [Áudio]"
-                        media_type = "audio"
-                        media_url = msg_content.get("audioMessage", {}).get("url")
-                    elif "videoMessage" in msg_content:
-                        content = "🎥 [Vídeo]"
-                        media_type = "video"
-                        media_url = msg_content.get("videoMessage", {}).get("url")
-                    elif "documentMessage" in msg_content:
-                        content = "📄 [Documento]"
-                        media_type = "document"
-                        media_url = msg_content.get("documentMessage", {}).get("url")
-                    elif "stickerMessage" in msg_content:
-                        content = "👾 [Figurinha]"
-                        media_type = "sticker"
-                        media_url = msg_content.get("stickerMessage", {}).get("url")
-                else:
-                    # Verifica se tem imagem mesmo com caption
-                    if "imageMessage" in msg_content:
-                        media_type = "image"
-                        media_url = msg_content.get("imageMessage", {}).get("url")
-
-                if content:
-                    msg_obj = {
-                        "content": content,
-                        "sender": "vendedor" if m.get("key", {}).get("fromMe") else "cliente",
-                        "timestamp": m.get("messageTimestamp"),
-                        "message_id": m.get("key", {}).get("id"),
-                        "raw_message": m  # <--- Necessário para baixar mídia
-                    }
+            if not content:
+                if "imageMessage" in msg_content:
+                    content = "📷 [Imagem]"
+                    media_type = "image"
+                    media_url = msg_content.get("imageMessage", {}).get("url")
+                elif "audioMessage" in msg_content:
+                    content = "🎤 [Áudio]"
+                    media_type = "audio"
+                    media_url = msg_content.get("audioMessage", {}).get("url")
+                elif "videoMessage" in msg_content:
+                    content = "🎥 [Vídeo]"
+                    media_type = "video"
+                    media_url = msg_content.get("videoMessage", {}).get("url")
+                elif "documentMessage" in msg_content:
+                    content = "📄 [Documento]"
+                    media_type = "document"
+                    media_url = msg_content.get("documentMessage", {}).get("url")
+                elif "stickerMessage" in msg_content:
+                    content = "👾 [Figurinha]"
+                    media_type = "sticker"
+                    media_url = msg_content.get("stickerMessage", {}).get("url")
+            else:
+                # Verifica se tem imagem mesmo com caption
+                if "imageMessage" in msg_content:
+                    media_type = "image"
+                    media_url = msg_content.get("imageMessage", {}).get("url")
+
+            if content:
+                msg_obj = {
+                    "content": content,
+                    "sender": "vendedor" if m.get("key", {}).get("fromMe") else "cliente",
+                    "timestamp": m.get("messageTimestamp"),
+                    "message_id": m.get("key", {}).get("id"),
+                    "raw_message": m  # <--- Necessário para baixar mídia
+                }
                     
-                    # Adiciona mídia se existir (mesmo sem URL, para tentar baixar via raw_message)
-                    if media_type:
-                        msg_obj["media"] = {
-                            "type": media_type,
-                            "url": media_url
-                        }
+                # Adiciona mídia se existir (mesmo sem URL, para tentar baixar via raw_message)
+                if media_type:
+                    msg_obj["media"] = {
+                        "type": media_type,
+                        "url": media_url
+                    }
                     
-                    processed_msgs.append(msg_obj)
+                processed_msgs.append(msg_obj)
 
-            # Remove duplicatas (pelo ID) e ordena
-            seen_ids = set()
-            unique_msgs = []
-            # Junta com o que já tinha na memória
-            all_potential_msgs = stored_msgs + processed_msgs
+        # Remove duplicatas (pelo ID) e ordena
+        seen_ids = set()
+        unique_msgs = []
+        # Junta com o que já tinha na memória
+        all_potential_msgs = stored_msgs + processed_msgs
 
-            for msg in all_potential_msgs:
-                if msg['message_id'] not in seen_ids:
-                    unique_msgs.append(msg)
-                    seen_ids.add(msg['message_id'])
+        for msg in all_potential_msgs:
+            if msg['message_id'] not in seen_ids:
+                unique_msgs.append(msg)
+                seen_ids.add(msg['message_id'])
 
-            unique_msgs.sort(key=lambda x: x["timestamp"])
+        unique_msgs.sort(key=lambda x: x["timestamp"])
 
-            # Salva na memória
-            async with STATE_LOCK:
-                if real_jid not in CONVERSATION_STATE_STORE:
-                    CONVERSATION_STATE_STORE[real_jid] = {"messages": [], "name": real_jid.split('@')[0],
-                                                          "unread": False}
-                CONVERSATION_STATE_STORE[real_jid]["messages"] = unique_msgs
+        # Salva na memória
+        async with STATE_LOCK:
+            if real_jid not in CONVERSATION_STATE_STORE:
+                CONVERSATION_STATE_STORE[real_jid] = {"messages": [], "name": real_jid.split('@')[0],
+                                                      "unread": False}
+            CONVERSATION_STATE_STORE[real_jid]["messages"] = unique_msgs
 
-            print_success(f"✅ [API] Retornando {len(unique_msgs)} mensagens (cache + API)")
-            return unique_msgs
+        print_success(f"✅ [API] Retornando {len(unique_msgs)} mensagens (cache + API)")
+        return unique_msgs
 
     except Exception as e:
         print_error(f"Erro ao buscar histórico: {e}")
@@ -2162,7 +1797,8 @@ async def send_message(request: MessageSendRequest, background_tasks: Background
         "content": request.message_text, "sender": "vendedor",
         "timestamp": int(time.time()), "message_id": f"sent_{int(time.time())}"
     }
-    background_tasks.add_task(process_and_broadcast_message, request.conversation_id, msg_obj)
+    background_tasks.add_task(process_and_broadcast_message, request.conversation_id, msg_obj,
+                              current_user.tenant.instance_name)
     return {"status": "success"}
 
 
@@ -2218,7 +1854,7 @@ async def mark_conversation_as_read(jid: str, current_user: User = Depends(get_c
             await manager.broadcast({
                 "type": "conversation_read",
                 "conversation_id": real_jid
-            })
+            }, tenant_id=current_user.tenant_id, summary=conversation_summary(real_jid))
             
             return {"status": "success", "conversation_id": real_jid}
         else:
@@ -2379,47 +2015,46 @@ async def send_reaction(request: ReactionRequest, current_user: User = Depends(g
         
         print_info(f"👍 Enviando reação '{request.emoji}' para mensagem {request.message_id} (fromMe={from_me})")
         
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, headers=headers, json=payload, timeout=20.0)
+        resp = await evolution_client.post(url, headers=headers, json=payload, timeout=20.0)
             
-            if resp.status_code in [200, 201]:
-                print_success(f"✅ Reação enviada com sucesso")
+        if resp.status_code in [200, 201]:
+            print_success(f"✅ Reação enviada com sucesso")
                 
-                # Atualiza localmente a mensagem com a reação
-                async with STATE_LOCK:
-                    if request.conversation_id in CONVERSATION_STATE_STORE:
-                        messages = CONVERSATION_STATE_STORE[request.conversation_id].get("messages", [])
-                        for msg in messages:
-                            if msg.get("message_id") == request.message_id:
-                                if "reactions" not in msg:
-                                    msg["reactions"] = []
+            # Atualiza localmente a mensagem com a reação
+            async with STATE_LOCK:
+                if request.conversation_id in CONVERSATION_STATE_STORE:
+                    messages = CONVERSATION_STATE_STORE[request.conversation_id].get("messages", [])
+                    for msg in messages:
+                        if msg.get("message_id") == request.message_id:
+                            if "reactions" not in msg:
+                                msg["reactions"] = []
                                 
-                                # Remove reação anterior do vendedor
-                                msg["reactions"] = [r for r in msg["reactions"] if r.get("from") != "vendedor"]
+                            # Remove reação anterior do vendedor
+                            msg["reactions"] = [r for r in msg["reactions"] if r.get("from") != "vendedor"]
                                 
-                                # Adiciona nova reação (se não for vazia)
-                                if request.emoji:
-                                    msg["reactions"].append({
-                                        "emoji": request.emoji,
-                                        "from": "vendedor"
-                                    })
+                            # Adiciona nova reação (se não for vazia)
+                            if request.emoji:
+                                msg["reactions"].append({
+                                    "emoji": request.emoji,
+                                    "from": "vendedor"
+                                })
                                 
-                                save_to_redis(request.conversation_id)
-                                break
+                            save_to_redis(request.conversation_id)
+                            break
                 
-                # Broadcasta via WebSocket
-                await manager.broadcast({
-                    "type": "message_reaction",
-                    "conversation_id": request.conversation_id,
-                    "message_id": request.message_id,
-                    "reaction": request.emoji,
-                    "from": "vendedor"
-                })
+            # Broadcasta via WebSocket
+            await manager.broadcast({
+                "type": "message_reaction",
+                "conversation_id": request.conversation_id,
+                "message_id": request.message_id,
+                "reaction": request.emoji,
+                "from": "vendedor"
+            }, tenant_id=current_user.tenant_id)
                 
-                return {"status": "success"}
-            else:
-                print_error(f"❌ Evolution API retornou status {resp.status_code}: {resp.text}")
-                raise HTTPException(status_code=resp.status_code, detail=f"Erro ao enviar reação: {resp.text}")
+            return {"status": "success"}
+        else:
+            print_error(f"❌ Evolution API retornou status {resp.status_code}: {resp.text}")
+            raise HTTPException(status_code=resp.status_code, detail=f"Erro ao enviar reação: {resp.text}")
         
     except Exception as e:
         print_error(f"❌ Falha ao enviar reação: {e}")
@@ -2472,7 +2107,7 @@ async def update_custom_name(jid: str, request: CustomNameRequest, current_user:
         "custom_name": custom_name if custom_name else None,
         "whatsapp_name": CONVERSATION_STATE_STORE[jid].get("whatsapp_name"),
         "avatar_url": CONVERSATION_STATE_STORE[jid].get("avatar_url")
-    })
+    }, tenant_id=current_user.tenant_id, summary=conversation_summary(jid))
     
     return {"status": "success", "custom_name": custom_name if custom_name else None}
 
@@ -2495,35 +2130,15 @@ async def refresh_profile(jid: str, current_user: User = Depends(get_current_act
     print_info(f"🔄 Atualizando perfil do WhatsApp para {number}")
     
     try:
-        # Busca foto de perfil
-        pic_url = f"{EVO_URL}/chat/fetchProfilePictureUrl/{instance_name}"
-        headers = {'apikey': api_token, 'Content-Type': 'application/json'}
-        payload = {"number": number}
-        
-        whatsapp_name = None
-        avatar_url = None
-        
-        async with httpx.AsyncClient() as client:
-            # Foto de perfil
-            try:
-                resp = await client.post(pic_url, headers=headers, json=payload, timeout=10.0)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    avatar_url = data.get("profilePictureUrl") or data.get("picture")
-                    print_success(f"✅ Foto de perfil obtida para {number}")
-            except Exception as e:
-                print_warning(f"⚠️ Erro ao buscar foto: {e}")
-            
-            # Nome do WhatsApp (via fetchProfile)
-            try:
-                profile_url = f"{EVO_URL}/chat/fetchProfile/{instance_name}"
-                resp = await client.post(profile_url, headers=headers, json=payload, timeout=10.0)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    whatsapp_name = data.get("pushName") or data.get("name")
-                    print_success(f"✅ Nome do WhatsApp obtido para {number}: {whatsapp_name}")
-            except Exception as e:
-                print_warning(f"⚠️ Erro ao buscar nome: {e}")
+        # Foto e nome em paralelo pelo resolver (cache de até 1 min + dedup de cliques repetidos)
+        avatar_url, whatsapp_name = await asyncio.gather(
+            profile_resolver.picture(instance_name, jid, api_key=api_token, max_age=60),
+            profile_resolver.name(instance_name, jid, api_key=api_token, max_age=60)
+        )
+        if avatar_url:
+            print_success(f"✅ Foto de perfil obtida para {number}")
+        if whatsapp_name:
+            print_success(f"✅ Nome do WhatsApp obtido para {number}: {whatsapp_name}")
         
         # Atualiza no estado
         async with STATE_LOCK:
@@ -2551,7 +2166,7 @@ async def refresh_profile(jid: str, current_user: User = Depends(get_current_act
             "custom_name": CONVERSATION_STATE_STORE[jid].get("custom_name"),
             "whatsapp_name": whatsapp_name,
             "avatar_url": avatar_url
-        })
+        }, tenant_id=current_user.tenant_id, summary=conversation_summary(jid))
         
         return {
             "status": "success",
@@ -2566,10 +2181,8 @@ async def refresh_profile(jid: str, current_user: User = Depends(get_current_act
         raise HTTPException(status_code=500, detail=f"Erro ao atualizar perfil: {str(e)}")
 
 
-@app.post("/ai/generate_suggestion")
-async def generate_ai_suggestion(request: AIQueryRequest, current_user: User = Depends(get_current_active_user)):
-    print_info(f"🤖 [API] Requisição de sugestão IA recebida - Conversa: {request.conversation_id}, Tipo: {request.type}")
-    
+def prepare_ai_suggestion(request: AIQueryRequest):
+    """ (copilot, histórico, pergunta) para a sugestão; pergunta None = nada para analisar. """
     # Verifica se a IA foi inicializada
     from core.shared import IA_MODELS
     if not IA_MODELS.get("llm"):
@@ -2609,11 +2222,51 @@ async def generate_ai_suggestion(request: AIQueryRequest, current_user: User = D
 
     if not user_query:
         print_warning("⚠️ [API] Nenhuma query fornecida e sem mensagens do cliente")
+    return copilot, history, user_query
+
+
+async def lookup_cached_suggestion(request: AIQueryRequest, current_user: User, history, user_query) -> SuggestionLookup:
+    """ Consulta o cache semântico de sugestões (services/suggestion_cache.py) da empresa do usuário. """
+    from core.shared import IA_MODELS
+    embeddings = IA_MODELS.get("embeddings")
+    # Direto no Gemini, sem o cache persistente: o texto (pergunta + contexto) é quase sempre único
+    # e a repetição exata já é acerto direto no cache de sugestões
+    embeddings = getattr(embeddings, "inner", embeddings)
+    return await suggestion_cache.lookup(current_user.tenant_id, request.type, user_query, history,
+                                         embeddings, IA_MODELS.get("kb_version"))
+
+
+def add_tokens_used(username: str, total_tokens: int):
+    db = database.SessionLocal()
+    try:
+        db.query(database.UserDB).filter(database.UserDB.username == username).update(
+            {"tokens_used": database.UserDB.tokens_used + total_tokens}
+        )
+        db.commit()
+        print_success(f"💰 Tokens contabilizados: {total_tokens} (usuário {username})")
+    except Exception as e:
+        print_error(f"Erro ao salvar tokens: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+@app.post("/ai/generate_suggestion")
+async def generate_ai_suggestion(request: AIQueryRequest, current_user: User = Depends(get_current_active_user)):
+    print_info(f"🤖 [API] Requisição de sugestão IA recebida - Conversa: {request.conversation_id}, Tipo: {request.type}")
+    copilot, history, user_query = prepare_ai_suggestion(request)
+    if not user_query:
         return {"status": "error", "message": "Nenhuma mensagem para analisar"}
 
+    cached = await lookup_cached_suggestion(request, current_user, history, user_query)
+    if cached.result:
+        print_success(f"✅ [API] Sugestão servida do cache (similaridade {cached.similarity:.3f})")
+        return {**cached.result, "cached": True}
+
     try:
         print_info(f"🧠 [API] Gerando sugestão para query: '{user_query[:100]}...'")
-        result = copilot.generate_sales_suggestions(
+        # ainvoke + limitador: uma chamada lenta ao Gemini não trava webhooks nem WebSockets
+        result = await copilot.agenerate_sales_suggestions(
             query=user_query,
             full_conversation_history=history,
             current_stage_id="unknown",
@@ -2621,24 +2274,14 @@ async def generate_ai_suggestion(request: AIQueryRequest, current_user: User = D
             client_data={}
         )
         print_success(f"✅ [API] Sugestão gerada com sucesso")
+        suggestion_cache.store(cached, result)
         # Calcular Tokens (Estimativa: 1 token ~= 4 caracteres)
         input_tokens = len(user_query) // 4
         output_tokens = len(str(result)) // 4
         total_tokens = input_tokens + output_tokens
         
-        # Atualizar Banco de Dados
-        db = database.SessionLocal()
-        try:
-            db.query(database.UserDB).filter(database.UserDB.username == current_user.username).update(
-                {"tokens_used": database.UserDB.tokens_used + total_tokens}
-            )
-            db.commit()
-            print_success(f"💰 Tokens contabilizados: {total_tokens} (Total User: {current_user.tokens_used + total_tokens})")
-        except Exception as e:
-            print_error(f"Erro ao salvar tokens: {e}")
-            db.rollback()
-        finally:
-            db.close()
+        # Atualizar Banco de Dados (fora do event loop)
+        await asyncio.to_thread(add_tokens_used, current_user.username, total_tokens)
 
         return result
     except Exception as e:
@@ -2647,22 +2290,97 @@ async def generate_ai_suggestion(request: AIQueryRequest, current_user: User = D
         raise HTTPException(status_code=500, detail=f"Erro ao processar IA: {str(e)}")
 
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/ai/generate_suggestion/stream")
+async def stream_ai_suggestion(request: AIQueryRequest, current_user: User = Depends(get_current_active_user)):
+    """
+    Mesma sugestão em Server-Sent Events: "token" com cada trecho de sugestao_resposta assim que
+    o Gemini escreve, e "final" com o payload estruturado (immediate_answer, follow_up_options).
+    O vendedor começa a ler no primeiro token em vez de esperar a geração inteira.
+    """
+    print_info(f"🤖 [API] Sugestão IA (streaming) - Conversa: {request.conversation_id}, Tipo: {request.type}")
+    copilot, history, user_query = prepare_ai_suggestion(request)
+
+    async def events():
+        if not user_query:
+            yield _sse("final", {"status": "error", "message": "Nenhuma mensagem para analisar"})
+            return
+        started = time.perf_counter()
+        cached = await lookup_cached_suggestion(request, current_user, history, user_query)
+        if cached.result:
+            # do cache: a resposta inteira num token só, para a tela seguir o mesmo caminho
+            answer = (cached.result.get("suggestions") or {}).get("immediate_answer")
+            if answer:
+                yield _sse("token", {"text": answer})
+            total_ms = round((time.perf_counter() - started) * 1000)
+            yield _sse("final", {**cached.result, "cached": True, "first_token_ms": total_ms, "total_ms": total_ms})
+            print_success(f"✅ [API] Sugestão (streaming) servida do cache em {total_ms}ms")
+            return
+
+        first_token_ms = None
+        result = None
+        try:
+            async for kind, payload in copilot.astream_sales_suggestions(
+                query=user_query,
+                full_conversation_history=history,
+                current_stage_id="unknown",
+                is_private_query=(request.type == "internal"),
+                client_data={}
+            ):
+                if kind == "token":
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - started) * 1000)
+                    yield _sse("token", {"text": payload})
+                else:
+                    result = payload
+        except Exception as e:
+            print_error(f"❌ [API] Erro no streaming da sugestão: {e}")
+            traceback.print_exc()
+            result = {"status": "error", "suggestions": {"immediate_answer": "Erro ao processar IA."}}
+
+        suggestion_cache.store(cached, result)
+        total_ms = round((time.perf_counter() - started) * 1000)
+        yield _sse("final", {**result, "first_token_ms": first_token_ms, "total_ms": total_ms})
+        print_success(f"✅ [API] Sugestão (streaming): 1º token {first_token_ms}ms, total {total_ms}ms")
+
+        total_tokens = len(user_query) // 4 + len(str(result)) // 4
+        await asyncio.to_thread(add_tokens_used, current_user.username, total_tokens)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/admin/ai/metrics")
+async def ai_metrics(admin: User = Depends(verify_super_admin)):
+    """ IA: limitador de chamadas ao Gemini, cache de sugestões e cache de embeddings. """
+    return {"limiter": cerebro_ia.ai_limiter.metrics(), "suggestion_cache": suggestion_cache.metrics(),
+            "embeddings": await asyncio.to_thread(embedding_store.metrics)}
+
+
+@app.post("/admin/ai/suggestion-cache/invalidate")
+async def invalidate_suggestion_cache(tenant_id: Optional[str] = None, admin: User = Depends(verify_super_admin)):
+    """ Depois de recriar a base (create_db): recalcula a versão da base e limpa o cache de sugestões. """
+    from core.shared import IA_MODELS
+    IA_MODELS["kb_version"] = await asyncio.to_thread(cerebro_ia.knowledge_base_version, IA_MODELS.get("chroma_client"))
+    removed = suggestion_cache.invalidate(tenant_id)
+    print_info(f"🧹 Cache de sugestões limpo ({removed} entradas), base de conhecimento {IA_MODELS['kb_version']}")
+    return {"status": "success", "removed": removed, "kb_version": IA_MODELS["kb_version"]}
+
+
+from services.media_jobs import MediaJob, media_scheduler
+from services.media_text_cache import media_text_cache
 from services.media_service import media_service
+from services.transcription import whisper_configured, whisper_transcriber
 
-async def process_media_and_update(jid: str, message_id: str, media_type: str):
+async def apply_media_transcription(job: MediaJob, transcription: str):
     """
-    Processa mídia em background e atualiza a mensagem com a transcrição/descrição.
+    Callback da fila de mídia (services/media_jobs.py): atualiza a mensagem com a transcrição/descrição.
     """
+    jid, message_id, media_type, instance_name = job.jid, job.message_id, job.media_type, job.instance_name
     try:
-        # Usa as globais EVO_INSTANCE, EVO_URL, EVO_TOKEN
-        transcription = await media_service.process_media(
-            message_id, 
-            EVO_INSTANCE, 
-            EVO_URL, 
-            EVO_TOKEN, 
-            media_type
-        )
-        
         if transcription:
             prefix = "🎤 [Áudio]" if "audio" in media_type else "📷 [Imagem]" if "image" in media_type else "🎥 [Vídeo]"
             new_content = f"{prefix} {transcription}"
@@ -2683,7 +2401,7 @@ async def process_media_and_update(jid: str, message_id: str, media_type: str):
                                 "name": CONVERSATION_STATE_STORE[jid].get("name"),
                                 "avatar_url": CONVERSATION_STATE_STORE[jid].get("avatar_url"),
                                 "unreadCount": CONVERSATION_STATE_STORE[jid].get("unreadCount", 0)
-                            })
+                            }, tenant_id=await tenant_id_for_instance(instance_name), summary=conversation_summary(jid))
                             break
             
             save_to_redis(jid)
@@ -2691,13 +2409,42 @@ async def process_media_and_update(jid: str, message_id: str, media_type: str):
     except Exception as e:
         print_error(f"Erro ao atualizar transcrição: {e}")
 
+
+@app.get("/evolution/media-jobs")
+async def list_media_jobs(status: Optional[str] = None, current_user: User = Depends(get_current_active_user)):
+    """ Fila de transcrição/descrição de mídia da instância: métricas + jobs recentes. """
+    if not current_user.tenant or not current_user.tenant.instance_name:
+        raise HTTPException(status_code=400, detail="Instância não configurada")
+    items = media_scheduler.list(current_user.tenant.instance_name, status)
+    items.sort(key=lambda j: j.created_at, reverse=True)
+    return {"metrics": media_scheduler.metrics(), "jobs": [j.to_dict() for j in items[:200]]}
+
+
+@app.get("/evolution/media-jobs/{message_id}")
+async def get_media_job(message_id: str, current_user: User = Depends(get_current_active_user)):
+    if not current_user.tenant or not current_user.tenant.instance_name:
+        raise HTTPException(status_code=400, detail="Instância não configurada")
+    job = media_scheduler.get(current_user.tenant.instance_name, message_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Nenhum processamento para esta mensagem")
+    return job.to_dict()
+
+
+@app.get("/admin/media/metrics")
+async def media_metrics(admin: User = Depends(verify_super_admin)):
+    """ Mídia (todas as instâncias): cache em disco, fila de processamento, transcrições e backends. """
+    return {"cache": await asyncio.to_thread(media_cache.stats), "jobs": media_scheduler.metrics(),
+            "texts": media_text_cache.metrics(), "transcribers": media_service.transcriber_metrics()}
+
 @app.post("/webhook/evolution")
 async def webhook(request: Request, background_tasks: BackgroundTasks):
     try:
-        body = await request.json()
+        # Corpo lido em streaming: com webhookBase64 a mídia vai direto para o cache (services/webhook_media.py)
+        body, inline_media = await read_webhook(request)
         print_info(f"🔍 Webhook Payload Recebido: {json.dumps(body, indent=2)}")
         event = body.get("event")
         data = body.get("data")
+        instance_name = body.get("instance")
         
         print_info(f"⚡ Evento Webhook: {event}")
         
@@ -2741,7 +2488,7 @@ async def webhook(request: Request, background_tasks: BackgroundTasks):
                                         "message_id": target_msg_id,
                                         "reaction": emoji,
                                         "from": who
-                                    })
+                                    }, tenant_id=await tenant_id_for_instance(instance_name))
                                     break
                 return {"status": "ok"}
 
@@ -2813,14 +2560,27 @@ async def webhook(request: Request, background_tasks: BackgroundTasks):
                 print_info(f"📩 Webhook Processando: {sender} -> {jid}: {content[:30]}...")
                 background_tasks.add_task(process_and_broadcast_message, jid, msg_obj, instance_name)
                 
-                # 🧠 Se for mídia, processa em background
+                # 🧠 Se for mídia, entra na fila de mídia (prioridade, dedup e retentativas)
                 if media_type:
-                    background_tasks.add_task(process_media_and_update, jid, msg_obj["message_id"], media_type)
+                    # Com webhookBase64 a mídia já está no cache: a fila não baixa de novo
+                    content_sha = media_fingerprint(data)[0] or (inline_media.sha256 if inline_media else None)
+                    media_scheduler.submit(instance_name, msg_obj["message_id"], media_type, jid=jid,
+                                           seconds=msg_data.get(f"{media_type}Message", {}).get("seconds"),
+                                           api_key=EVO_TOKEN, content_sha=content_sha,
+                                           tenant_id=await tenant_id_for_instance(instance_name))
 
                 if data.get("pushName"):
                     if jid in CONVERSATION_STATE_STORE:
                         CONVERSATION_STATE_STORE[jid]["name"] = data.get("pushName")
                         save_to_redis(jid)
+
+        elif event in CONTACT_EVENTS:
+            # 📇 Contatos/chats mudaram: a próxima página da tela de importação reconstrói o diretório
+            contact_directories.invalidate(instance_name)
+
+        elif event in ("connection.update", "CONNECTION_UPDATE"):
+            # 📶 Mantém o cache de estado da instância atualizado sem consultar a Evolution
+            instance_states.update_from_webhook(instance_name, data)
     except Exception as e:
         print_error(f"Webhook error: {e}")
         traceback.print_exc()
@@ -2964,6 +2724,7 @@ async def create_new_tenant(req: CreateTenantSchema, admin: User = Depends(verif
         db.add(new_user)
 
         db.commit()
+        _INSTANCE_TENANT_CACHE.clear()
         return {"status": "success", "message": "Empresa criada com sucesso!"}
 
     except Exception as e:
@@ -1,18 +1,23 @@
 # Em backend/routers/evolution.py
 import httpx
 import os
+import asyncio
+import hashlib
 import traceback
 import uuid
 import time
 import base64
 from fastapi import APIRouter, Depends, HTTPException, Request, status, BackgroundTasks
-from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
 from core.security import get_current_active_user, get_current_user
 from schemas import UserInDB, User, FetchProfilePictureRequest
 from services.conversation_service import ConversationService, get_conversation_service
 from core.shared import print_error, print_info, print_warning, print_success
+from services.evolution_client import evolution_client
+from services.instance_state import instance_states
+from services.media_cache import MediaDownloadError, media_cache
+from services.profile_resolver import profile_resolver
 
 router = APIRouter(
     prefix="/evolution",
@@ -52,44 +57,43 @@ async def proxy_get_qr_code(request: Request, current_user: UserInDB = Depends(g
 
         print_info(f"🔌 Tentando conectar na instância: {instance_name}")
 
-        async with httpx.AsyncClient() as client:
-            # 1. Tenta conectar (pegar QR Code existente)
-            connect_url = f"{EVOLUTION_API_URL}/instance/connect/{instance_name}"
-            response = await client.get(connect_url, headers=headers, timeout=20.0)
-
-            # Se deu 401, a chave está errada. Para tudo.
-            if response.status_code == 401:
-                print_error("❌ Erro 401: API Key da Evolution incorreta.")
-                raise HTTPException(status_code=502, detail="Erro de Autenticação no Backend (API Key inválida)")
-
-            # Se deu sucesso (200), retorna o QR Code
-            if response.status_code == 200:
-                return response.json()
-
-            # 2. Se deu 404 (Não encontrada), vamos CRIAR a instância
-            if response.status_code == 404:
-                print_warning(f"⚠️ Instância '{instance_name}' não existe. Criando nova...")
-
-                create_url = f"{EVOLUTION_API_URL}/instance/create"
-                payload = {
-                    "instanceName": instance_name,
-                    "token": "",  # Opcional, pode deixar vazio ou gerar um token
-                    "qrcode": True,
-                    "integration": "WHATSAPP-BAILEYS"
-                }
-
-                create_response = await client.post(create_url, headers=headers, json=payload, timeout=30.0)
-
-                if create_response.status_code == 201:  # Criado com sucesso
-                    print_success(f"✅ Instância '{instance_name}' criada com sucesso!")
-                    return create_response.json()
-                else:
-                    # Se falhar ao criar
-                    print_error(f"❌ Falha ao criar instância: {create_response.text}")
-                    raise HTTPException(status_code=create_response.status_code, detail=create_response.text)
-
-            # Se for outro erro qualquer
-            raise HTTPException(status_code=response.status_code, detail=response.text)
+        # 1. Tenta conectar (pegar QR Code existente)
+        connect_url = f"{EVOLUTION_API_URL}/instance/connect/{instance_name}"
+        response = await evolution_client.get(connect_url, headers=headers, timeout=20.0)
+
+        # Se deu 401, a chave está errada. Para tudo.
+        if response.status_code == 401:
+            print_error("❌ Erro 401: API Key da Evolution incorreta.")
+            raise HTTPException(status_code=502, detail="Erro de Autenticação no Backend (API Key inválida)")
+
+        # Se deu sucesso (200), retorna o QR Code
+        if response.status_code == 200:
+            return response.json()
+
+        # 2. Se deu 404 (Não encontrada), vamos CRIAR a instância
+        if response.status_code == 404:
+            print_warning(f"⚠️ Instância '{instance_name}' não existe. Criando nova...")
+
+            create_url = f"{EVOLUTION_API_URL}/instance/create"
+            payload = {
+                "instanceName": instance_name,
+                "token": "",  # Opcional, pode deixar vazio ou gerar um token
+                "qrcode": True,
+                "integration": "WHATSAPP-BAILEYS"
+            }
+
+            create_response = await evolution_client.post(create_url, headers=headers, json=payload, timeout=30.0)
+
+            if create_response.status_code == 201:  # Criado com sucesso
+                print_success(f"✅ Instância '{instance_name}' criada com sucesso!")
+                return create_response.json()
+            else:
+                # Se falhar ao criar
+                print_error(f"❌ Falha ao criar instância: {create_response.text}")
+                raise HTTPException(status_code=create_response.status_code, detail=create_response.text)
+
+        # Se for outro erro qualquer
+        raise HTTPException(status_code=response.status_code, detail=response.text)
 
     except HTTPException as he:
         raise he
@@ -102,12 +106,9 @@ async def proxy_get_qr_code(request: Request, current_user: UserInDB = Depends(g
 @router.get("/instance/status")
 async def proxy_instance_status(request: Request, current_user: UserInDB = Depends(get_current_user)):
     instance_name = request.query_params.get('instanceName') or INSTANCE_NAME
-    api_url = f"{EVOLUTION_API_URL}/instance/connectionState/{instance_name}"
-    headers = {"apikey": EVOLUTION_API_KEY}
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(api_url, headers=headers)
-            return response.json()
+        instance = await instance_states.get(instance_name, api_key=EVOLUTION_API_KEY)
+        return instance.data
     except Exception as e:
         return {"instance": {"state": "close"}}
 
@@ -136,11 +137,10 @@ async def proxy_send_message(
     print_info(f"📤 [Proxy] Enviando msg para {jid}")
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(api_url, headers=headers, json=payload, timeout=30.0)
-            response.raise_for_status()
-            response_data = response.json()
-            msg_id = response_data.get("key", {}).get("id", f"sent_{uuid.uuid4()}")
+        response = await evolution_client.post(api_url, headers=headers, json=payload, timeout=30.0)
+        response.raise_for_status()
+        response_data = response.json()
+        msg_id = response_data.get("key", {}).get("id", f"sent_{uuid.uuid4()}")
 
         message_obj = {
             "message_id": msg_id,
@@ -168,32 +168,26 @@ async def proxy_fetch_profile_picture(
         request_data: FetchProfilePictureRequest,
         current_user: User = Depends(get_current_active_user)
 ):
-    real_api_url = f"{EVOLUTION_API_URL}/chat/fetchProfilePictureUrl/{instance_name}"
-    headers = {"apikey": EVOLUTION_API_KEY, "Content-Type": "application/json"}
     number = request_data.number.replace("@s.whatsapp.net", "")
-    payload = {"number": number}
-
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(real_api_url, headers=headers, json=payload, timeout=10.0)
-            if response.status_code == 404:
-                return {"profilePictureUrl": None}
-            response.raise_for_status()
-            data = response.json()
-            url = data.get("profilePictureUrl") or data.get("picture")
-            return {"profilePictureUrl": url}
-    except Exception as e:
-        return {"profilePictureUrl": None}
+    # Resolver cacheado (sem foto / erro viram None, igual antes)
+    url = await profile_resolver.picture(instance_name, number, api_key=EVOLUTION_API_KEY)
+    return {"profilePictureUrl": url}
 
 
 # --- 💡 PROXY DE MÍDIA (TURBINADO COM RESGATE VIA BASE64) ---
 @router.get("/chat/getBase64FromMediaMessage")
 async def media_proxy(
+        request: Request,
         url: str,
         messageId: str = None,
+        current_user: User = Depends(get_current_active_user),
 ):
     """
     Proxy inteligente: Tenta URL original. Se falhar, usa o Resgate Evolution (getBase64FromMediaMessage).
+    Tudo que é baixado vai para o cache de mídia em disco; repetições saem direto do arquivo.
+    Bytes vindos da URL ficam só sob a chave da URL: a URL é do cliente (e a do WhatsApp traz o .enc
+    criptografado), então nunca viram "a mídia da mensagem". A chave da mensagem só é preenchida
+    pelo resgate via Evolution.
     """
     # 1. Decodifica a URL original
     try:
@@ -202,23 +196,24 @@ async def media_proxy(
     except:
         target_url = url
 
-    # 2. Tenta Baixar da URL Original (Método Rápido)
+    message_key = f"{INSTANCE_NAME}:{messageId}" if messageId else None
+    url_key = f"url:{hashlib.sha256(target_url.encode()).hexdigest()}"
+    cached = (message_key and await media_cache.alookup(message_key)) or await media_cache.alookup(url_key)
+    if cached:
+        return media_cache.serve(cached, request)
+
+    # 2. Tenta Baixar da URL Original (Método Rápido) - em streaming direto para o cache
     try:
         async with httpx.AsyncClient(verify=False) as client:
-            # Tenta primeiro sem headers (para URLs públicas do whatsapp/s3)
-            r = await client.get(target_url, timeout=5.0)
-
-            # Se falhar (401/403), tenta com a API Key (caso seja url interna da evolution)
-            if r.status_code != 200:
-                headers = {"apikey": EVOLUTION_API_KEY}
-                r = await client.get(target_url, headers=headers, timeout=5.0)
-
-            if r.status_code == 200:
-                return StreamingResponse(
-                    r.aiter_bytes(),
-                    media_type=r.headers.get("content-type"),
-                    headers={"Cache-Control": "public, max-age=31536000"}
-                )
+            # Tenta primeiro sem headers (para URLs públicas do whatsapp/s3);
+            # se falhar (401/403), tenta com a API Key (caso seja url interna da evolution)
+            for headers in ({}, {"apikey": EVOLUTION_API_KEY}):
+                async with client.stream("GET", target_url, headers=headers, timeout=5.0) as r:
+                    if r.status_code != 200:
+                        continue
+                    entry = await media_cache.put_stream(url_key, r.aiter_bytes(),
+                                                         r.headers.get("content-type"))
+                    return media_cache.serve(entry, request)
     except Exception as e:
         print_warning(f"⚠️ [Proxy] URL original falhou ({e}). Tentando resgate via Evolution...")
 
@@ -226,46 +221,11 @@ async def media_proxy(
     if messageId:
         print_info(f"🚑 [Proxy] Resgatando mídia ID: {messageId} via Evolution...")
         try:
-            rescue_url = f"{EVOLUTION_API_URL}/chat/getBase64FromMediaMessage/{INSTANCE_NAME}"
-
-            # Payload IDÊNTICO ao seu CURL de sucesso
-            payload = {
-                "message": {
-                    "key": {
-                        "id": messageId
-                    }
-                },
-                "convertToMp4": False
-            }
-
-            headers = {
-                "apikey": EVOLUTION_API_KEY,
-                "Content-Type": "application/json"
-            }
-
-            async with httpx.AsyncClient() as client:
-                res = await client.post(rescue_url, headers=headers, json=payload, timeout=30.0)
-
-                if res.status_code == 200:
-                    data = res.json()
-                    base64_str = data.get("base64")
-                    mimetype = data.get("mimetype")  # Evolution retorna o mime correto!
-
-                    if base64_str:
-                        import io
-                        # Decodifica o base64 para bytes reais
-                        file_bytes = base64.b64decode(base64_str)
-
-                        print_success(f"✅ [Proxy] Mídia {messageId} recuperada com sucesso!")
-
-                        return StreamingResponse(
-                            io.BytesIO(file_bytes),
-                            media_type=mimetype or "application/octet-stream",
-                            headers={"Cache-Control": "public, max-age=31536000"}
-                        )
-                else:
-                    print_error(f"❌ [Proxy] Evolution recusou resgate: {res.text}")
-
+            entry = await media_cache.fetch(INSTANCE_NAME, {"key": {"id": messageId}}, EVOLUTION_API_KEY)
+            print_success(f"✅ [Proxy] Mídia {messageId} recuperada com sucesso!")
+            return media_cache.serve(entry, request)
+        except MediaDownloadError as e:
+            print_error(f"❌ [Proxy] Evolution recusou resgate: {e.detail}")
         except Exception as e_rescue:
             print_error(f"❌ [Proxy] Falha crítica no resgate: {e_rescue}")
 
@@ -1,4 +1,5 @@
 # Em backend/routers/websocket.py
+from typing import Optional
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
 from core.security import get_current_user
 from services.websocket_manager import manager # Importa o gerente criado
@@ -12,6 +13,9 @@ router = APIRouter(
 async def websocket_endpoint(
     websocket: WebSocket,
     token: str, # Captura o token do path (URL)
+    last_seq: Optional[int] = None, # Último seq recebido (reconexão)
+    stream_id: Optional[str] = None,
+    subscriptions: Optional[str] = None, # "list,<jid>,..." (resumos da lista + conversas abertas)
     # Usa a segurança para autenticar e obter o objeto User
     current_user: UserInDB = Depends(get_current_user)
 ):
@@ -23,8 +27,10 @@ async def websocket_endpoint(
     user_id = current_user.username # Usamos o username como ID único do usuário
 
     try:
-        # Conecta o usuário
-        await manager.connect(user_id, websocket)
+        # Conecta o usuário no stream da empresa (reenvia eventos perdidos se last_seq vier)
+        await manager.connect(websocket, tenant_id=current_user.tenant_id, last_seq=last_seq, stream_id=stream_id,
+                              subscriptions=[t for t in (subscriptions or "").split(",") if t],
+                              username=current_user.username)
 
         # Loop principal: mantem a conexão aberta.
         # Podemos esperar por mensagens do cliente aqui (ex: "estou digitando").
@@ -32,16 +38,16 @@ async def websocket_endpoint(
             # Espera por qualquer mensagem. Se o cliente fechar, levanta WebSocketDisconnect.
             # O `receive_text` é necessário para manter o loop vivo.
             data = await websocket.receive_text()
-            # Opcional: Processar mensagens recebidas do cliente (ex: status de digitação)
-            # print(f"Cliente {user_id} enviou: {data}")
+            # Assinaturas: {"type": "subscribe"/"unsubscribe", "channel": "list" | "conversation_id": ...}
+            manager.handle_client_message(websocket, data)
 
     except WebSocketDisconnect:
         # Desconecta o usuário quando a aba é fechada ou o app é atualizado
-        manager.disconnect(user_id, websocket)
+        manager.disconnect(websocket)
     except Exception as e:
         # Lidar com outros erros
         print(f"❌ Erro no WebSocket do usuário {user_id}: {e}")
-        manager.disconnect(user_id, websocket)
+        manager.disconnect(websocket)
 
 # (Lembre-se de criar o arquivo `websocket_manager.py` no `/services`
 # com o conteúdo que discutimos na etapa anterior - ele já foi fornecido.)
\ No newline at end of file
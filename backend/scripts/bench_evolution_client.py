@@ -0,0 +1,109 @@
+# Em backend/scripts/bench_evolution_client.py
+"""
+Benchmark: httpx.AsyncClient novo por chamada vs. pool compartilhado (EvolutionClient).
+
+Sobe um mock local da Evolution API (ASGI + uvicorn) e mede p50/p99 de latência
+para o mesmo volume de requisições nos dois modos.
+
+Uso:
+    python scripts/bench_evolution_client.py --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+
+from services.evolution_client import EvolutionClient  # noqa: E402
+
+
+async def mock_evolution_app(scope, receive, send):
+    """ Mock mínimo: responde connectionState / findMessages com JSON fixo. """
+    if scope["type"] != "http":
+        return
+    body = b'{"instance": {"state": "open"}}'
+    if "findMessages" in scope["path"]:
+        body = b'{"messages": {"records": []}}'
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def _run(label, call, total, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with sem:
+            start = time.perf_counter()
+            resp = await call(i)
+            resp.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    wall = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    wall = time.perf_counter() - wall
+
+    print(f"{label:<24} p50={statistics.median(latencies):7.2f}ms "
+          f"p99={_percentile(latencies, 99):7.2f}ms  "
+          f"throughput={total / wall:8.1f} req/s")
+
+
+async def main(total: int, concurrency: int):
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = uvicorn.Server(uvicorn.Config(mock_evolution_app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    def path(i):
+        return "/chat/findMessages/bench" if i % 2 else "/instance/connectionState/bench"
+
+    async def fresh_client_call(i):
+        async with httpx.AsyncClient() as client:
+            return await client.get(f"{base_url}{path(i)}", headers={"apikey": "bench"})
+
+    pooled = EvolutionClient(base_url=base_url, default_api_key="bench")
+    await pooled.start()
+
+    async def pooled_call(i):
+        return await pooled.get(path(i))
+
+    try:
+        # Aquece os dois caminhos antes de medir
+        await _run("warmup", pooled_call, 50, concurrency)
+        await _run("AsyncClient por chamada", fresh_client_call, total, concurrency)
+        await _run("Pool compartilhado", pooled_call, total, concurrency)
+    finally:
+        await pooled.close()
+        server.should_exit = True
+        await server_task
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=int(os.getenv("BENCH_REQUESTS", "2000")))
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BENCH_CONCURRENCY", "50")))
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
@@ -0,0 +1,99 @@
+# Em backend/scripts/bench_history_stream.py
+"""
+Benchmark: findMessages com resp.json() (corpo inteiro) vs. parse incremental (RecordStream).
+
+Sobe a Evolution falsa (scripts/fake_evolution.py) com banda limitada e mede, por página,
+o tempo até o primeiro registro utilizável, o tempo total e o pico de memória (tracemalloc).
+
+Uso:
+    python scripts/bench_history_stream.py --pages 5 --page-size 500 --bandwidth-mbps 50
+"""
+import argparse
+import asyncio
+import socket
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+sys.path.insert(0, str(Path(__file__).parent.resolve()))
+
+from fake_evolution import FakeConfig, create_app  # noqa: E402
+from services.evolution_client import EvolutionClient  # noqa: E402
+from services.json_stream import RecordStream  # noqa: E402
+from services.message_parser import parse_record  # noqa: E402
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _buffered(client: EvolutionClient, page: int, size: int):
+    started = time.perf_counter()
+    resp = await client.post("/chat/findMessages/bench", json={"limit": size, "page": page})
+    records = resp.json()["messages"]["records"]
+    first = time.perf_counter() - started
+    parsed = [m for m in map(parse_record, records) if m]
+    return first, len(parsed)
+
+
+async def _streamed(client: EvolutionClient, page: int, size: int):
+    started = time.perf_counter()
+    first = None
+    parsed = []
+    resp = await client.open_stream("POST", "/chat/findMessages/bench", json={"limit": size, "page": page})
+    async for batch in RecordStream("records").iterate(resp, min_batch=50):
+        if first is None:
+            first = time.perf_counter() - started
+        parsed.extend(m for m in map(parse_record, batch) if m)
+    return first, len(parsed)
+
+
+async def _measure(label, fn, client, pages, size):
+    tracemalloc.start()
+    started = time.perf_counter()
+    firsts, total = [], 0
+    for page in range(1, pages + 1):
+        first, count = await fn(client, page, size)
+        firsts.append(first)
+        total += count
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<12} registros={total:6d}  1º registro (média)={sum(firsts) / len(firsts) * 1000:7.1f}ms  "
+          f"total={elapsed * 1000:8.1f}ms  pico={peak / 1024 / 1024:6.1f}MB")
+
+
+async def main(pages: int, size: int, bandwidth: float):
+    port = _free_port()
+    config = FakeConfig(chats=max(50, pages * size // 40), messages_per_chat=60, latency_ms=20, jitter_ms=0,
+                        tail_rate=0, per_record_us=0, bandwidth_mbps=bandwidth)
+    server = uvicorn.Server(uvicorn.Config(create_app(config), host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    client = EvolutionClient(base_url=f"http://127.0.0.1:{port}", default_api_key="bench")
+    await client.start()
+    try:
+        await _buffered(client, 1, 10)  # gera o corpus e aquece a conexão
+        await _measure("resp.json()", _buffered, client, pages, size)
+        await _measure("streaming", _streamed, client, pages, size)
+    finally:
+        await client.close()
+        server.should_exit = True
+        await server_task
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--bandwidth-mbps", type=float, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.pages, args.page_size, args.bandwidth_mbps))
@@ -0,0 +1,87 @@
+# Em backend/scripts/bench_transcription.py
+"""
+Benchmark de transcrição de áudio: Gemini (upload + generate_content) vs. Whisper local (pool de processos).
+
+Para cada arquivo mede o tempo de ponta a ponta e o fator de tempo real
+(RTF = tempo de processamento / duração do áudio; < 1 é mais rápido que o próprio áudio).
+A carga do modelo Whisper acontece no aquecimento e não entra na conta.
+
+Uso:
+    python scripts/bench_transcription.py audios/*.ogg --backends gemini,whisper --repeat 2
+Requer GEMINI_API_KEY para o Gemini e openai-whisper + ffmpeg para o Whisper.
+"""
+import argparse
+import asyncio
+import json
+import mimetypes
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+
+from services.transcription import GEMINI, WHISPER, WhisperTranscriber  # noqa: E402
+
+
+def _duration(path: str) -> float:
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "json", path],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return float(json.loads(out)["format"]["duration"])
+
+
+async def _gemini(path: str) -> str:
+    from services.media_service import media_service
+    if not media_service.model:
+        raise RuntimeError("GEMINI_API_KEY não configurada")
+    mimetype = mimetypes.guess_type(path)[0] or "audio/ogg"
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(media_service.executor, media_service._upload_and_generate,
+                                      path, mimetype, "audio")
+
+
+async def main(files, backends, repeat, workers, model):
+    durations = {f: _duration(f) for f in files}
+    total_audio = sum(durations.values()) * repeat
+    print(f"🎧 {len(files)} arquivo(s), {total_audio:.1f}s de áudio no total (x{repeat})")
+
+    whisper = None
+    if WHISPER in backends:
+        if not WhisperTranscriber.available():
+            print("⚠️ openai-whisper não instalado: pulando Whisper")
+            backends = [b for b in backends if b != WHISPER]
+        else:
+            whisper = WhisperTranscriber(model_name=model, workers=workers)
+            started = time.perf_counter()
+            await whisper.transcribe(files[0])  # aquecimento: carrega o modelo em cada worker
+            print(f"🔥 Whisper '{model}' aquecido em {time.perf_counter() - started:.1f}s")
+
+    for backend in backends:
+        run = whisper.transcribe if backend == WHISPER else _gemini
+        started = time.perf_counter()
+        tasks = [run(f) for _ in range(repeat) for f in files]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        errors = [r for r in results if isinstance(r, Exception)]
+        print(f"{backend:<8} total={elapsed:7.2f}s  RTF(lote)={elapsed / total_audio:6.3f}  "
+              f"por arquivo={elapsed / len(tasks):6.2f}s  erros={len(errors)}")
+        for err in errors[:3]:
+            print(f"   ❌ {err}")
+        if backend == WHISPER:
+            print(f"         RTF por worker (só inferência) = {whisper.stats.to_dict()['rtf']}")
+
+    if whisper:
+        whisper.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--backends", default=f"{GEMINI},{WHISPER}")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--model", default="base")
+    args = parser.parse_args()
+    asyncio.run(main(args.files, args.backends.split(","), args.repeat, args.workers, args.model))
@@ -1,5 +1,6 @@
 # Em backend/scripts/create_db.py
 import os
+import sys
 import shutil
 import json
 import traceback
@@ -26,6 +27,11 @@ try:
 except Exception as e:
     print(f"❌ Erro ao carregar .env: {e}")
 
+# DEPOIS do load_dotenv: EMBEDDING_CACHE_PATH do .env tem que valer aqui também (mesmo arquivo do app)
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+
+from services.embedding_cache import CachedEmbeddings, embedding_store  # noqa: E402
+
 # --- CONFIGURAÇÃO DE CAMINHOS ---
 CHROMA_PATH_LOCAL = str(BACKEND_DIR_PATH / "chroma_db_local")
 DATA_DIR_PATH = BACKEND_DIR_PATH / "data"
@@ -103,10 +109,11 @@ def create_database():
         return
 
     print("🧠 Inicializando modelo de Embeddings (models/embedding-001)...")
-    embeddings_model = GoogleGenerativeAIEmbeddings(
+    # Cache persistente (model, sha256 do texto): recriar a base só embute os trechos novos
+    embeddings_model = CachedEmbeddings(GoogleGenerativeAIEmbeddings(
         model="models/embedding-001",
         google_api_key=api_key
-    )
+    ), "models/embedding-001")
 
     docs = load_documents_from_jsonl()
     if not docs:
@@ -183,4 +190,5 @@ def create_database():
 
 
 if __name__ == "__main__":
-    create_database()
\ No newline at end of file
+    create_database()
+    print(f"🧮 Cache de embeddings: {embedding_store.metrics()}")
\ No newline at end of file
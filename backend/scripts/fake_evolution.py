@@ -0,0 +1,513 @@
+# Em backend/scripts/fake_evolution.py
+"""
+Evolution API falsa (ASGI/FastAPI) para benchmarks e testes de integração sem WhatsApp.
+
+Gera um corpus sintético e determinístico (seed) de chats, contatos e mensagens por
+instância e implementa as rotas que o backend usa: findMessages, findContacts, findChats,
+sendText, sendReaction, getBase64FromMediaMessage, connectionState, fetchProfilePictureUrl,
+fetchProfile e webhook/set. Latência, cauda lenta, erros 5xx e 429 são configuráveis.
+Um emissor de webhook envia messages.upsert / connection.update para o backend.
+
+Rotas de controle (sem latência/erros injetados):
+    GET  /_fake/stats                       contadores por rota
+    POST /_fake/config                      altera latência/erros em tempo real (JSON)
+    POST /_fake/emit/{instance}?count=N     emite N mensagens recebidas via webhook
+    POST /_fake/connection/{instance}?state=close|open|connecting
+
+Uso:
+    python scripts/fake_evolution.py --port 8081 --chats 500 --messages-per-chat 80 \\
+        --latency-ms 40 --error-rate 0.01 --webhook-url http://127.0.0.1:8000/webhook/evolution --webhook-rate 5
+    # backend: EVOLUTION_API_URL=http://127.0.0.1:8081 EVOLUTION_API_KEY=fake uvicorn main:app
+
+Também pode ser usada em processo: create_app(FakeConfig(...)) + httpx.ASGITransport.
+"""
+import argparse
+import asyncio
+import base64
+import bisect
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+FIRST_NAMES = ["Ana", "Bruno", "Carla", "Diego", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela", "João",
+               "Larissa", "Marcos", "Natália", "Otávio", "Paula", "Rafael", "Sofia", "Thiago", "Vanessa", "Wagner"]
+LAST_NAMES = ["Silva", "Souza", "Oliveira", "Santos", "Lima", "Costa", "Pereira", "Almeida", "Ferreira", "Rocha"]
+PHRASES = ["Oi, tudo bem?", "Qual o valor do plano?", "Vocês entregam em Curitiba?", "Pode me mandar o catálogo?",
+           "Obrigado!", "Vou pensar e te aviso", "Tem desconto à vista?", "Perfeito, pode fechar",
+           "Qual o prazo de entrega?", "Consegue me ligar amanhã?", "Ainda tem em estoque?", "👍"]
+
+# (tipo, chave na mensagem, mimetype, magic bytes, peso no sorteio)
+MEDIA_TYPES = [
+    ("image", "imageMessage", "image/jpeg", b"\xff\xd8\xff\xe0", 8),
+    ("audio", "audioMessage", "audio/ogg; codecs=opus", b"OggS", 6),
+    ("video", "videoMessage", "video/mp4", b"\x00\x00\x00\x18ftypmp42", 3),
+    ("document", "documentMessage", "application/pdf", b"%PDF-1.4\n", 3),
+]
+TEXT_WEIGHT = 80
+
+
+@dataclass
+class FakeConfig:
+    chats: int = int(os.getenv("FAKE_EVO_CHATS", "300"))
+    messages_per_chat: int = int(os.getenv("FAKE_EVO_MESSAGES_PER_CHAT", "60"))
+    history_days: int = int(os.getenv("FAKE_EVO_HISTORY_DAYS", "30"))
+    groups: int = int(os.getenv("FAKE_EVO_GROUPS", "10"))  # ruído que o backend deve filtrar
+    seed: int = int(os.getenv("FAKE_EVO_SEED", "42"))
+    latency_ms: float = float(os.getenv("FAKE_EVO_LATENCY_MS", "30"))
+    jitter_ms: float = float(os.getenv("FAKE_EVO_JITTER_MS", "10"))  # média exponencial somada à base
+    tail_rate: float = float(os.getenv("FAKE_EVO_TAIL_RATE", "0.01"))
+    tail_ms: float = float(os.getenv("FAKE_EVO_TAIL_MS", "1500"))
+    error_rate: float = float(os.getenv("FAKE_EVO_ERROR_RATE", "0"))
+    throttle_rate: float = float(os.getenv("FAKE_EVO_429_RATE", "0"))
+    per_record_us: float = float(os.getenv("FAKE_EVO_PER_RECORD_US", "50"))  # custo do servidor por registro
+    media_mb_per_sec: float = float(os.getenv("FAKE_EVO_MEDIA_MBPS", "20"))  # download + decrypt do WhatsApp
+    bandwidth_mbps: float = float(os.getenv("FAKE_EVO_BANDWIDTH_MBPS", "0"))  # corpo em pedaços (0 = de uma vez)
+    media_kb: Dict[str, int] = None
+    picture_rate: float = float(os.getenv("FAKE_EVO_PICTURE_RATE", "0.7"))
+    api_key: Optional[str] = os.getenv("FAKE_EVO_APIKEY")
+    webhook_url: Optional[str] = os.getenv("FAKE_EVO_WEBHOOK_URL")
+    webhook_rate: float = float(os.getenv("FAKE_EVO_WEBHOOK_RATE", "0"))  # mensagens/s (0 = desligado)
+    webhook_instance: str = os.getenv("FAKE_EVO_WEBHOOK_INSTANCE", "fake")
+
+    def __post_init__(self):
+        if self.media_kb is None:
+            self.media_kb = {"image": 150, "audio": 40, "video": 2048, "document": 300}
+
+
+class Corpus:
+    """ Chats/mensagens de UMA instância, indexados por tempo e por JID. """
+
+    def __init__(self, instance: str, config: FakeConfig):
+        self.instance = instance
+        self.config = config
+        self.rng = random.Random(f"{config.seed}:{instance}")
+        self.contacts: List[Dict[str, Any]] = []
+        self.by_number: Dict[str, Dict[str, Any]] = {}
+        self.by_jid: Dict[str, List[Dict[str, Any]]] = {}
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.timeline: List[Dict[str, Any]] = []  # ordem crescente de messageTimestamp
+        self.timestamps: List[int] = []
+        self.state = "open"
+        self._generate()
+
+    def _generate(self):
+        now = int(time.time())
+        start = now - self.config.history_days * 86400
+        for i in range(self.config.chats):
+            number = f"55419{self.rng.randrange(10 ** 7, 10 ** 8)}{i % 10}"
+            jid = f"{number}@s.whatsapp.net"
+            name = f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+            has_picture = self.rng.random() < self.config.picture_rate
+            self.contacts.append({
+                "id": jid, "remoteJid": jid, "pushName": name,
+                "profilePictureUrl": f"https://pps.whatsapp.net/fake/{number}.jpg" if has_picture else None
+            })
+            self.by_number[number] = self.contacts[-1]
+            self.by_jid[jid] = []
+            # Conversas com atividade espalhada, algumas bem recentes
+            last = now - int(self.rng.expovariate(1 / (3 * 86400)))
+            count = max(1, int(self.rng.gauss(self.config.messages_per_chat, self.config.messages_per_chat / 3)))
+            for ts in sorted(self.rng.randint(start, max(start, last)) for _ in range(count)):
+                self._add(self._record(jid, name, ts, from_me=self.rng.random() < 0.4))
+        for g in range(self.config.groups):
+            jid = f"1203630{self.rng.randrange(10 ** 10)}{g}@g.us"
+            self.contacts.append({"id": jid, "remoteJid": jid, "pushName": f"Grupo {g}", "profilePictureUrl": None})
+            self.by_jid[jid] = []
+            for _ in range(5):
+                self._add(self._record(jid, "Participante", self.rng.randint(start, now), from_me=False))
+        self.timeline = sorted(self.by_id.values(), key=lambda r: r["messageTimestamp"])
+        self.timestamps = [r["messageTimestamp"] for r in self.timeline]
+        for msgs in self.by_jid.values():
+            msgs.sort(key=lambda r: r["messageTimestamp"])
+
+    def _record(self, jid: str, name: str, ts: int, from_me: bool,
+                text: Optional[str] = None, media: Optional[str] = None) -> Dict[str, Any]:
+        msg_id = uuid.UUID(int=self.rng.getrandbits(128)).hex[:20].upper()
+        if media is None and text is None:
+            roll = self.rng.randrange(TEXT_WEIGHT + sum(m[4] for m in MEDIA_TYPES))
+            if roll >= TEXT_WEIGHT:
+                roll -= TEXT_WEIGHT
+                for media_type, *_, weight in MEDIA_TYPES:
+                    if roll < weight:
+                        media = media_type
+                        break
+                    roll -= weight
+        message_type, message = "conversation", {"conversation": text or self.rng.choice(PHRASES)}
+        if media:
+            media_type, key, mimetype, _, _ = next(m for m in MEDIA_TYPES if m[0] == media)
+            size = self.config.media_kb[media_type] * 1024
+            message_type, message = key, {key: {
+                "url": f"https://mmg.whatsapp.net/fake/{msg_id}.enc",
+                "mimetype": mimetype,
+                "fileLength": str(size),
+                # Não é o hash do conteúdo gerado, mas é estável e único por mídia (serve de chave de cache)
+                "fileSha256": base64.b64encode(hashlib.sha256(f"{msg_id}:{size}".encode()).digest()).decode(),
+                "mediaKey": base64.b64encode(hashlib.sha256(msg_id.encode()).digest()).decode(),
+            }}
+            if media_type == "audio":
+                message[key].update({"seconds": self.rng.randint(2, 120), "ptt": True})
+            elif media_type == "video":
+                message[key]["seconds"] = self.rng.randint(5, 90)
+            elif media_type == "document":
+                message[key]["fileName"] = f"proposta-{msg_id[:6]}.pdf"
+            elif self.rng.random() < 0.3:
+                message[key]["caption"] = self.rng.choice(PHRASES)
+        return {
+            "id": uuid.uuid4().hex,
+            "key": {"id": msg_id, "remoteJid": jid, "fromMe": from_me},
+            "pushName": "Vendedor" if from_me else name,
+            "messageType": message_type,
+            "message": message,
+            "messageTimestamp": ts,
+            "instanceId": self.instance,
+            "source": "android"
+        }
+
+    def _add(self, record: Dict[str, Any]):
+        self.by_jid.setdefault(record["key"]["remoteJid"], []).append(record)
+        self.by_id[record["key"]["id"]] = record
+
+    def append(self, record: Dict[str, Any]):
+        """ Mensagem nova (sendText / webhook): sempre a mais recente. """
+        self._add(record)
+        self.timeline.append(record)
+        self.timestamps.append(record["messageTimestamp"])
+
+    def new_incoming(self, text: Optional[str] = None) -> Dict[str, Any]:
+        contact = self.rng.choice([c for c in self.contacts if c["id"].endswith("@s.whatsapp.net")])
+        record = self._record(contact["id"], contact["pushName"], int(time.time()), from_me=False, text=text)
+        self.append(record)
+        return record
+
+    def find_messages(self, where: Dict[str, Any], limit: int, page: int) -> Dict[str, Any]:
+        key = where.get("key") or {}
+        ts_filter = where.get("messageTimestamp") or {}
+        if key.get("id"):
+            source = [self.by_id[key["id"]]] if key["id"] in self.by_id else []
+        elif key.get("remoteJid"):
+            source = self.by_jid.get(key["remoteJid"], [])
+        else:
+            source = self.timeline
+        timestamps = self.timestamps if source is self.timeline else [r["messageTimestamp"] for r in source]
+        lo = bisect.bisect_left(timestamps, int(ts_filter["$gte"])) if "$gte" in ts_filter else 0
+        hi = bisect.bisect_right(timestamps, int(ts_filter["$lte"])) if "$lte" in ts_filter else len(source)
+        total = max(0, hi - lo)
+        # Evolution devolve mais recentes primeiro
+        end = hi - (page - 1) * limit
+        records = list(reversed(source[max(lo, end - limit):end])) if end > lo else []
+        return {"messages": {"total": total, "pages": -(-total // limit) if limit else 0,
+                             "currentPage": page, "records": records}}
+
+    def chats(self) -> List[Dict[str, Any]]:
+        result = []
+        for contact in self.contacts:
+            msgs = self.by_jid.get(contact["id"]) or []
+            last = msgs[-1] if msgs else None
+            result.append({
+                "id": contact["id"], "remoteJid": contact["id"], "name": contact["pushName"],
+                "pushName": contact["pushName"], "profilePictureUrl": contact["profilePictureUrl"],
+                "unreadCount": self.rng.randint(0, 3) if last and not last["key"]["fromMe"] else 0,
+                "updatedAt": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(last["messageTimestamp"])) if last else None,
+                "lastMessage": last
+            })
+        result.sort(key=lambda c: -(c["lastMessage"] or {}).get("messageTimestamp", 0))
+        return result
+
+    def media_bytes(self, record: Dict[str, Any]) -> Optional[bytes]:
+        entry = next((m for m in MEDIA_TYPES if m[1] == record["messageType"]), None)
+        if not entry:
+            return None
+        size = int(record["message"][entry[1]]["fileLength"])
+        rng = random.Random(record["key"]["id"])
+        block = rng.randbytes(4096)
+        return (entry[3] + block * (size // 4096 + 1))[:size]
+
+
+class WebhookEmitter:
+    """ Envia eventos no formato da Evolution para as URLs registradas via /webhook/set. """
+
+    def __init__(self, state: "FakeEvolution"):
+        self.state = state
+        self.client = httpx.AsyncClient(timeout=10.0)
+        self.sent = 0
+        self.failed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def emit(self, instance: str, event: str, data: Dict[str, Any]):
+        url = self.state.webhooks.get(instance) or self.state.config.webhook_url
+        if not url:
+            return
+        if self.state.webhook_base64.get(instance) and event == "messages.upsert":
+            media = self.state.corpus(instance).media_bytes(data)
+            if media:
+                data = {**data, "message": {**data.get("message", {}), "base64": base64.b64encode(media).decode()}}
+        payload = {"event": event, "instance": instance, "data": data,
+                   "date_time": time.strftime("%Y-%m-%dT%H:%M:%S"), "apikey": self.state.config.api_key}
+        try:
+            resp = await self.client.post(url, json=payload)
+            self.sent += 1
+            if resp.status_code >= 400:
+                self.failed += 1
+        except httpx.HTTPError:
+            self.failed += 1
+
+    async def _loop(self):
+        instance = self.state.config.webhook_instance
+        while True:
+            rate = self.state.config.webhook_rate
+            if rate <= 0:
+                await asyncio.sleep(1)
+                continue
+            await asyncio.sleep(random.expovariate(rate))
+            record = self.state.corpus(instance).new_incoming()
+            asyncio.create_task(self.emit(instance, "messages.upsert", record))
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        await self.client.aclose()
+
+
+class FakeEvolution:
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.corpora: Dict[str, Corpus] = {}
+        self.webhooks: Dict[str, str] = {}
+        self.webhook_base64: Dict[str, bool] = {}
+        self.stats: Counter = Counter()
+        self.emitter = WebhookEmitter(self)
+
+    def corpus(self, instance: str) -> Corpus:
+        if instance not in self.corpora:
+            self.corpora[instance] = Corpus(instance, self.config)
+        return self.corpora[instance]
+
+    async def inject(self, records: int = 0, extra_ms: float = 0) -> Optional[JSONResponse]:
+        """ Latência (base + jitter exponencial + cauda + custo por registro) e falhas configuradas. """
+        cfg = self.config
+        delay = cfg.latency_ms + (random.expovariate(1 / cfg.jitter_ms) if cfg.jitter_ms > 0 else 0)
+        if random.random() < cfg.tail_rate:
+            delay += cfg.tail_ms
+        delay += records * cfg.per_record_us / 1000 + extra_ms
+        await asyncio.sleep(delay / 1000)
+        roll = random.random()
+        if roll < cfg.error_rate:
+            self.stats["injected_5xx"] += 1
+            return JSONResponse({"status": 500, "error": "Internal Server Error (fake)"}, status_code=500)
+        if roll < cfg.error_rate + cfg.throttle_rate:
+            self.stats["injected_429"] += 1
+            return JSONResponse({"status": 429, "error": "Too Many Requests (fake)"}, status_code=429,
+                                headers={"Retry-After": "1"})
+        return None
+
+    def respond(self, payload: Any, status_code: int = 200):
+        """ JSON de uma vez, ou em pedaços de 64KB no ritmo de bandwidth_mbps (Evolution remota). """
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        mbps = self.config.bandwidth_mbps
+        if mbps <= 0:
+            return Response(body, status_code=status_code, media_type="application/json")
+
+        async def chunks():
+            for i in range(0, len(body), 65536):
+                yield body[i:i + 65536]
+                await asyncio.sleep(65536 / (mbps * 1024 * 1024 / 8))
+
+        return StreamingResponse(chunks(), status_code=status_code, media_type="application/json")
+
+
+def create_app(config: Optional[FakeConfig] = None) -> FastAPI:
+    fake = FakeEvolution(config or FakeConfig())
+    app = FastAPI(title="Fake Evolution API")
+    app.state.fake = fake
+
+    @app.on_event("startup")
+    async def _startup():
+        fake.emitter.start()
+
+    @app.on_event("shutdown")
+    async def _shutdown():
+        await fake.emitter.stop()
+
+    @app.middleware("http")
+    async def _count_and_auth(request: Request, call_next):
+        path = request.url.path
+        if not path.startswith("/_fake"):
+            parts = [p for p in path.split("/") if p]
+            fake.stats["/".join(parts[:2])] += 1
+            if fake.config.api_key and request.headers.get("apikey") != fake.config.api_key:
+                return JSONResponse({"status": 401, "error": "Unauthorized"}, status_code=401)
+        return await call_next(request)
+
+    async def _body(request: Request) -> Dict[str, Any]:
+        try:
+            return await request.json()
+        except ValueError:
+            return {}
+
+    @app.get("/instance/connectionState/{instance}")
+    async def connection_state(instance: str):
+        return await fake.inject() or {"instance": {"instanceName": instance, "state": fake.corpus(instance).state}}
+
+    @app.post("/chat/findMessages/{instance}")
+    async def find_messages(instance: str, request: Request):
+        body = await _body(request)
+        limit = int(body.get("limit") or body.get("offset") or 50)
+        page = max(1, int(body.get("page") or 1))
+        result = fake.corpus(instance).find_messages(body.get("where") or {}, limit, page)
+        return await fake.inject(len(result["messages"]["records"])) or fake.respond(result)
+
+    @app.post("/chat/findContacts/{instance}")
+    async def find_contacts(instance: str):
+        contacts = fake.corpus(instance).contacts
+        return await fake.inject(len(contacts)) or fake.respond(contacts)
+
+    @app.post("/chat/findChats/{instance}")
+    async def find_chats(instance: str):
+        chats = fake.corpus(instance).chats()
+        return await fake.inject(len(chats)) or fake.respond(chats)
+
+    @app.post("/chat/fetchProfilePictureUrl/{instance}")
+    async def fetch_profile_picture(instance: str, request: Request):
+        number = str((await _body(request)).get("number", "")).split("@")[0]
+        contact = fake.corpus(instance).by_number.get(number)
+        return await fake.inject() or {"wuid": f"{number}@s.whatsapp.net",
+                                       "profilePictureUrl": contact and contact["profilePictureUrl"]}
+
+    @app.post("/chat/fetchProfile/{instance}")
+    async def fetch_profile(instance: str, request: Request):
+        number = str((await _body(request)).get("number", "")).split("@")[0]
+        contact = fake.corpus(instance).by_number.get(number)
+        if not contact:
+            return await fake.inject() or JSONResponse({"status": 404, "error": "Not Found"}, status_code=404)
+        return await fake.inject() or {"wuid": contact["id"], "name": contact["pushName"],
+                                       "pushName": contact["pushName"], "picture": contact["profilePictureUrl"]}
+
+    @app.post("/chat/getBase64FromMediaMessage/{instance}")
+    async def get_base64(instance: str, request: Request):
+        msg_id = (((await _body(request)).get("message") or {}).get("key") or {}).get("id")
+        corpus = fake.corpus(instance)
+        record = corpus.by_id.get(msg_id)
+        data = corpus.media_bytes(record) if record else None
+        # Download + decrypt do WhatsApp: proporcional ao tamanho
+        mbps = fake.config.media_mb_per_sec
+        error = await fake.inject(extra_ms=len(data) / (mbps * 1024 * 1024) * 1000 if data and mbps > 0 else 0)
+        if error:
+            return error
+        if data is None:
+            return JSONResponse({"status": 400, "error": "Message not found or not media"}, status_code=400)
+        media = record["message"][record["messageType"]]
+        return fake.respond({"mediaType": record["messageType"].replace("Message", ""), "fileName": media.get("fileName"),
+                             "size": {"fileLength": len(data)}, "mimetype": media["mimetype"],
+                             "base64": base64.b64encode(data).decode()})
+
+    @app.post("/message/sendText/{instance}")
+    async def send_text(instance: str, request: Request):
+        body = await _body(request)
+        error = await fake.inject()
+        if error:
+            return error
+        corpus = fake.corpus(instance)
+        jid = f"{str(body.get('number', '')).split('@')[0]}@s.whatsapp.net"
+        record = corpus._record(jid, "Vendedor", int(time.time()), from_me=True, text=body.get("text", ""))
+        corpus.append(record)
+        asyncio.create_task(fake.emitter.emit(instance, "send.message", record))
+        return JSONResponse({k: record[k] for k in ("key", "message", "messageTimestamp", "messageType")} |
+                            {"status": "PENDING"}, status_code=201)
+
+    @app.post("/message/sendReaction/{instance}")
+    async def send_reaction(instance: str, request: Request):
+        options = (await _body(request)).get("options") or {}
+        error = await fake.inject()
+        if error:
+            return error
+        key = options.get("key") or {}
+        if key.get("id") not in fake.corpus(instance).by_id:
+            return JSONResponse({"status": 400, "error": "Message not found"}, status_code=400)
+        return JSONResponse({"key": {"id": uuid.uuid4().hex[:20].upper(), "remoteJid": key.get("remoteJid"), "fromMe": True},
+                             "message": {"reactionMessage": {"key": key, "text": options.get("reaction", "")}},
+                             "status": "PENDING"}, status_code=201)
+
+    @app.post("/webhook/set/{instance}")
+    async def set_webhook(instance: str, request: Request):
+        webhook = (await _body(request)).get("webhook") or {}
+        if webhook.get("enabled", True) and webhook.get("url"):
+            fake.webhooks[instance] = webhook["url"]
+            fake.webhook_base64[instance] = bool(webhook.get("webhookBase64"))
+        else:
+            fake.webhooks.pop(instance, None)
+            fake.webhook_base64.pop(instance, None)
+        return JSONResponse({"webhook": {"instanceName": instance, **webhook}}, status_code=201)
+
+    # --- Controle ---
+
+    @app.get("/_fake/stats")
+    async def stats():
+        return {"requests": dict(fake.stats), "webhooks": fake.webhooks,
+                "webhook_sent": fake.emitter.sent, "webhook_failed": fake.emitter.failed,
+                "instances": {name: {"chats": len(c.contacts), "messages": len(c.timeline), "state": c.state}
+                              for name, c in fake.corpora.items()},
+                "config": asdict(fake.config) | {"api_key": bool(fake.config.api_key)}}
+
+    @app.post("/_fake/config")
+    async def update_config(request: Request):
+        body = await _body(request)
+        allowed = {f.name for f in fields(FakeConfig)} - {"chats", "messages_per_chat", "history_days", "groups", "seed"}
+        for name, value in body.items():
+            if name in allowed:
+                setattr(fake.config, name, value)
+        return asdict(fake.config) | {"api_key": bool(fake.config.api_key)}
+
+    @app.post("/_fake/emit/{instance}")
+    async def emit(instance: str, count: int = 1, text: Optional[str] = None):
+        records = [fake.corpus(instance).new_incoming(text) for _ in range(count)]
+        await asyncio.gather(*(fake.emitter.emit(instance, "messages.upsert", r) for r in records))
+        return {"emitted": len(records), "ids": [r["key"]["id"] for r in records]}
+
+    @app.post("/_fake/connection/{instance}")
+    async def set_connection(instance: str, state: str = "close"):
+        fake.corpus(instance).state = state
+        await fake.emitter.emit(instance, "connection.update", {"instance": instance, "state": state})
+        return {"instance": instance, "state": state}
+
+    return app
+
+
+if __name__ == "__main__":
+    defaults = FakeConfig()
+    parser = argparse.ArgumentParser(description="Evolution API falsa para benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("FAKE_EVO_PORT", "8081")))
+    parser.add_argument("--chats", type=int, default=defaults.chats)
+    parser.add_argument("--messages-per-chat", type=int, default=defaults.messages_per_chat)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=defaults.jitter_ms)
+    parser.add_argument("--tail-rate", type=float, default=defaults.tail_rate)
+    parser.add_argument("--tail-ms", type=float, default=defaults.tail_ms)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--throttle-rate", type=float, default=defaults.throttle_rate)
+    parser.add_argument("--bandwidth-mbps", type=float, default=defaults.bandwidth_mbps)
+    parser.add_argument("--api-key", default=defaults.api_key)
+    parser.add_argument("--webhook-url", default=defaults.webhook_url)
+    parser.add_argument("--webhook-rate", type=float, default=defaults.webhook_rate)
+    parser.add_argument("--webhook-instance", default=defaults.webhook_instance)
+    args = parser.parse_args()
+
+    config = FakeConfig(**{k: v for k, v in vars(args).items() if k not in ("host", "port")})
+    print(f"🧪 Fake Evolution em http://{args.host}:{args.port} "
+          f"({config.chats} chats x ~{config.messages_per_chat} msgs, latência {config.latency_ms}ms)")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,203 @@
+# Em backend/services/contact_directory.py
+import os
+import time
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.shared import print_error, print_info, print_success
+from services.evolution_client import evolution_client
+
+"""
+Diretório de contatos por instância, usado por /evolution/chats/summary (tela de importação).
+Antes cada página (10 itens) baixava TODOS os chats/contatos da Evolution e filtrava em Python.
+Agora a lista é baixada uma vez, fica em memória por CONTACT_DIRECTORY_TTL segundos (ou até um
+webhook de contatos/chats invalidar) e já vem ordenada e indexada:
+- ordem alfabética pré-calculada -> paginação é um slice;
+- índice de n-gramas (1..3 caracteres) sobre "nome + número" -> busca por prefixo/trecho
+  olha só os candidatos do menor posting, já na ordem alfabética.
+"""
+
+CONTACT_DIRECTORY_TTL = float(os.getenv("CONTACT_DIRECTORY_TTL", "300"))
+# Tamanho máximo dos n-gramas indexados (buscas maiores intersectam os trigramas)
+CONTACT_INDEX_GRAM = 3
+
+# Eventos da Evolution que mudam a lista de contatos/chats
+CONTACT_EVENTS = {
+    "contacts.upsert", "contacts.update", "contacts.set",
+    "chats.upsert", "chats.update", "chats.delete", "chats.set",
+    "CONTACTS_UPSERT", "CONTACTS_UPDATE", "CONTACTS_SET",
+    "CHATS_UPSERT", "CHATS_UPDATE", "CHATS_DELETE", "CHATS_SET"
+}
+
+
+def _grams(text: str):
+    for size in range(1, CONTACT_INDEX_GRAM + 1):
+        for i in range(len(text) - size + 1):
+            yield text[i:i + size]
+
+
+class ContactDirectory:
+    """ Lista ordenada + índice de uma instância. Imutável depois de construída. """
+
+    def __init__(self, items: List[Dict[str, Any]], source: str):
+        items.sort(key=lambda x: x["name"].lower() if x["name"] else "")
+        self.items = items
+        self.source = source
+        self.built_at = time.monotonic()
+        self.stale = False
+        # Texto pesquisável de cada item (mesma semântica do filtro antigo: nome ou JID)
+        self.haystacks = [f"{item['name'].lower()}\n{item['id'].lower()}" for item in items]
+        self.index: Dict[str, List[int]] = {}
+        for pos, haystack in enumerate(self.haystacks):
+            for gram in set(_grams(haystack)):
+                if "\n" not in gram:
+                    self.index.setdefault(gram, []).append(pos)  # posições já em ordem crescente
+
+    @property
+    def fresh(self) -> bool:
+        return not self.stale and time.monotonic() - self.built_at < CONTACT_DIRECTORY_TTL
+
+    def _matches(self, query: str) -> List[int]:
+        if len(query) <= CONTACT_INDEX_GRAM:
+            return self.index.get(query, [])
+        # Candidatos = menor posting entre os trigramas; confirma o trecho inteiro em cada um
+        postings = [self.index.get(query[i:i + CONTACT_INDEX_GRAM], [])
+                    for i in range(len(query) - CONTACT_INDEX_GRAM + 1)]
+        candidates = min(postings, key=len)
+        return [pos for pos in candidates if query in self.haystacks[pos]]
+
+    def page(self, page: int, limit: int, search: str = "") -> Tuple[List[Dict[str, Any]], int]:
+        start = max(page - 1, 0) * limit
+        query = search.strip().lower()
+        if not query:
+            return self.items[start:start + limit], len(self.items)
+        matches = self._matches(query)
+        return [self.items[pos] for pos in matches[start:start + limit]], len(matches)
+
+
+async def _fetch_items(instance_name: str, api_token: str) -> Tuple[List[Dict[str, Any]], str]:
+    """ findChats (preferido) com fallback para findContacts. Só pessoas (@s.whatsapp.net). """
+    items: List[Dict[str, Any]] = []
+    try:
+        resp = await evolution_client.post(f"/chat/findChats/{instance_name}", api_key=api_token, json={})
+        if resp.status_code != 200:
+            raise Exception("Force Fallback")
+        raw_chats = resp.json()
+        if isinstance(raw_chats, dict): raw_chats = raw_chats.get('records') or []
+
+        seen = set()
+        for chat in raw_chats:
+            jid = chat.get("id") or chat.get("remoteJid")
+            # --- FILTRO ANTI-GRUPO E ANTI-LIXO ---
+            if not jid or not str(jid).endswith("@s.whatsapp.net") or jid in seen:
+                continue
+            # Filtro de Arquivadas (se disponível no endpoint de chats)
+            if chat.get("archive") or chat.get("isArchived"):
+                continue
+            seen.add(jid)
+            items.append({
+                "id": jid,
+                "name": chat.get("name") or chat.get("pushName") or jid.split('@')[0],
+                "picture": chat.get("profilePictureUrl") or "",
+                "unread": chat.get("unreadCount", 0),
+                "subtitle": jid.split('@')[0]
+            })
+        return items, "chats"
+    except Exception:
+        pass
+
+    # Fallback: CONTATOS (Onde estamos operando agora)
+    print_info("🔄 Fallback: Buscando e FILTRANDO contatos...")
+    resp_c = await evolution_client.post(f"/chat/findContacts/{instance_name}", api_key=api_token, json={})
+    if resp_c.status_code != 200:
+        raise RuntimeError(f"Erro Contatos: {resp_c.status_code}")
+
+    payload = resp_c.json()
+    contacts_list = []
+    if isinstance(payload, list):
+        contacts_list = payload
+    elif isinstance(payload, dict):
+        contacts_list = payload.get('contacts') or payload.get('records') or []
+
+    seen = set()
+    for contact in contacts_list:
+        final_jid = contact.get("remoteJid") or contact.get("id")
+        # Tchau grupos, tchau cmia..., tchau broadcast!
+        if not final_jid or not isinstance(final_jid, str) or not final_jid.endswith("@s.whatsapp.net"):
+            continue
+        if final_jid in seen:
+            continue
+        seen.add(final_jid)
+        name = (
+                contact.get("pushName") or
+                contact.get("name") or
+                contact.get("verifiedName") or
+                contact.get("notify")
+        )
+        items.append({
+            "id": final_jid,
+            "name": name or final_jid.split('@')[0],
+            "picture": contact.get("profilePictureUrl") or "",
+            "unread": 0,
+            "subtitle": final_jid.split('@')[0]
+        })
+    return items, "contacts"
+
+
+class ContactDirectoryCache:
+    def __init__(self):
+        self.directories: Dict[str, ContactDirectory] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.builds = 0
+        self.hits = 0
+
+    async def get(self, instance_name: str, api_token: str) -> ContactDirectory:
+        directory = self.directories.get(instance_name)
+        if directory and directory.fresh:
+            self.hits += 1
+            return directory
+
+        future = self._inflight.get(instance_name)
+        if future is None:
+            future = asyncio.ensure_future(self._build(instance_name, api_token))
+            self._inflight[instance_name] = future
+            future.add_done_callback(lambda _: self._inflight.pop(instance_name, None))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Evolution fora: melhor servir a lista antiga do que uma tela vazia
+            if directory:
+                print_error(f"Erro ao atualizar contatos de {instance_name}, usando cache antigo: {e}")
+                return directory
+            raise
+
+    async def _build(self, instance_name: str, api_token: str) -> ContactDirectory:
+        started = time.monotonic()
+        items, source = await _fetch_items(instance_name, api_token)
+        # Montar o índice de milhares de contatos leva centenas de ms: fora do event loop
+        directory = await asyncio.to_thread(ContactDirectory, items, source)
+        self.directories[instance_name] = directory
+        self.builds += 1
+        print_success(f"✅ Diretório de contatos {instance_name}: {len(items)} contatos reais "
+                      f"({source}, {(time.monotonic() - started) * 1000:.0f}ms)")
+        return directory
+
+    def invalidate(self, instance_name: Optional[str]):
+        """ Marca como vencido (a próxima leitura reconstrói; se a Evolution falhar, serve o antigo). """
+        directory = self.directories.get(instance_name) if instance_name else None
+        if directory:
+            directory.stale = True
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "instances": {name: {"contacts": len(d.items), "source": d.source, "fresh": d.fresh}
+                          for name, d in self.directories.items()},
+            "builds": self.builds,
+            "hits": self.hits
+        }
+
+
+# Instância global
+contact_directories = ContactDirectoryCache()
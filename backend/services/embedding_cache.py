@@ -0,0 +1,259 @@
+# Em backend/services/embedding_cache.py
+import os
+import time
+import array
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from core.shared import print_info, print_warning
+
+"""
+Cache persistente de embeddings, na frente do GoogleGenerativeAIEmbeddings.
+Antes o retriever embutia toda pergunta de novo e o create_db reembutia a base inteira a cada
+recriação - texto idêntico, chamada remota repetida. Agora:
+- chave = (modelo, sha256(texto)); o modelo inclui o tipo (query/document), porque o Gemini
+  gera vetores diferentes para retrieval_query e retrieval_document;
+- SQLite (EMBEDDING_CACHE_PATH, WAL) com o vetor em float32, e LRU em memória na frente
+  (EMBEDDING_CACHE_MEMORY_MAX vetores);
+- em lote, só os textos que faltam (sem repetição) vão ao Gemini, numa chamada só;
+- vetores de documento ficam (a base é finita); vetores de pergunta são podados pelo uso
+  mais antigo acima de EMBEDDING_CACHE_QUERY_MAX linhas por modelo.
+Usado pelo retriever do app (cerebro_ia.load_models) e pela ingestão (scripts/create_db.py).
+"""
+
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", str(Path(__file__).parent.parent.resolve() / "embedding_cache.sqlite3"))
+EMBEDDING_CACHE_MEMORY_MAX = int(os.getenv("EMBEDDING_CACHE_MEMORY_MAX", "10000"))
+EMBEDDING_CACHE_QUERY_MAX = int(os.getenv("EMBEDDING_CACHE_QUERY_MAX", "50000"))
+
+_SQLITE_BATCH = 500  # limite de parâmetros por IN (...)
+
+Key = Tuple[str, str]
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return array.array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    values = array.array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, memory_max: int = EMBEDDING_CACHE_MEMORY_MAX,
+                 query_max: int = EMBEDDING_CACHE_QUERY_MAX):
+        self.path = path
+        self.memory_max = memory_max
+        self.query_max = query_max
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._memory: "OrderedDict[Key, List[float]]" = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.remote_calls = 0
+        self.disk_errors = 0
+        self.pruned = 0
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if self._db is None:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                db = sqlite3.connect(self.path, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                db.execute("CREATE TABLE IF NOT EXISTS embeddings ("
+                           "model TEXT NOT NULL, sha TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL, "
+                           "used_at INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (model, sha)) WITHOUT ROWID")
+                if "used_at" not in {row[1] for row in db.execute("PRAGMA table_info(embeddings)")}:
+                    db.execute("ALTER TABLE embeddings ADD COLUMN used_at INTEGER NOT NULL DEFAULT 0")
+                db.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (model, used_at)")
+                db.commit()
+                self._db = db
+                print_info(f"🗄️ Cache de embeddings em {self.path}")
+            except sqlite3.Error as e:
+                self.disk_errors += 1
+                print_warning(f"⚠️ Cache de embeddings: não consegui abrir {self.path}, só memória: {e}")
+        return self._db
+
+    def _remember(self, key: Key, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, shas: Sequence[str]) -> Dict[str, List[float]]:
+        """ Bloqueante (disco). Devolve sha -> vetor só dos que já existem. """
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for sha in shas:
+                vector = self._memory.get((model, sha))
+                if vector is not None:
+                    self._memory.move_to_end((model, sha))
+                    found[sha] = vector
+            self.memory_hits += len(found)
+
+            missing = [sha for sha in shas if sha not in found]
+            db = self._conn() if missing else None
+            if db is None:
+                return found
+            try:
+                for start in range(0, len(missing), _SQLITE_BATCH):
+                    chunk = missing[start:start + _SQLITE_BATCH]
+                    rows = db.execute(
+                        f"SELECT sha, vector FROM embeddings WHERE model = ? AND sha IN ({','.join('?' * len(chunk))})",
+                        (model, *chunk)
+                    ).fetchall()
+                    for sha, blob in rows:
+                        vector = _unpack(blob)
+                        found[sha] = vector
+                        self._remember((model, sha), vector)
+                        self.disk_hits += 1
+                    if rows and model.endswith(":query"):
+                        # uso recente protege a pergunta da poda
+                        db.execute(f"UPDATE embeddings SET used_at = ? WHERE model = ? AND sha IN "
+                                   f"({','.join('?' * len(rows))})", (int(time.time()), model, *[r[0] for r in rows]))
+                        db.commit()
+            except sqlite3.Error as e:
+                self.disk_errors += 1
+                print_warning(f"⚠️ Cache de embeddings: falha na leitura: {e}")
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]):
+        """ Bloqueante (disco). """
+        with self._lock:
+            for sha, vector in vectors.items():
+                self._remember((model, sha), vector)
+            db = self._conn()
+            if db is None:
+                return
+            try:
+                now = int(time.time())
+                db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, sha, dim, vector, used_at) VALUES (?, ?, ?, ?, ?)",
+                    [(model, sha, len(vector), _pack(vector), now) for sha, vector in vectors.items()]
+                )
+                if model.endswith(":query"):
+                    self._prune(db, model)
+                db.commit()
+            except sqlite3.Error as e:
+                self.disk_errors += 1
+                print_warning(f"⚠️ Cache de embeddings: falha na gravação: {e}")
+
+    def _prune(self, db: sqlite3.Connection, model: str):
+        """ Perguntas são quase sempre de uso único: mantém só as query_max usadas mais recentemente. """
+        count = db.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (model,)).fetchone()[0]
+        excess = count - self.query_max
+        if excess <= 0:
+            return
+        # folga de 10% para não podar a cada inserção
+        excess += self.query_max // 10
+        cursor = db.execute("DELETE FROM embeddings WHERE model = ? AND sha IN "
+                            "(SELECT sha FROM embeddings WHERE model = ? ORDER BY used_at LIMIT ?)",
+                            (model, model, excess))
+        self.pruned += cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def metrics(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        entries = None
+        if self._db is not None:
+            try:
+                with self._lock:
+                    entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            except sqlite3.Error:
+                pass
+        return {
+            "path": self.path,
+            "entries": entries,
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 3) if total else None,
+            "remote_calls": self.remote_calls,
+            "pruned": self.pruned,
+            "disk_errors": self.disk_errors
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """ Embeddings do LangChain com cache; entra no lugar do GoogleGenerativeAIEmbeddings (Chroma, retriever). """
+
+    def __init__(self, inner: Embeddings, model: str, store: Optional[EmbeddingStore] = None):
+        self.inner = inner
+        self.model = model
+        self.store = store or embedding_store
+
+    def _plan(self, texts: Sequence[str], kind: str):
+        model = f"{self.model}:{kind}"
+        shas = [text_digest(t) for t in texts]
+        found = self.store.get_many(model, list(dict.fromkeys(shas)))
+        # textos repetidos no mesmo lote vão uma vez só
+        pending = {sha: text for sha, text in zip(shas, texts) if sha not in found}
+        self.store.misses += len(pending)
+        return model, shas, found, pending
+
+    def _finish(self, model: str, shas: List[str], found: Dict[str, List[float]], pending: Dict[str, str],
+                vectors: List[List[float]]) -> List[List[float]]:
+        computed = dict(zip(pending, (list(v) for v in vectors)))
+        if computed:
+            self.store.put_many(model, computed)
+        found.update(computed)
+        return [found[sha] for sha in shas]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        model, shas, found, pending = self._plan(texts, "document")
+        vectors = []
+        if pending:
+            self.store.remote_calls += 1
+            vectors = self.inner.embed_documents(list(pending.values()))
+            print_info(f"🧮 Embeddings: {len(pending)} calculados, {len(texts) - len(pending)} reaproveitados")
+        return self._finish(model, shas, found, pending, vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        model, shas, found, pending = self._plan([text], "query")
+        vectors = []
+        if pending:
+            self.store.remote_calls += 1
+            vectors = [self.inner.embed_query(text)]
+        return self._finish(model, shas, found, pending, vectors)[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        model, shas, found, pending = await asyncio.to_thread(self._plan, texts, "document")
+        vectors = []
+        if pending:
+            self.store.remote_calls += 1
+            vectors = await self.inner.aembed_documents(list(pending.values()))
+        return await asyncio.to_thread(self._finish, model, shas, found, pending, vectors)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        model, shas, found, pending = await asyncio.to_thread(self._plan, [text], "query")
+        vectors = []
+        if pending:
+            self.store.remote_calls += 1
+            vectors = [await self.inner.aembed_query(text)]
+        return (await asyncio.to_thread(self._finish, model, shas, found, pending, vectors))[0]
+
+
+# Instância global
+embedding_store = EmbeddingStore()
@@ -0,0 +1,130 @@
+# Em backend/services/evolution_client.py
+import os
+from typing import Dict, Optional
+
+import httpx
+
+from core.shared import print_info, print_success, print_warning
+from services.evolution_resilience import policy
+
+"""
+Cliente HTTP único (por processo) para toda a comunicação com a Evolution API.
+Reaproveita conexões (pool + keep-alive, HTTP/2 opcional) em vez de abrir
+um httpx.AsyncClient novo (TCP + TLS) a cada chamada.
+Toda chamada passa pela política de resiliência (services/evolution_resilience.py).
+"""
+
+EVOLUTION_API_URL = (os.getenv("EVOLUTION_API_URL") or "").rstrip("/")
+EVOLUTION_API_KEY = os.getenv("EVOLUTION_API_KEY")
+
+# Limites configuráveis do pool
+EVOLUTION_HTTP2 = os.getenv("EVOLUTION_HTTP2", "false").lower() in ("1", "true", "yes")
+EVOLUTION_MAX_CONNECTIONS = int(os.getenv("EVOLUTION_MAX_CONNECTIONS", "100"))
+EVOLUTION_MAX_KEEPALIVE = int(os.getenv("EVOLUTION_MAX_KEEPALIVE", "20"))
+EVOLUTION_KEEPALIVE_EXPIRY = float(os.getenv("EVOLUTION_KEEPALIVE_EXPIRY", "30"))
+EVOLUTION_TIMEOUT = float(os.getenv("EVOLUTION_TIMEOUT", "30"))
+EVOLUTION_CONNECT_TIMEOUT = float(os.getenv("EVOLUTION_CONNECT_TIMEOUT", "5"))
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class EvolutionClient:
+    def __init__(self, base_url: str = EVOLUTION_API_URL, default_api_key: Optional[str] = EVOLUTION_API_KEY):
+        self.base_url = base_url
+        self.default_api_key = default_api_key
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        """ Cria o pool (chamado no startup da aplicação). """
+        if self._client is None:
+            self._client = self._build_client()
+
+    async def close(self):
+        """ Fecha o pool (chamado no shutdown da aplicação). """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        http2 = EVOLUTION_HTTP2
+        if http2 and not _http2_available():
+            print_warning("⚠️ EVOLUTION_HTTP2 ativo mas o pacote 'h2' não está instalado. Usando HTTP/1.1.")
+            http2 = False
+
+        limits = httpx.Limits(
+            max_connections=EVOLUTION_MAX_CONNECTIONS,
+            max_keepalive_connections=EVOLUTION_MAX_KEEPALIVE,
+            keepalive_expiry=EVOLUTION_KEEPALIVE_EXPIRY
+        )
+        timeout = httpx.Timeout(EVOLUTION_TIMEOUT, connect=EVOLUTION_CONNECT_TIMEOUT)
+        print_success(f"🔗 Cliente Evolution pronto (http2={http2}, max_conn={EVOLUTION_MAX_CONNECTIONS})")
+        return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Fora do ciclo de vida do app (scripts, routers avulsos) o pool é criado sob demanda
+        if self._client is None:
+            print_info("🔗 Cliente Evolution criado sob demanda")
+            self._client = self._build_client()
+        return self._client
+
+    def headers(self, api_key: Optional[str] = None) -> Dict[str, str]:
+        """ Headers de autenticação da instância (token do tenant ou chave global). """
+        return {"apikey": api_key or self.default_api_key or "", "Content-Type": "application/json"}
+
+    def url(self, path: str) -> str:
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    async def request(self, method: str, path: str, api_key: Optional[str] = None,
+                      idempotent: Optional[bool] = None, **kwargs) -> httpx.Response:
+        """
+        Passa pela política de resiliência (circuit breaker, retries, hedge).
+        'idempotent' força/desliga retries; por padrão GET e consultas conhecidas são repetíveis.
+        """
+        headers = {**self.headers(api_key), **(kwargs.pop("headers", None) or {})}
+        url = self.url(path)
+        return await policy.execute(
+            method, url, lambda: self.client.request(method, url, headers=headers, **kwargs),
+            json_body=kwargs.get("json"), idempotent=idempotent
+        )
+
+    async def open_stream(self, method: str, path: str, api_key: Optional[str] = None,
+                          idempotent: Optional[bool] = None, **kwargs) -> httpx.Response:
+        """
+        Como request(), mas devolve a resposta com o corpo ainda não lido (stream=True), para
+        respostas grandes serem consumidas com json_stream.RecordStream. Respostas != 200 já
+        vêm lidas e fechadas. Quem recebe um 200 é responsável por consumir/fechar (aclose).
+        Sem hedge: a cópia perdedora deixaria uma conexão aberta.
+        """
+        headers = {**self.headers(api_key), **(kwargs.pop("headers", None) or {})}
+        url = self.url(path)
+
+        async def send() -> httpx.Response:
+            resp = await self.client.send(self.client.build_request(method, url, headers=headers, **kwargs), stream=True)
+            if resp.status_code != 200:
+                await resp.aread()
+            return resp
+
+        return await policy.execute(method, url, send, json_body=kwargs.get("json"),
+                                    idempotent=idempotent, hedge=False)
+
+    async def get(self, path: str, api_key: Optional[str] = None, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, api_key=api_key, **kwargs)
+
+    async def post(self, path: str, api_key: Optional[str] = None, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, api_key=api_key, **kwargs)
+
+    async def delete(self, path: str, api_key: Optional[str] = None, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", path, api_key=api_key, **kwargs)
+
+
+# Instância global (ciclo de vida controlado pelo startup/shutdown do main.py)
+evolution_client = EvolutionClient()
@@ -0,0 +1,128 @@
+# Em backend/services/evolution_limits.py
+import os
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from core.shared import print_info, print_warning
+
+"""
+Limite de concorrência + vazão por instância da Evolution API.
+Importação, sync e histórico compartilham o mesmo limitador da instância, então
+vários jobs simultâneos não multiplicam a carga sobre o mesmo número de WhatsApp.
+
+O limite é adaptativo (AIMD): sucesso aumenta 1 slot a cada 'limit' respostas boas;
+429 / 5xx / timeout corta o limite pela metade e pausa a instância (Retry-After se houver).
+"""
+
+EVOLUTION_INSTANCE_CONCURRENCY = int(os.getenv("EVOLUTION_INSTANCE_CONCURRENCY", "8"))
+EVOLUTION_INSTANCE_RATE = float(os.getenv("EVOLUTION_INSTANCE_RATE", "40"))  # requisições/s
+EVOLUTION_BACKOFF_BASE = float(os.getenv("EVOLUTION_BACKOFF_BASE", "0.5"))
+EVOLUTION_BACKOFF_MAX = float(os.getenv("EVOLUTION_BACKOFF_MAX", "30"))
+
+
+def _retry_after(resp: Optional[httpx.Response]) -> Optional[float]:
+    if resp is None:
+        return None
+    try:
+        return float(resp.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    def __init__(self, name: str, max_concurrency: int = EVOLUTION_INSTANCE_CONCURRENCY,
+                 rate_per_sec: float = EVOLUTION_INSTANCE_RATE):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.rate = rate_per_sec
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._tokens = max(1.0, rate_per_sec)
+        self._refilled_at = time.monotonic()
+        self._successes = 0
+        self._failures_in_row = 0
+        self._cond = asyncio.Condition()
+
+    def _refill(self, now: float):
+        if self.rate <= 0:
+            self._tokens = 1.0
+            return
+        self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    async def acquire(self):
+        async with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = None
+                if self.paused_until > now:
+                    wait = self.paused_until - now
+                elif self.in_flight < self.limit:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.in_flight += 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, ok: Optional[bool], retry_after: Optional[float] = None):
+        """ ok=None libera o slot sem ajustar o limite (ex: requisição cancelada). """
+        async with self._cond:
+            self.in_flight -= 1
+            if ok:
+                self._failures_in_row = 0
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self._successes = 0
+                    self.limit += 1
+            elif ok is False and self.paused_until <= time.monotonic():
+                # Falhas simultâneas da mesma rajada contam uma vez só
+                self._successes = 0
+                self._failures_in_row += 1
+                self.limit = max(1, self.limit // 2)
+                pause = retry_after or min(EVOLUTION_BACKOFF_MAX,
+                                           EVOLUTION_BACKOFF_BASE * (2 ** (self._failures_in_row - 1)))
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+                print_warning(f"🐢 Evolution '{self.name}' sob pressão: limite={self.limit}, pausa={pause:.1f}s")
+            self._cond.notify_all()
+
+    async def call(self, request: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """
+        Executa a requisição dentro de um slot da instância.
+        429/5xx e erros de rede contam como sinal de sobrecarga; a resposta (ou exceção) é devolvida intacta.
+        """
+        await self.acquire()
+        try:
+            resp = await request()
+        except asyncio.CancelledError:
+            await self.release(None)
+            raise
+        except Exception:
+            await self.release(False)
+            raise
+        overloaded = resp.status_code == 429 or resp.status_code >= 500
+        await self.release(not overloaded, _retry_after(resp) if overloaded else None)
+        return resp
+
+    def stats(self) -> Dict[str, float]:
+        return {"limit": self.limit, "max": self.max_concurrency, "in_flight": self.in_flight,
+                "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 2)}
+
+
+_LIMITERS: Dict[str, AdaptiveLimiter] = {}
+
+
+def get_instance_limiter(instance_name: str) -> AdaptiveLimiter:
+    limiter = _LIMITERS.get(instance_name)
+    if limiter is None:
+        limiter = _LIMITERS[instance_name] = AdaptiveLimiter(instance_name)
+        print_info(f"🚦 Limitador Evolution criado: {instance_name} (conc={limiter.max_concurrency}, rate={limiter.rate}/s)")
+    return limiter
@@ -0,0 +1,243 @@
+# Em backend/services/evolution_resilience.py
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from core.shared import print_info, print_warning
+
+"""
+Política de resiliência para as chamadas à Evolution API (aplicada pelo EvolutionClient):
+- Circuit breaker por instância: depois de N falhas seguidas (erro de rede/timeout/5xx) o
+  circuito abre e as chamadas falham na hora (EvolutionUnavailable) até o período de espera
+  passar; então UMA chamada de teste decide se fecha de novo.
+- Retries limitados com "decorrelated jitter", só para chamadas idempotentes (GET e as
+  consultas POST da Evolution: findMessages, findChats, ...). Envio de mensagem nunca repete.
+- Hedged reads: em leituras sensíveis à latência (connectionState, findMessages pequenos),
+  se a resposta demorar mais que o p95 recente, uma cópia é disparada e vale a primeira.
+"""
+
+EVOLUTION_BREAKER_FAILURES = int(os.getenv("EVOLUTION_BREAKER_FAILURES", "5"))
+EVOLUTION_BREAKER_OPEN_SECONDS = float(os.getenv("EVOLUTION_BREAKER_OPEN_SECONDS", "15"))
+EVOLUTION_RETRIES = int(os.getenv("EVOLUTION_RETRIES", "2"))
+EVOLUTION_RETRY_BASE = float(os.getenv("EVOLUTION_RETRY_BASE", "0.2"))
+EVOLUTION_RETRY_CAP = float(os.getenv("EVOLUTION_RETRY_CAP", "2"))
+EVOLUTION_RETRY_BUDGET = float(os.getenv("EVOLUTION_RETRY_BUDGET", "10"))
+EVOLUTION_HEDGE_MIN_DELAY = float(os.getenv("EVOLUTION_HEDGE_MIN_DELAY", "0.25"))
+EVOLUTION_HEDGE_DEFAULT_DELAY = float(os.getenv("EVOLUTION_HEDGE_DEFAULT_DELAY", "0.5"))
+# findMessages só é duplicado quando a página é pequena (páginas grandes custam caro no servidor)
+EVOLUTION_HEDGE_MAX_LIMIT = int(os.getenv("EVOLUTION_HEDGE_MAX_LIMIT", "100"))
+
+# Ações POST que são só leitura (seguras para repetir/duplicar)
+IDEMPOTENT_ACTIONS = {
+    "findMessages", "findChats", "findContacts", "findStatusMessage", "fetchProfilePictureUrl",
+    "getBase64FromMediaMessage", "connectionState", "fetchInstances", "findPicture"
+}
+HEDGED_ACTIONS = {"connectionState", "findMessages"}
+# Rotas sem instância (/instance/create, /instance/fetchInstances) usam um circuito próprio
+GLOBAL_KEY = "_global"
+
+
+class EvolutionUnavailable(httpx.TransportError):
+    """ Circuito aberto: a Evolution desta instância está falhando, nem tentamos. """
+
+    def __init__(self, instance: str, retry_after: float):
+        super().__init__(f"Evolution indisponível para '{instance}' (circuito aberto, tente em {retry_after:.0f}s)")
+        self.instance = instance
+        self.retry_after = retry_after
+
+
+def describe(url: str):
+    """ (ação, instância) a partir da URL: /chat/findMessages/<instancia> -> ("findMessages", "<instancia>"). """
+    parts = [p for p in urlparse(url).path.split("/") if p]
+    if len(parts) >= 3:
+        return parts[1], parts[2]
+    return (parts[-1] if parts else ""), GLOBAL_KEY
+
+
+def _is_failure(resp: Optional[httpx.Response]) -> bool:
+    return resp is None or resp.status_code >= 500
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.rejected = 0
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + EVOLUTION_BREAKER_OPEN_SECONDS - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and self.retry_after() <= 0:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record(self, ok: bool):
+        if self.state == self.HALF_OPEN:
+            self.probe_in_flight = False
+            if ok:
+                print_info(f"🟢 Circuito Evolution '{self.name}' fechado novamente")
+                self.state, self.failures = self.CLOSED, 0
+            else:
+                self._open()
+            return
+        if ok:
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.state == self.CLOSED and self.failures >= EVOLUTION_BREAKER_FAILURES:
+            self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        print_warning(f"🔴 Circuito Evolution '{self.name}' ABERTO por {EVOLUTION_BREAKER_OPEN_SECONDS:.0f}s "
+                      f"({self.failures} falhas seguidas)")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected,
+                "retry_after": round(self.retry_after(), 1) if self.state != self.CLOSED else 0}
+
+
+class ResiliencePolicy:
+    def __init__(self):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, deque] = {}
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def breaker(self, instance: str) -> CircuitBreaker:
+        if instance not in self.breakers:
+            self.breakers[instance] = CircuitBreaker(instance)
+        return self.breakers[instance]
+
+    def _hedge_delay(self, action: str) -> float:
+        samples = sorted(self.latencies.get(action) or [])
+        if len(samples) < 20:
+            return EVOLUTION_HEDGE_DEFAULT_DELAY
+        return max(EVOLUTION_HEDGE_MIN_DELAY, samples[int(len(samples) * 0.95) - 1])
+
+    def _observe(self, action: str, seconds: float):
+        self.latencies.setdefault(action, deque(maxlen=200)).append(seconds)
+
+    def _should_hedge(self, action: str, json_body: Any) -> bool:
+        if action not in HEDGED_ACTIONS:
+            return False
+        limit = json_body.get("limit") if isinstance(json_body, dict) else None
+        return not limit or limit <= EVOLUTION_HEDGE_MAX_LIMIT
+
+    async def _attempt(self, action: str, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        started = time.monotonic()
+        resp = await send()
+        self._observe(action, time.monotonic() - started)
+        return resp
+
+    async def _hedged(self, action: str, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """ Dispara a cópia se a primeira passar do p95; devolve a primeira resposta boa. """
+        primary = asyncio.ensure_future(self._attempt(action, send))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay(action))
+            if done:
+                return primary.result()
+
+            self.hedges += 1
+            backup = asyncio.ensure_future(self._attempt(action, send))
+            tasks.append(backup)
+            pending = set(tasks)
+            last_exc: Optional[BaseException] = None
+            last_resp: Optional[httpx.Response] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        last_exc = task.exception()
+                        continue
+                    resp = task.result()
+                    if not _is_failure(resp):
+                        if task is backup:
+                            self.hedge_wins += 1
+                        return resp
+                    last_resp = resp
+            if last_resp is not None:
+                return last_resp
+            raise last_exc
+        finally:
+            # A cópia perdedora (ou tudo, se quem chamou foi cancelado) é abortada
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def execute(self, method: str, url: str, send: Callable[[], Awaitable[httpx.Response]],
+                      json_body: Any = None, idempotent: Optional[bool] = None,
+                      hedge: Optional[bool] = None) -> httpx.Response:
+        action, instance = describe(url)
+        breaker = self.breaker(instance)
+        if idempotent is None:
+            idempotent = method.upper() == "GET" or action in IDEMPOTENT_ACTIONS
+        hedge = (idempotent and self._should_hedge(action, json_body)) if hedge is None else hedge
+        attempts = 1 + (EVOLUTION_RETRIES if idempotent else 0)
+
+        started = time.monotonic()
+        sleep = EVOLUTION_RETRY_BASE
+        for attempt in range(1, attempts + 1):
+            if not breaker.allow():
+                raise EvolutionUnavailable(instance, breaker.retry_after())
+
+            resp, error = None, None
+            try:
+                resp = await (self._hedged(action, send) if hedge else self._attempt(action, send))
+            except asyncio.CancelledError:
+                if breaker.state == CircuitBreaker.HALF_OPEN:
+                    breaker.probe_in_flight = False
+                raise
+            except httpx.HTTPError as e:
+                error = e
+
+            breaker.record(not _is_failure(resp))
+            if not _is_failure(resp):
+                return resp
+
+            out_of_budget = time.monotonic() - started + sleep > EVOLUTION_RETRY_BUDGET
+            if attempt == attempts or out_of_budget:
+                if error is not None:
+                    raise error
+                return resp
+
+            # Decorrelated jitter: sleep = min(cap, random(base, sleep * 3))
+            sleep = min(EVOLUTION_RETRY_CAP, random.uniform(EVOLUTION_RETRY_BASE, sleep * 3))
+            self.retries += 1
+            reason = f"{type(error).__name__}" if error is not None else f"HTTP {resp.status_code}"
+            print_warning(f"🔁 Evolution {action} ({instance}) falhou [{reason}], nova tentativa em {sleep:.2f}s")
+            await asyncio.sleep(sleep)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "breakers": {name: b.to_dict() for name, b in self.breakers.items()},
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_s": {action: round(self._hedge_delay(action), 3) for action in self.latencies}
+        }
+
+
+# Instância global (usada pelo EvolutionClient)
+policy = ResiliencePolicy()
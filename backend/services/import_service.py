@@ -0,0 +1,170 @@
+# Em backend/services/import_service.py
+import os
+import time
+import uuid
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+from core.shared import print_error, print_info, print_success, print_warning
+from core.state import CONVERSATION_STATE_STORE, STATE_LOCK
+from services.evolution_client import evolution_client
+from services.evolution_limits import get_instance_limiter
+from services.message_parser import merge_messages, parse_records
+from services.profile_resolver import profile_resolver
+from services.websocket_manager import manager
+
+"""
+Importação de conversas da Evolution em paralelo.
+- Busca mensagens + foto de várias conversas ao mesmo tempo, limitado pelo
+  limitador adaptativo da instância (services/evolution_limits.py).
+- Resultados são aplicados no CONVERSATION_STATE_STORE e persistidos em lotes
+  (um STATE_LOCK + um pipeline Redis por lote, não por conversa).
+- Progresso (done / failed / remaining) vai só para o WebSocket de quem pediu.
+"""
+
+IMPORT_MESSAGES_LIMIT = int(os.getenv("IMPORT_MESSAGES_LIMIT", "100"))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "16"))
+IMPORT_FLUSH_SIZE = int(os.getenv("IMPORT_FLUSH_SIZE", "25"))
+IMPORT_PROGRESS_INTERVAL = float(os.getenv("IMPORT_PROGRESS_INTERVAL", "0.5"))
+
+
+class ChatImporter:
+    def __init__(self, instance_name: str, api_token: str, username: str,
+                 persist: Callable[[List[str]], None], job_id: Optional[str] = None):
+        self.instance_name = instance_name
+        self.api_token = api_token
+        self.username = username
+        self.persist = persist
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.limiter = get_instance_limiter(instance_name)
+
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.imported = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._last_progress = 0.0
+
+    async def run(self, jids: List[str]) -> Dict[str, Any]:
+        jids = [jid for jid in dict.fromkeys(jids) if "@g.us" not in jid and "@broadcast" not in jid]
+        self.total = len(jids)
+        started = time.perf_counter()
+        print_info(f"📥 Import {self.job_id}: {self.total} conversas (instância {self.instance_name})")
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for jid in jids:
+            queue.put_nowait(jid)
+
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(min(IMPORT_WORKERS, self.total))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+            await self._flush()
+
+        elapsed = time.perf_counter() - started
+        print_success(f"✅ Import {self.job_id}: {self.imported} importadas, {self.failed} falhas em {elapsed:.1f}s")
+        await self._send_progress("import_finished", elapsed_s=round(elapsed, 2))
+        return self._progress_payload()
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            try:
+                jid = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                result = await self._fetch_chat(jid)
+                if result:
+                    self._pending.append(result)
+                self.done += 1
+            except Exception as exc:
+                self.failed += 1
+                print_error(f"   ❌ Erro processando {jid}: {exc}")
+
+            if len(self._pending) >= IMPORT_FLUSH_SIZE:
+                await self._flush()
+            await self._maybe_send_progress()
+
+    async def _fetch_chat(self, jid: str) -> Optional[Dict[str, Any]]:
+        """ Mensagens e foto em paralelo. None = nada a importar (sem mensagens). """
+        payload = {"where": {"key": {"remoteJid": jid}}, "limit": IMPORT_MESSAGES_LIMIT, "page": 1}
+        msgs_call = self.limiter.call(lambda: evolution_client.post(
+            f"/chat/findMessages/{self.instance_name}", api_key=self.api_token, json=payload
+        ))
+        pic_call = profile_resolver.picture(self.instance_name, jid, api_key=self.api_token)
+        resp, pic_resp = await asyncio.gather(msgs_call, pic_call, return_exceptions=True)
+
+        if isinstance(resp, Exception):
+            raise resp
+        if resp.status_code != 200:
+            # Melhor não ter a conversa do que ter lixo vazio consumindo banco
+            raise RuntimeError(f"Evolution respondeu {resp.status_code}")
+
+        records = resp.json().get("messages", {}).get("records", [])
+        if not records:
+            print_warning(f"   ⚠️ {jid}: Sem mensagens. Ignorando salvamento.")
+            return None
+
+        messages, push_name = parse_records(records)
+        # Foto é opcional (falha silenciosa)
+        avatar = "" if isinstance(pic_resp, Exception) else (pic_resp or "")
+
+        return {"jid": jid, "name": push_name or jid.split('@')[0], "avatar": avatar, "messages": messages}
+
+    async def _flush(self):
+        """ Aplica o lote pendente no store (um único STATE_LOCK) e persiste as conversas alteradas. """
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            changed = []
+            async with STATE_LOCK:
+                for item in batch:
+                    jid = item["jid"]
+                    existing = CONVERSATION_STATE_STORE.get(jid)
+                    if existing:
+                        final_msgs, new_msgs = merge_messages(existing.get("messages", []), item["messages"])
+                        if not new_msgs:
+                            continue
+                        existing["messages"] = final_msgs
+                        existing["lastUpdated"] = final_msgs[-1]["timestamp"] * 1000
+                        if item["name"]: existing["name"] = item["name"]
+                        if item["avatar"]: existing["avatar_url"] = item["avatar"]
+                    else:
+                        CONVERSATION_STATE_STORE[jid] = {
+                            "name": item["name"],
+                            "avatar_url": item["avatar"],
+                            "messages": item["messages"],
+                            "unread": False,
+                            "lastUpdated": item["messages"][-1]["timestamp"] * 1000
+                        }
+                    changed.append(jid)
+            self.imported += len(changed)
+            if changed:
+                try:
+                    self.persist(changed)
+                except Exception as e:
+                    print_error(f"Erro ao persistir lote de importação: {e}")
+
+    def _progress_payload(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "remaining": self.total - self.done - self.failed,
+            "imported": self.imported
+        }
+
+    async def _maybe_send_progress(self):
+        now = time.monotonic()
+        if now - self._last_progress >= IMPORT_PROGRESS_INTERVAL:
+            self._last_progress = now
+            await self._send_progress("import_progress")
+
+    async def _send_progress(self, event_type: str, **extra):
+        if self.username:
+            await manager.send_to_user(self.username, {"type": event_type, **self._progress_payload(), **extra})
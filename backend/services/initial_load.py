@@ -0,0 +1,145 @@
+# Em backend/services/initial_load.py
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from core.shared import print_info, print_success
+from core.state import CONVERSATION_STATE_STORE, conversation_lock
+from services.evolution_client import evolution_client
+from services.evolution_limits import get_instance_limiter
+from services.jobs import Job
+from services.json_stream import RecordStream
+from services.message_parser import merge_messages, parse_record
+from services.sync_service import advance_cursor
+from services.websocket_manager import manager
+
+"""
+Carga inicial progressiva de uma instância recém-conectada (roda como job de fundo).
+Percorre as páginas de findMessages da janela (mais recentes primeiro) e, a cada página,
+grava as conversas no store e já envia a linha de cada conversa NOVA para o WebSocket
+do vendedor, na ordem de recência. A lista fica utilizável na primeira página.
+As páginas são lidas em streaming: as primeiras conversas saem antes da página terminar de chegar.
+"""
+
+INITIAL_LOAD_WINDOW_HOURS = int(os.getenv("INITIAL_LOAD_WINDOW_HOURS", "48"))
+INITIAL_LOAD_PAGE_SIZE = int(os.getenv("INITIAL_LOAD_PAGE_SIZE", "200"))
+INITIAL_LOAD_MAX_PAGES = int(os.getenv("INITIAL_LOAD_MAX_PAGES", "50"))
+INITIAL_LOAD_MAX_CONVERSATIONS = int(os.getenv("INITIAL_LOAD_MAX_CONVERSATIONS", "100"))
+INITIAL_LOAD_MESSAGES_PER_CONVERSATION = int(os.getenv("INITIAL_LOAD_MESSAGES_PER_CONVERSATION", "40"))
+INITIAL_LOAD_STREAM_BATCH = int(os.getenv("INITIAL_LOAD_STREAM_BATCH", "50"))
+
+
+def _pick_jid(record: Dict[str, Any]) -> Optional[str]:
+    """ Entre remoteJid/remoteJidAlt, o JID de telefone (o menor). Ignora grupos, broadcast e LIDs. """
+    key = record.get("key", {})
+    possible = [j for j in (key.get("remoteJid"), key.get("remoteJidAlt")) if j]
+    valid = [j for j in possible if "@s.whatsapp.net" in j and "232" not in j[:3]]
+    if not valid:
+        return None
+    jid = min(valid, key=len)
+    number = jid.split('@')[0]
+    if not number.isdigit() or len(number) < 10 or len(number) > 15:
+        return None
+    return jid
+
+
+class InitialLoader:
+    def __init__(self, instance_name: str, api_token: str, username: Optional[str],
+                 persist: Callable[[List[str]], None], summarize: Callable[[str], Optional[Dict[str, Any]]]):
+        self.instance_name = instance_name
+        self.api_token = api_token
+        self.username = username
+        self.persist = persist
+        self.summarize = summarize
+        self.limiter = get_instance_limiter(instance_name)
+        self.seen: Dict[str, int] = {}  # jid -> ordem de descoberta (recência)
+
+    async def _notify(self, payload: Dict[str, Any]):
+        if self.username:
+            await manager.send_to_user(self.username, payload)
+
+    async def _open_page(self, since: int, page: int):
+        """ Resposta aberta (stream) da página; o corpo é consumido com RecordStream. """
+        resp = await self.limiter.call(lambda: evolution_client.open_stream(
+            "POST", f"/chat/findMessages/{self.instance_name}", api_key=self.api_token,
+            json={"where": {"messageTimestamp": {"$gte": since}}, "limit": INITIAL_LOAD_PAGE_SIZE, "page": page},
+            timeout=60.0
+        ))
+        if resp.status_code != 200:
+            raise RuntimeError(f"Erro ao buscar mensagens (Evolution {resp.status_code})")
+        return resp
+
+    async def _commit(self, jid: str, msgs: List[Dict[str, Any]], push_name: Optional[str]) -> bool:
+        """ Grava/mescla uma conversa. Retorna True se ela acabou de entrar no store. """
+        msgs.sort(key=lambda x: x["timestamp"])
+        async with conversation_lock(jid):
+            conversation = CONVERSATION_STATE_STORE.get(jid)
+            created = conversation is None
+            if created:
+                CONVERSATION_STATE_STORE[jid] = conversation = {
+                    "name": push_name or f"+{jid.split('@')[0]}",
+                    "avatar_url": "",  # Não buscar foto para ser mais rápido
+                    "messages": msgs[-INITIAL_LOAD_MESSAGES_PER_CONVERSATION:],
+                    "unread": False,
+                    "unreadCount": 0,
+                    "lastUpdated": msgs[-1]["timestamp"] * 1000 if msgs else int(time.time() * 1000)
+                }
+            else:
+                final_msgs, new_msgs = merge_messages(conversation.get("messages", []), msgs)
+                if new_msgs:
+                    conversation["messages"] = final_msgs[-INITIAL_LOAD_MESSAGES_PER_CONVERSATION:]
+                    conversation["lastUpdated"] = max(conversation.get("lastUpdated", 0),
+                                                      final_msgs[-1]["timestamp"] * 1000)
+                if push_name and conversation.get("name", "").startswith("+"):
+                    conversation["name"] = push_name
+            advance_cursor(conversation)
+        return created
+
+    async def _apply(self, job: Job, records: List[Dict[str, Any]]):
+        """ Um lote da página (já decodificado): agrupa, grava e anuncia as conversas novas. """
+        # Agrupa o lote por conversa (fora de lock), guardando a ordem de recência
+        by_jid: Dict[str, List[Dict[str, Any]]] = {}
+        names: Dict[str, str] = {}
+        for record in records:
+            jid = _pick_jid(record)
+            parsed = parse_record(record)
+            if not jid or not parsed:
+                continue
+            if jid not in self.seen:
+                if len(self.seen) >= INITIAL_LOAD_MAX_CONVERSATIONS:
+                    continue
+                self.seen[jid] = len(self.seen)
+            if record.get("pushName") and not record.get("key", {}).get("fromMe") and jid not in names:
+                names[jid] = record["pushName"]
+            by_jid.setdefault(jid, []).append(parsed)
+
+        changed = []
+        for jid in sorted(by_jid, key=lambda j: self.seen[j]):
+            created = await self._commit(jid, by_jid[jid], names.get(jid))
+            changed.append(jid)
+            if created:
+                summary = self.summarize(jid)
+                if summary:
+                    await self._notify({"type": "conversation_summary", "job_id": job.id, **summary})
+        if changed:
+            self.persist(changed)
+
+    async def run(self, job: Job) -> Dict[str, Any]:
+        since = int(time.time()) - INITIAL_LOAD_WINDOW_HOURS * 3600
+        job.progress = {"pages": 0, "messages": 0, "conversations": 0}
+        print_info(f"🚀 Carga inicial {job.id} para {self.instance_name} (desde {since})")
+
+        for page in range(1, INITIAL_LOAD_MAX_PAGES + 1):
+            stream = RecordStream("records")
+            async for records in stream.iterate(await self._open_page(since, page), min_batch=INITIAL_LOAD_STREAM_BATCH):
+                await self._apply(job, records)
+
+            job.progress = {"pages": page, "messages": job.progress["messages"] + stream.count,
+                            "conversations": len(self.seen)}
+            await self._notify({"type": "initial_load_progress", "job_id": job.id, **job.progress})
+
+            if stream.count < INITIAL_LOAD_PAGE_SIZE:
+                break
+
+        print_success(f"🎉 Carga inicial {job.id}: {len(self.seen)} conversas em {job.progress['pages']} páginas")
+        return {"loaded": len(self.seen), "period": f"últimas {INITIAL_LOAD_WINDOW_HOURS} horas", **job.progress}
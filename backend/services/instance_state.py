@@ -0,0 +1,112 @@
+# Em backend/services/instance_state.py
+import os
+import time
+import asyncio
+from typing import Any, Dict, Optional
+
+from core.shared import print_info
+from services.evolution_client import evolution_client
+
+"""
+Cache curto do estado de conexão das instâncias (instance/connectionState).
+- TTL curto (INSTANCE_STATE_TTL): dashboards com auto-refresh leem da memória.
+- Single-flight: N leituras simultâneas com cache vencido geram UMA chamada à Evolution.
+- Webhook CONNECTION_UPDATE atualiza o cache na hora (não precisa esperar o TTL).
+Só 200 e 404 são guardados; erros não entram no cache (a próxima leitura tenta de novo).
+"""
+
+INSTANCE_STATE_TTL = float(os.getenv("INSTANCE_STATE_TTL", "10"))
+# Estado vindo do webhook é confiável por mais tempo (a Evolution avisa a próxima mudança)
+INSTANCE_STATE_WEBHOOK_TTL = float(os.getenv("INSTANCE_STATE_WEBHOOK_TTL", "60"))
+
+
+class InstanceState:
+    def __init__(self, status_code: int, data: Dict[str, Any], ttl: float, source: str = "api"):
+        self.status_code = status_code
+        self.data = data
+        self.source = source
+        self.fetched_at = time.monotonic()
+        self.expires_at = self.fetched_at + ttl
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+    @property
+    def found(self) -> bool:
+        return self.status_code != 404
+
+    @property
+    def state(self) -> Optional[str]:
+        # Formato varia conforme a versão da Evolution
+        if not self.found:
+            return "close"
+        return (self.data.get("instance") or {}).get("state") or self.data.get("state")
+
+
+class InstanceStateCache:
+    def __init__(self):
+        self.entries: Dict[str, InstanceState] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, instance_name: str, api_key: Optional[str] = None) -> InstanceState:
+        """
+        Estado da instância (cacheado). Erros de rede / respostas != 200/404 sobem como exceção
+        ou como InstanceState com o status recebido (sem cache).
+        """
+        entry = self.entries.get(instance_name)
+        if entry and entry.fresh:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        future = self._inflight.get(instance_name)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(instance_name, api_key))
+            self._inflight[instance_name] = future
+            future.add_done_callback(lambda _: self._inflight.pop(instance_name, None))
+        # shield: se um leitor for cancelado, os outros continuam esperando a mesma busca
+        return await asyncio.shield(future)
+
+    async def _fetch(self, instance_name: str, api_key: Optional[str]) -> InstanceState:
+        resp = await evolution_client.get(f"/instance/connectionState/{instance_name}", api_key=api_key, timeout=10.0)
+        try:
+            data = resp.json() if resp.content else {}
+        except ValueError:
+            data = {"error": resp.text}
+        entry = InstanceState(resp.status_code, data if isinstance(data, dict) else {}, INSTANCE_STATE_TTL)
+        if resp.status_code in (200, 404):
+            self.entries[instance_name] = entry
+        return entry
+
+    def update_from_webhook(self, instance_name: Optional[str], data: Dict[str, Any]):
+        """ CONNECTION_UPDATE: {"instance": "...", "state": "open|close|connecting", ...} """
+        instance_name = instance_name or data.get("instance")
+        state = data.get("state")
+        if not instance_name or not state:
+            return
+        previous = self.entries.get(instance_name)
+        self.entries[instance_name] = InstanceState(
+            200, {"instance": {"instanceName": instance_name, "state": state}},
+            INSTANCE_STATE_WEBHOOK_TTL, source="webhook"
+        )
+        if not previous or previous.state != state:
+            print_info(f"📶 Instância {instance_name}: {previous.state if previous else '?'} -> {state} (webhook)")
+
+    def invalidate(self, instance_name: str):
+        self.entries.pop(instance_name, None)
+
+    def metrics(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "instances": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None
+        }
+
+
+# Instância global
+instance_states = InstanceStateCache()
@@ -0,0 +1,115 @@
+# Em backend/services/jobs.py
+import os
+import time
+import uuid
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from core.shared import print_error, print_info, print_warning
+
+"""
+Registro em memória de jobs de fundo (carga inicial, etc.).
+Cada job tem id, dono (usuário/empresa), status e progresso consultáveis por polling,
+e pode ser cancelado. Jobs terminados ficam disponíveis por JOB_RETENTION_SECONDS.
+"""
+
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class Job:
+    def __init__(self, kind: str, username: Optional[str] = None, tenant_id: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.username = username
+        self.tenant_id = tenant_id
+        self.status = PENDING
+        self.progress: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in (PENDING, RUNNING)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+class JobRegistry:
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+
+    def start(self, kind: str, runner: Callable[[Job], Awaitable[Any]],
+              username: Optional[str] = None, tenant_id: Optional[str] = None,
+              on_finish: Optional[Callable[[Job], Awaitable[None]]] = None) -> Job:
+        """ on_finish roda depois do status final (done/failed/cancelled) estar definido. """
+        self._prune()
+        job = Job(kind, username, tenant_id)
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, runner, on_finish))
+        print_info(f"🧵 Job {kind} iniciado: {job.id} (tenant={tenant_id})")
+        return job
+
+    async def _run(self, job: Job, runner: Callable[[Job], Awaitable[Any]],
+                   on_finish: Optional[Callable[[Job], Awaitable[None]]] = None):
+        job.status = RUNNING
+        try:
+            job.result = await runner(job)
+            job.status = DONE
+        except asyncio.CancelledError:
+            job.status = CANCELLED
+            print_warning(f"🛑 Job {job.kind} cancelado: {job.id}")
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            print_error(f"❌ Job {job.kind} falhou ({job.id}): {e}")
+        finally:
+            job.finished_at = time.time()
+        if on_finish:
+            try:
+                await on_finish(job)
+            except Exception as e:
+                print_error(f"Erro no on_finish do job {job.id}: {e}")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def find_active(self, kind: str, tenant_id: Optional[str]) -> Optional[Job]:
+        return next((j for j in self.jobs.values() if j.kind == kind and j.tenant_id == tenant_id and j.active), None)
+
+    def list(self, tenant_id: Optional[str] = None) -> List[Job]:
+        return [j for j in self.jobs.values() if tenant_id is None or j.tenant_id == tenant_id]
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if not job or not job.active or not job.task:
+            return False
+        job.task.cancel()
+        return True
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [j.id for j in self.jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            self.jobs.pop(job_id, None)
+
+
+# Instância global
+jobs = JobRegistry()
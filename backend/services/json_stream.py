@@ -0,0 +1,264 @@
+# Em backend/services/json_stream.py
+import re
+import json
+import base64
+import codecs
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+"""
+Parser JSON incremental para respostas grandes da Evolution (findMessages com centenas de
+registros). Em vez de baixar o corpo inteiro e chamar resp.json(), os bytes são lidos em
+pedaços e cada registro do array "records" é decodificado assim que chega (json.raw_decode,
+em C), então o chamador já pode agrupar/gravar o começo da página enquanto o resto trafega,
+e o corpo bruto nunca fica inteiro na memória junto com a versão decodificada.
+
+Os campos numéricos antes/depois do array (total, pages, currentPage) ficam em .meta.
+Base64Field faz o mesmo para o campo "base64" de getBase64FromMediaMessage (mídia grande);
+JsonStringField extrai um campo texto de um JSON que um LLM ainda está gerando (streaming).
+"""
+
+JSON_STREAM_CHUNK = 64 * 1024
+
+_SEEK, _ITEMS, _DONE = range(3)
+_WS = " \t\r\n,"
+_META = re.compile(r'"(\w+)"\s*:\s*(-?\d+)')
+
+
+class RecordStream:
+    def __init__(self, key: str = "records"):
+        self.key = key
+        self.meta: Dict[str, int] = {}
+        self.count = 0
+        self._start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._state = _SEEK
+
+    def _read_meta(self, text: str):
+        for name, value in _META.findall(text):
+            self.meta.setdefault(name, int(value))
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        """ Recebe mais bytes; devolve os registros que ficaram completos. """
+        buf = self._buf + self._utf8.decode(chunk)
+        pos = 0
+        records: List[Any] = []
+
+        if self._state == _SEEK:
+            match = self._start.search(buf)
+            if not match:
+                self._buf = buf
+                return records
+            self._read_meta(buf[:match.start()])
+            pos = match.end()
+            self._state = _ITEMS
+
+        if self._state == _ITEMS:
+            size = len(buf)
+            while True:
+                while pos < size and buf[pos] in _WS:
+                    pos += 1
+                if pos >= size:
+                    break
+                if buf[pos] == "]":
+                    self._state = _DONE
+                    pos += 1
+                    break
+                try:
+                    record, pos = self._decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    break  # registro incompleto: espera o próximo pedaço
+                records.append(record)
+
+        # Em _DONE o resto (metadados pequenos depois do array) fica todo em _buf: um valor
+        # como "pages": 12 pode vir partido entre pedaços, então só é lido no finish()
+        self._buf = buf[pos:]
+        self.count += len(records)
+        return records
+
+    def finish(self) -> List[Any]:
+        """ Fim do corpo. Resposta sem a chave esperada (lista pura, erro) é lida do jeito tradicional. """
+        self._buf += self._utf8.decode(b"", final=True)
+        if self._state == _DONE:
+            self._read_meta(self._buf)
+            self._buf = ""
+            return []
+        if self._state == _ITEMS:
+            raise ValueError(f"JSON truncado: array '{self.key}' não terminou ({self.count} registros lidos)")
+        if not self._buf.strip():
+            return []
+        payload = json.loads(self._buf)
+        self._buf = ""
+        self._state = _DONE
+        records = _find_key(payload, self.key)
+        if records is None and isinstance(payload, list):
+            records = payload
+        records = records or []
+        self.count += len(records)
+        return records
+
+    async def iterate(self, resp, min_batch: int = 1) -> AsyncIterator[List[Any]]:
+        """
+        Lê um httpx.Response aberto com stream=True e entrega lotes de pelo menos 'min_batch'
+        registros (o último pode ser menor). Fecha a resposta no fim ou se o consumidor parar.
+        """
+        pending: List[Any] = []
+        try:
+            async for chunk in resp.aiter_bytes(JSON_STREAM_CHUNK):
+                pending.extend(self.feed(chunk))
+                if len(pending) >= min_batch:
+                    yield pending
+                    pending = []
+            pending.extend(self.finish())
+            if pending:
+                yield pending
+        finally:
+            await resp.aclose()
+
+
+def _find_key(payload: Any, key: str) -> Optional[List[Any]]:
+    if isinstance(payload, dict):
+        if isinstance(payload.get(key), list):
+            return payload[key]
+        for value in payload.values():
+            found = _find_key(value, key)
+            if found is not None:
+                return found
+    return None
+
+
+class Base64Field:
+    """
+    Decodifica em streaming o campo base64 de um JSON (resposta de getBase64FromMediaMessage).
+    feed() devolve os bytes já decodificados de cada pedaço; o resto do JSON (mimetype,
+    fileName, ...) é guardado sem o valor gigante e fica em .envelope depois de finish().
+    Nunca existe na memória nem a string base64 inteira nem o arquivo inteiro.
+    """
+
+    def __init__(self, key: str = "base64"):
+        self.key = key
+        self.envelope: Dict[str, Any] = {}
+        self.size = 0
+        self._start = re.compile(r'"%s"\s*:\s*"' % re.escape(key))
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._parts: List[str] = []  # JSON fora do valor base64
+        self._pending = ""
+        self._carry = ""
+        self._state = _SEEK
+
+    def _decode(self, value: str, final: bool = False) -> bytes:
+        # "\/" (escape opcional do JSON) vira "/"; base64 decodifica em blocos de 4 caracteres
+        data = self._carry + value.replace("\\", "")
+        usable = len(data) if final else len(data) - len(data) % 4
+        self._carry = data[usable:]
+        if not usable:
+            return b""
+        chunk = data[:usable]
+        if final:
+            chunk += "=" * (-len(chunk) % 4)
+        decoded = base64.b64decode(chunk)
+        self.size += len(decoded)
+        return decoded
+
+    def feed(self, chunk: bytes) -> bytes:
+        text = self._utf8.decode(chunk)
+        out: List[bytes] = []
+        while text:
+            if self._state == _SEEK:
+                buf = self._pending + text
+                match = self._start.search(buf)
+                if not match:
+                    self._pending, text = buf, ""
+                    break
+                self._parts.append(buf[:match.end()])
+                self._pending, text = "", buf[match.end():]
+                self._state = _ITEMS
+            elif self._state == _ITEMS:
+                end = text.find('"')
+                if end == -1:
+                    out.append(self._decode(text))
+                    text = ""
+                else:
+                    out.append(self._decode(text[:end]))
+                    text = text[end:]
+                    self._state = _DONE
+            else:
+                self._parts.append(text)
+                text = ""
+        return b"".join(out)
+
+    def finish(self) -> bytes:
+        """ Fim do corpo: decodifica a sobra e monta .envelope. Sem o campo, devolve b"". """
+        tail = self._decode("", final=True) if self._state != _SEEK else b""
+        text = "".join(self._parts) + self._pending + self._utf8.decode(b"", final=True)
+        if text.strip():
+            try:
+                self.envelope = json.loads(text)
+            except ValueError:
+                self.envelope = {}
+        return tail
+
+
+_HIGH_SURROGATE = re.compile(r'\\u[dD][89abAB][0-9a-fA-F]{2}$')
+
+
+def _is_escape(buf: str, index: int) -> bool:
+    """ A barra em buf[index] inicia um escape (não é a segunda de um "\\\\")? """
+    start = index
+    while start > 0 and buf[start - 1] == "\\":
+        start -= 1
+    return (index - start) % 2 == 0
+
+
+class JsonStringField:
+    """
+    Extrai, à medida que o texto chega (tokens de um LLM), o valor string de uma chave de um
+    JSON ainda incompleto: feed() devolve só o trecho novo já decodificado (escapes \\n, \\",
+    \\uXXXX). Escapes cortados no meio ficam guardados até o próximo pedaço.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.done = False
+        self._start = re.compile(r'"%s"\s*:\s*"' % re.escape(key))
+        self._pending = ""
+        self._found = False
+
+    def feed(self, text: str) -> str:
+        if self.done or not text:
+            return ""
+        buf = self._pending + text
+        if not self._found:
+            match = self._start.search(buf)
+            if not match:
+                self._pending = buf
+                return ""
+            self._found = True
+            buf = buf[match.end():]
+
+        escaped = False
+        end = None
+        for i, ch in enumerate(buf):
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                end = i
+                break
+
+        if end is not None:
+            safe, self._pending, self.done = buf[:end], "", True
+        else:
+            cut = len(buf)
+            if escaped:
+                cut -= 1  # termina em "\"
+            else:
+                tail = buf.rfind("\\u", max(0, cut - 5))
+                if tail != -1 and _is_escape(buf, tail) and cut - tail < 6:
+                    cut = tail  # \uXX incompleto
+            if _HIGH_SURROGATE.search(buf[:cut]) and _is_escape(buf, cut - 6):
+                cut -= 6  # espera a outra metade do par (emoji)
+            safe, self._pending = buf[:cut], buf[cut:]
+        return json.loads(f'"{safe}"') if safe else ""
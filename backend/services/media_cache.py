@@ -0,0 +1,477 @@
+# Em backend/services/media_cache.py
+import os
+import hmac
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import secrets
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple, Union
+from urllib.parse import quote
+
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+
+from core.shared import print_error, print_info, print_warning
+from services.evolution_client import evolution_client
+from services.json_stream import JSON_STREAM_CHUNK, Base64Field
+
+"""
+Cache de mídia em disco, endereçado por conteúdo (sha256 dos bytes decodificados).
+- blobs/<aa>/<sha256>: o arquivo em si (uma cópia por conteúdo, mesmo que várias mensagens
+  apontem para ele - mídia encaminhada, figurinhas repetidas);
+- refs/<aa>/<sha256(chave)>.json: chave (instância:id da mensagem) -> {sha256, mimetype, size}.
+O fileSha256 do WhatsApp é o sha256 do arquivo decifrado, então quando a mensagem o traz
+dá para achar o blob sem nem saber a chave.
+
+Escritas atômicas (arquivo temporário + os.replace), limite total em bytes com despejo LRU
+(ordem de acesso em memória, reconstruída pelo mtime ao subir) e ETag = sha256.
+O download da Evolution é decodificado em streaming (base64 por pedaços direto para o
+arquivo) e o arquivo é servido com FileResponse, que já atende Range (206) para seek.
+Tudo que toca o disco roda fora do event loop (load / alookup / to_thread), e o blob que está
+sendo servido fica "preso" (pin) para o despejo não apagá-lo no meio da resposta.
+"""
+
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "cosmos-media-cache"))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_MB", "1024")) * 1024 * 1024
+# Mídia do WhatsApp não muda: o navegador pode guardar por bastante tempo (revalida com ETag)
+MEDIA_CACHE_BROWSER_MAX_AGE = int(os.getenv("MEDIA_CACHE_BROWSER_MAX_AGE", str(7 * 86400)))
+# Links assinados para <audio>/<video> (o player pede Range direto pela URL, sem header de auth)
+MEDIA_LINK_TTL = int(os.getenv("MEDIA_LINK_TTL", "3600"))
+# Sem segredo configurado, uma chave aleatória por processo (links antigos expiram no restart)
+MEDIA_LINK_SECRET = os.getenv("MEDIA_LINK_SECRET") or os.getenv("SECRET_KEY") or secrets.token_hex(32)
+# Pin de um blob em uso expira sozinho (resposta abortada sem chamar unpin não o prende para sempre)
+MEDIA_PIN_SECONDS = float(os.getenv("MEDIA_PIN_SECONDS", "600"))
+
+
+class MediaDownloadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class CachedMedia:
+    __slots__ = ("sha256", "path", "mimetype", "size")
+
+    def __init__(self, sha256: str, path: str, mimetype: str, size: int):
+        self.sha256 = sha256
+        self.path = path
+        self.mimetype = mimetype
+        self.size = size
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.sha256}"'
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """ If-None-Match (pode vir lista, W/ ou *). """
+        if not if_none_match:
+            return False
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or self.etag in tags
+
+    def headers(self) -> Dict[str, str]:
+        return {"ETag": self.etag, "Cache-Control": f"private, max-age={MEDIA_CACHE_BROWSER_MAX_AGE}, immutable"}
+
+
+def media_fingerprint(message: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """ (fileSha256 em hex, mimetype) de uma mensagem de mídia da Evolution, se existirem. """
+    content = message.get("message") or {}
+    mimetype = None
+    for value in content.values():
+        if isinstance(value, dict) and not mimetype:
+            mimetype = value.get("mimetype")
+        if isinstance(value, dict) and value.get("fileSha256"):
+            raw = value["fileSha256"]
+            try:
+                if isinstance(raw, dict):  # Buffer serializado {"0": 12, "1": 200, ...}
+                    raw = bytes(raw[k] for k in sorted(raw, key=int))
+                else:
+                    raw = base64.b64decode(raw)
+            except (ValueError, TypeError, KeyError):
+                return None, value.get("mimetype")
+            return raw.hex(), value.get("mimetype")
+    return None, mimetype
+
+
+class MediaCache:
+    def __init__(self, root: str = MEDIA_CACHE_DIR, max_bytes: int = MEDIA_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, int]" = OrderedDict()  # sha256 -> tamanho (mais antigo primeiro)
+        self._refs: Dict[str, CachedMedia] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.downloads = 0
+        self._loaded = False
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pins: Dict[str, Tuple[int, float]] = {}  # sha256 -> (respostas em andamento, expira em)
+
+    # --- Layout ---
+
+    def _blob_path(self, sha: str) -> str:
+        return os.path.join(self.root, "blobs", sha[:2], sha)
+
+    def _ref_path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.root, "refs", digest[:2], f"{digest}.json")
+
+    def _load(self):
+        """ Reconstrói a ordem LRU a partir do disco (mtime = último acesso). """
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            blobs = []
+            for dirpath, _, files in os.walk(os.path.join(self.root, "blobs")):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue
+                    try:
+                        st = os.stat(os.path.join(dirpath, name))
+                        blobs.append((st.st_mtime, name, st.st_size))
+                    except OSError:
+                        pass
+            for _, sha, size in sorted(blobs):
+                self._lru[sha] = size
+                self.total_bytes += size
+            self._loaded = True
+        if blobs:
+            print_info(f"🗄️ Cache de mídia: {len(blobs)} arquivos, {self.total_bytes / 1024 / 1024:.1f}MB em {self.root}")
+
+    async def load(self):
+        """ Varredura inicial do disco numa thread (chamar no startup). """
+        await asyncio.to_thread(self._load)
+
+    @staticmethod
+    def _write_tmp(path: str, data: bytes) -> str:
+        """ Temporário ao lado de 'path' (mesmo disco, para o os.replace ser atômico). """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        return tmp
+
+    @classmethod
+    def _atomic_write(cls, path: str, data: bytes):
+        tmp = cls._write_tmp(path, data)
+        try:
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    # --- Leitura ---
+
+    def _touch(self, sha: str) -> bool:
+        with self._lock:
+            if sha not in self._lru:
+                return False
+            self._lru.move_to_end(sha)
+        try:
+            os.utime(self._blob_path(sha))
+        except OSError:
+            with self._lock:
+                self.total_bytes -= self._lru.pop(sha, 0)
+            return False
+        return True
+
+    def lookup(self, key: str, content_sha: Optional[str] = None, mimetype: Optional[str] = None) -> Optional[CachedMedia]:
+        """
+        Por chave (instância:mensagem) ou direto pelo hash do conteúdo (fileSha256).
+        Bloqueante (disco): dentro do event loop use alookup.
+        """
+        self._load()
+        with self._lock:
+            entry = self._refs.get(key)
+        if entry is None:
+            try:
+                with open(self._ref_path(key)) as f:
+                    ref = json.load(f)
+                entry = CachedMedia(ref["sha256"], self._blob_path(ref["sha256"]), ref["mimetype"], ref["size"])
+            except (OSError, ValueError, KeyError):
+                entry = None
+        if entry is None and content_sha:
+            with self._lock:
+                size = self._lru.get(content_sha)
+            if size is not None:
+                entry = CachedMedia(content_sha, self._blob_path(content_sha),
+                                    mimetype or "application/octet-stream", size)
+
+        if entry is not None and self._touch(entry.sha256):
+            with self._lock:
+                self._refs[key] = entry
+                self.hits += 1
+            return entry
+        with self._lock:
+            self._refs.pop(key, None)
+            self.misses += 1
+        return None
+
+    async def alookup(self, key: str, content_sha: Optional[str] = None,
+                      mimetype: Optional[str] = None) -> Optional[CachedMedia]:
+        return await asyncio.to_thread(self.lookup, key, content_sha, mimetype)
+
+    def pin(self, entry: CachedMedia):
+        """ Blob sendo servido: o despejo pula até o unpin (ou MEDIA_PIN_SECONDS). """
+        with self._lock:
+            count, _ = self._pins.get(entry.sha256, (0, 0.0))
+            self._pins[entry.sha256] = (count + 1, time.monotonic() + MEDIA_PIN_SECONDS)
+
+    def unpin(self, sha: str):
+        with self._lock:
+            count, expires_at = self._pins.pop(sha, (0, 0.0))
+            if count > 1:
+                self._pins[sha] = (count - 1, expires_at)
+
+    def _pinned(self, sha: str, now: float) -> bool:
+        """ Chamar com self._lock. """
+        pin = self._pins.get(sha)
+        if pin is None:
+            return False
+        if pin[1] < now:
+            del self._pins[sha]
+            return False
+        return True
+
+    def read(self, entry: CachedMedia) -> bytes:
+        with open(entry.path, "rb") as f:
+            return f.read()
+
+    def serve(self, entry: CachedMedia, request: Request) -> Response:
+        """ 304 se o navegador já tem (ETag); senão o arquivo, com Range (206) para seek de áudio/vídeo. """
+        if entry.matches(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=entry.headers())
+        # pin: o despejo LRU não apaga o blob enquanto a resposta é enviada
+        self.pin(entry)
+        return FileResponse(entry.path, media_type=entry.mimetype, headers=entry.headers(),
+                            background=BackgroundTask(self.unpin, entry.sha256))
+
+    # --- Escrita ---
+
+    def put(self, key: str, data: bytes, mimetype: Optional[str]) -> CachedMedia:
+        """ Bloqueante (I/O de disco): chamar via asyncio.to_thread / run_in_threadpool. """
+        self._load()
+        sha = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(sha)
+        with self._lock:
+            exists = sha in self._lru
+        entry = self._register(key, sha, len(data), mimetype, None if exists else self._write_tmp(path, data))
+        if entry is None:
+            # despejado entre a checagem e o registro: grava de novo
+            entry = self._register(key, sha, len(data), mimetype, self._write_tmp(path, data))
+        return entry
+
+    def writer(self) -> "BlobWriter":
+        self._load()
+        return BlobWriter(self)
+
+    async def put_stream(self, key: str, chunks: AsyncIterator[bytes],
+                         mimetype: Union[str, Callable[[], Optional[str]], None]) -> CachedMedia:
+        """
+        Grava pedaços à medida que chegam (arquivo temporário + sha256 incremental) e só no fim
+        move para blobs/<sha256>. 'mimetype' pode ser uma função (conhecido só no fim do corpo).
+        """
+        writer = self.writer()
+        try:
+            async for chunk in chunks:
+                await writer.write(chunk)
+            return await writer.commit(key, mimetype() if callable(mimetype) else mimetype)
+        except BaseException:
+            writer.abort()
+            raise
+
+    def _register(self, key: str, sha: str, size: int, mimetype: Optional[str],
+                  tmp: Optional[str] = None) -> Optional[CachedMedia]:
+        """
+        Coloca o blob ('tmp' -> blobs/<sha256>) e o põe na LRU no mesmo lock em que o _evict
+        tira e apaga: o despejo nunca apaga um arquivo recém-colocado. Sem 'tmp' e com o blob
+        já despejado, devolve None (quem chamou precisa gravar de novo).
+        """
+        mimetype = mimetype or "application/octet-stream"
+        with self._lock:
+            if tmp is not None:
+                os.replace(tmp, self._blob_path(sha))
+            elif sha not in self._lru:
+                return None
+            if sha in self._lru:
+                self._lru.move_to_end(sha)
+            else:
+                self._lru[sha] = size
+                self.total_bytes += size
+        self._atomic_write(self._ref_path(key), json.dumps(
+            {"sha256": sha, "mimetype": mimetype, "size": size, "key": key}).encode())
+        entry = CachedMedia(sha, self._blob_path(sha), mimetype, size)
+        with self._lock:
+            self._refs[key] = entry
+        self._evict(keep=sha)
+        return entry
+
+    def _evict(self, keep: Optional[str] = None):
+        while True:
+            with self._lock:
+                if self.total_bytes <= self.max_bytes or len(self._lru) <= 1:
+                    return
+                now = time.monotonic()
+                # o mais antigo que não é o recém-gravado nem está sendo servido
+                sha = next((s for s in self._lru if s != keep and not self._pinned(s, now)), None)
+                if sha is None:
+                    return
+                size = self._lru.pop(sha)
+                self.total_bytes -= size
+                self.evictions += 1
+                # Ainda no lock: um put concorrente do mesmo conteúdo só recoloca o arquivo depois
+                try:
+                    os.unlink(self._blob_path(sha))
+                except OSError as e:
+                    print_warning(f"⚠️ Cache de mídia: não consegui remover {sha[:12]}: {e}")
+                # refs que apontavam para este blob viram miss na próxima leitura
+                for ref_key in [k for k, v in self._refs.items() if v.sha256 == sha]:
+                    del self._refs[ref_key]
+
+    # --- Download (Evolution -> cache) ---
+
+    async def fetch(self, instance_name: str, message: Dict[str, Any], api_key: Optional[str] = None) -> CachedMedia:
+        """
+        Mídia de uma mensagem ({"key": {"id": ...}, ...}): do disco se já baixada, senão via
+        getBase64FromMediaMessage (uma única chamada por mensagem, mesmo com vários pedidos juntos).
+        """
+        message_id = (message.get("key") or {}).get("id")
+        if not message_id:
+            raise MediaDownloadError(400, "Mensagem sem key.id")
+        key = f"{instance_name}:{message_id}"
+        content_sha, mimetype = media_fingerprint(message)
+        entry = await self.alookup(key, content_sha, mimetype)
+        if entry:
+            return entry
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._download(key, instance_name, message, api_key))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _download(self, key: str, instance_name: str, message: Dict[str, Any],
+                        api_key: Optional[str]) -> CachedMedia:
+        """ Lê a resposta em streaming e decodifica o base64 por pedaços direto para o disco. """
+        resp = await evolution_client.open_stream(
+            "POST", f"/chat/getBase64FromMediaMessage/{instance_name}", api_key=api_key,
+            json={"message": message, "convertToMp4": False}, timeout=60.0
+        )
+        if resp.status_code not in (200, 201):
+            print_error(f"❌ Evolution retornou status {resp.status_code} ao baixar mídia: {resp.text[:200]}")
+            raise MediaDownloadError(resp.status_code, f"Erro ao baixar mídia: {resp.text}")
+
+        field = Base64Field("base64")
+
+        async def decoded() -> AsyncIterator[bytes]:
+            try:
+                async for chunk in resp.aiter_bytes(JSON_STREAM_CHUNK):
+                    yield field.feed(chunk)
+                yield field.finish()
+            finally:
+                await resp.aclose()
+
+        try:
+            entry = await self.put_stream(key, decoded(), lambda: field.envelope.get("mimetype"))
+        except MediaDownloadError:
+            raise MediaDownloadError(502, "Evolution não retornou 'base64'")
+        except ValueError as e:  # base64 corrompido
+            raise MediaDownloadError(502, f"base64 inválido: {e}")
+        self.downloads += 1
+        return entry
+
+    # --- Links assinados (<audio>/<video> não mandam Authorization) ---
+
+    def sign(self, instance_name: str, message_id: str, expires: int) -> str:
+        payload = f"{instance_name}:{message_id}:{expires}".encode()
+        return hmac.new(MEDIA_LINK_SECRET.encode(), payload, hashlib.sha256).hexdigest()[:32]
+
+    def link(self, instance_name: str, message_id: str) -> str:
+        expires = int(time.time()) + MEDIA_LINK_TTL
+        return (f"/media/{quote(instance_name, safe='')}/{quote(message_id, safe='')}"
+                f"?exp={expires}&sig={self.sign(instance_name, message_id, expires)}")
+
+    def verify(self, instance_name: str, message_id: str, expires: int, signature: str) -> bool:
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self.sign(instance_name, message_id, expires), signature or "")
+
+    def stats(self) -> Dict[str, Any]:
+        self._load()
+        total = self.hits + self.misses
+        return {
+            "dir": self.root,
+            "files": len(self._lru),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+            "evictions": self.evictions,
+            "downloads": self.downloads
+        }
+
+
+class BlobWriter:
+    """
+    Arquivo em construção dentro do cache: write() a cada pedaço, commit() quando a chave e o
+    mimetype forem conhecidos (às vezes só no fim do corpo, como no webhook), abort() se der erro.
+    """
+
+    def __init__(self, cache: MediaCache):
+        self.cache = cache
+        tmp_dir = os.path.join(cache.root, "blobs")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=tmp_dir, suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+        self._digest = hashlib.sha256()
+        self.size = 0
+
+    async def write(self, chunk: bytes):
+        if not chunk:
+            return
+        self._digest.update(chunk)
+        self.size += len(chunk)
+        await asyncio.to_thread(self._file.write, chunk)
+
+    async def commit(self, key: str, mimetype: Optional[str]) -> CachedMedia:
+        self._file.close()
+        if not self.size:
+            self.abort()
+            raise MediaDownloadError(502, "Mídia vazia (sem bytes decodificados)")
+        sha = self._digest.hexdigest()
+        os.makedirs(os.path.dirname(self.cache._blob_path(sha)), exist_ok=True)
+        return await asyncio.to_thread(self.cache._register, key, sha, self.size, mimetype, self.tmp)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.unlink(self.tmp)
+        except OSError:
+            pass
+
+
+# Instância global
+media_cache = MediaCache()
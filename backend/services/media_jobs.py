@@ -0,0 +1,262 @@
+# Em backend/services/media_jobs.py
+import os
+import time
+import asyncio
+import itertools
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from core.shared import print_error, print_info, print_warning
+from services.jobs import CANCELLED, DONE, FAILED, JOB_RETENTION_SECONDS, PENDING, RUNNING
+from services.media_cache import MediaDownloadError
+from services.media_service import media_service
+
+"""
+Fila de processamento de mídia (transcrição/descrição via Gemini).
+Antes cada áudio/imagem/vídeo do webhook virava uma background task solta, e uma rajada de
+áudios enchia o thread pool padrão e travava o resto do app. Agora:
+- MEDIA_WORKERS workers fixos (e o MediaService usa um executor próprio do mesmo tamanho);
+- prioridade: áudio curto > imagem > áudio longo > documento > vídeo (dentro da classe,
+  o mais curto primeiro, depois ordem de chegada);
+- dedup por instância:id da mensagem (webhook repetido não processa duas vezes);
+- retentativas com backoff exponencial para erros transitórios;
+- status por mensagem e métricas da fila consultáveis pela API.
+"""
+
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "3"))
+MEDIA_QUEUE_MAX = int(os.getenv("MEDIA_QUEUE_MAX", "1000"))
+MEDIA_JOB_RETRIES = int(os.getenv("MEDIA_JOB_RETRIES", "2"))
+MEDIA_JOB_RETRY_DELAY = float(os.getenv("MEDIA_JOB_RETRY_DELAY", "5"))
+MEDIA_SHORT_AUDIO_SECONDS = int(os.getenv("MEDIA_SHORT_AUDIO_SECONDS", "60"))
+
+# Erros da Evolution que não adianta repetir (mensagem não existe / payload inválido)
+_PERMANENT_STATUS = {400, 401, 403, 404}
+
+ResultCallback = Callable[["MediaJob", str], Awaitable[None]]
+
+
+def media_priority(media_type: str, seconds: Optional[int]) -> int:
+    media_type = (media_type or "").lower()
+    if "audio" in media_type:
+        return 0 if (seconds or 0) <= MEDIA_SHORT_AUDIO_SECONDS else 2
+    if "image" in media_type or "sticker" in media_type:
+        return 1
+    if "video" in media_type:
+        return 4
+    return 3
+
+
+class MediaJob:
+    def __init__(self, instance_name: str, message_id: str, media_type: str, jid: Optional[str],
+                 seconds: Optional[int], api_key: Optional[str], content_sha: Optional[str] = None,
+                 tenant_id: Optional[str] = None):
+        self.instance_name = instance_name
+        self.message_id = message_id
+        self.media_type = media_type
+        self.jid = jid
+        self.seconds = seconds
+        self.api_key = api_key
+        self.content_sha = content_sha
+        self.tenant_id = tenant_id
+        self.priority = media_priority(media_type, seconds)
+        self.status = PENDING
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.result: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.instance_name}:{self.message_id}"
+
+    @property
+    def active(self) -> bool:
+        return self.status in (PENDING, RUNNING)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "message_id": self.message_id,
+            "jid": self.jid,
+            "media_type": self.media_type,
+            "seconds": self.seconds,
+            "priority": self.priority,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "chars": len(self.result) if self.result else 0,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+class MediaScheduler:
+    def __init__(self, workers: int = MEDIA_WORKERS):
+        self.workers = workers
+        self.jobs: Dict[str, MediaJob] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+        self._retry_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._on_result: Optional[ResultCallback] = None
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.attempts = 0
+        self._started = 0
+        self._wait_total = 0.0
+        self._run_total = 0.0
+
+    # --- Ciclo de vida ---
+
+    def start(self, on_result: ResultCallback):
+        if self._tasks:
+            return
+        self._on_result = on_result
+        self._queue = asyncio.PriorityQueue(maxsize=MEDIA_QUEUE_MAX)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print_info(f"🎬 Fila de mídia iniciada ({self.workers} workers, {MEDIA_JOB_RETRIES} retentativas)")
+
+    async def stop(self):
+        for handle in self._retry_timers.values():
+            handle.cancel()
+        self._retry_timers.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in self.jobs.values():
+            if job.active:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+
+    # --- Fila ---
+
+    def submit(self, instance_name: str, message_id: str, media_type: str, jid: Optional[str] = None,
+               seconds: Optional[int] = None, api_key: Optional[str] = None,
+               content_sha: Optional[str] = None, tenant_id: Optional[str] = None) -> MediaJob:
+        """ Enfileira (ou devolve o job já existente da mesma mensagem). """
+        self._prune()
+        key = f"{instance_name}:{message_id}"
+        existing = self.jobs.get(key)
+        if existing and existing.status not in (FAILED, CANCELLED):
+            self.duplicates += 1
+            return existing
+
+        job = MediaJob(instance_name, message_id, media_type, jid, seconds, api_key, content_sha, tenant_id)
+        self.jobs[key] = job
+        if not self._tasks:
+            job.status = FAILED
+            job.error = "Fila de mídia não iniciada"
+            job.finished_at = time.time()
+            return job
+        self._push(job)
+        return job
+
+    def _push(self, job: MediaJob):
+        try:
+            # seq desempata: o job em si nunca é comparado
+            self._queue.put_nowait((job.priority, job.seconds or 0, next(self._seq), job))
+        except asyncio.QueueFull:
+            job.status = FAILED
+            job.error = "Fila de mídia cheia"
+            job.finished_at = time.time()
+            self.dropped += 1
+            print_warning(f"⚠️ Fila de mídia cheia ({MEDIA_QUEUE_MAX}): descartando {job.message_id} ({job.media_type})")
+
+    async def _worker(self, index: int):
+        while True:
+            *_, job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: MediaJob):
+        job.status = RUNNING
+        job.attempts += 1
+        job.started_at = time.time()
+        self.attempts += 1
+        if job.attempts == 1:
+            self._started += 1
+            self._wait_total += job.started_at - job.created_at
+        try:
+            text = await media_service.process_media(
+                job.message_id, job.instance_name, None, job.api_key, job.media_type, job.content_sha,
+                tenant_id=job.tenant_id, seconds=job.seconds
+            )
+        except asyncio.CancelledError:
+            job.status = CANCELLED
+            raise
+        except Exception as e:
+            self._run_total += time.time() - job.started_at
+            self._fail(job, e)
+            return
+
+        self._run_total += time.time() - job.started_at
+        job.result = text
+        job.status = DONE
+        job.finished_at = time.time()
+        self.completed += 1
+        if text and self._on_result:
+            try:
+                await self._on_result(job, text)
+            except Exception as e:
+                print_error(f"Erro ao aplicar resultado da mídia {job.message_id}: {e}")
+
+    def _fail(self, job: MediaJob, error: Exception):
+        job.error = str(getattr(error, "detail", None) or error)
+        permanent = isinstance(error, MediaDownloadError) and error.status_code in _PERMANENT_STATUS
+        if not permanent and job.attempts <= MEDIA_JOB_RETRIES:
+            delay = MEDIA_JOB_RETRY_DELAY * (2 ** (job.attempts - 1))
+            job.status = PENDING
+            self.retries += 1
+            print_warning(f"🔁 Mídia {job.message_id} falhou ({job.error}); nova tentativa em {delay:.0f}s")
+            self._retry_timers[job.key] = asyncio.get_running_loop().call_later(delay, self._retry, job)
+            return
+        job.status = FAILED
+        job.finished_at = time.time()
+        self.failed += 1
+        print_error(f"❌ Mídia {job.message_id} ({job.media_type}) falhou após {job.attempts} tentativa(s): {job.error}")
+
+    def _retry(self, job: MediaJob):
+        self._retry_timers.pop(job.key, None)
+        if job.status == PENDING:
+            self._push(job)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for key in [k for k, j in self.jobs.items() if j.finished_at and j.finished_at < cutoff]:
+            self.jobs.pop(key, None)
+
+    # --- Consulta ---
+
+    def get(self, instance_name: str, message_id: str) -> Optional[MediaJob]:
+        return self.jobs.get(f"{instance_name}:{message_id}")
+
+    def list(self, instance_name: Optional[str] = None, status: Optional[str] = None) -> List[MediaJob]:
+        return [j for j in self.jobs.values()
+                if (instance_name is None or j.instance_name == instance_name)
+                and (status is None or j.status == status)]
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "waiting_retry": len(self._retry_timers),
+            "running": sum(1 for j in self.jobs.values() if j.status == RUNNING),
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+            "avg_wait_s": round(self._wait_total / self._started, 3) if self._started else None,
+            "avg_run_s": round(self._run_total / self.attempts, 3) if self.attempts else None
+        }
+
+
+# Instância global
+media_scheduler = MediaScheduler()
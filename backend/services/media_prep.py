@@ -0,0 +1,131 @@
+# Em backend/services/media_prep.py
+import io
+import os
+import time
+import shutil
+import subprocess
+from typing import Any, Dict, Optional
+
+from PIL import Image, ImageOps
+
+from core.shared import print_warning
+
+"""
+Preparo da mídia antes de ir para o Gemini (tudo em memória, sem arquivo temporário).
+- Imagem: corrige a rotação do EXIF, reduz o maior lado para MEDIA_IMAGE_MAX_SIDE e
+  recomprime em JPEG (MEDIA_IMAGE_QUALITY). Para descrever a foto ao vendedor, 1280px sobra.
+- Áudio (opcional, MEDIA_AUDIO_TRANSCODE=1): ffmpeg via pipe para Opus mono 16kHz
+  (MEDIA_AUDIO_BITRATE). Nota de voz do WhatsApp já é Opus; vale para áudio encaminhado/MP3.
+- Vídeo e o resto: sem alteração.
+Se o resultado não ficar menor que o original, manda o original.
+"""
+
+MEDIA_IMAGE_MAX_SIDE = int(os.getenv("MEDIA_IMAGE_MAX_SIDE", "1280"))
+MEDIA_IMAGE_QUALITY = int(os.getenv("MEDIA_IMAGE_QUALITY", "80"))
+MEDIA_AUDIO_TRANSCODE = os.getenv("MEDIA_AUDIO_TRANSCODE", "0") == "1"
+MEDIA_AUDIO_BITRATE = os.getenv("MEDIA_AUDIO_BITRATE", "24k")
+MEDIA_AUDIO_TRANSCODE_TIMEOUT = float(os.getenv("MEDIA_AUDIO_TRANSCODE_TIMEOUT", "60"))
+
+_FFMPEG = shutil.which("ffmpeg")
+
+
+class PreparedMedia:
+    __slots__ = ("data", "mimetype", "original_bytes", "transformed", "prep_s")
+
+    def __init__(self, data: Optional[bytes], mimetype: str, original_bytes: int, transformed: bool, prep_s: float):
+        self.data = data  # None = não mexeu (sobe direto do arquivo do cache)
+        self.mimetype = mimetype
+        self.original_bytes = original_bytes
+        self.transformed = transformed
+        self.prep_s = prep_s
+
+    @property
+    def size(self) -> int:
+        return len(self.data) if self.data is not None else self.original_bytes
+
+
+def _downscale_image(raw: bytes) -> bytes:
+    with Image.open(io.BytesIO(raw)) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((MEDIA_IMAGE_MAX_SIDE, MEDIA_IMAGE_MAX_SIDE), Image.Resampling.LANCZOS)
+        if img.mode in ("RGBA", "LA", "P"):
+            # transparência (PNG/figurinha) vira fundo branco
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", img.size, "white")
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        elif img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=MEDIA_IMAGE_QUALITY, optimize=True)
+        return out.getvalue()
+
+
+def _transcode_audio(raw: bytes) -> bytes:
+    result = subprocess.run(
+        [_FFMPEG, "-v", "error", "-i", "pipe:0", "-vn", "-ac", "1", "-ar", "16000",
+         "-c:a", "libopus", "-b:a", MEDIA_AUDIO_BITRATE, "-f", "ogg", "pipe:1"],
+        input=raw, capture_output=True, timeout=MEDIA_AUDIO_TRANSCODE_TIMEOUT, check=True
+    )
+    return result.stdout
+
+
+def prepare_media(path: str, mimetype: str, media_type: str) -> PreparedMedia:
+    """ Bloqueante (CPU/disco): chamar no executor de mídia. """
+    started = time.perf_counter()
+    media_type = (media_type or "").lower()
+    original_bytes = os.path.getsize(path)
+
+    transform, new_mimetype = None, mimetype
+    if "image" in media_type or "sticker" in media_type:
+        transform, new_mimetype = _downscale_image, "image/jpeg"
+    elif "audio" in media_type and MEDIA_AUDIO_TRANSCODE and _FFMPEG:
+        transform, new_mimetype = _transcode_audio, "audio/ogg"
+
+    if transform:
+        with open(path, "rb") as f:
+            raw = f.read()
+        try:
+            data = transform(raw)
+            if data and len(data) < len(raw):
+                return PreparedMedia(data, new_mimetype, original_bytes, True, time.perf_counter() - started)
+        except Exception as e:
+            print_warning(f"⚠️ Preparo de mídia ({media_type}) falhou, usando o original: {e}")
+        return PreparedMedia(raw, mimetype, original_bytes, False, time.perf_counter() - started)
+
+    return PreparedMedia(None, mimetype, original_bytes, False, time.perf_counter() - started)
+
+
+class UploadStats:
+    """ Bytes enviados e latência de ponta a ponta por tipo de mídia. """
+
+    def __init__(self):
+        self.by_type: Dict[str, Dict[str, float]] = {}
+
+    def record(self, media_type: str, prepared: PreparedMedia, inline: bool, total_s: float):
+        kind = next((k for k in ("audio", "image", "sticker", "video") if k in (media_type or "").lower()), "other")
+        s = self.by_type.setdefault(kind, {"count": 0, "inline": 0, "transformed": 0, "original_bytes": 0,
+                                           "uploaded_bytes": 0, "prep_s": 0.0, "total_s": 0.0})
+        s["count"] += 1
+        s["inline"] += int(inline)
+        s["transformed"] += int(prepared.transformed)
+        s["original_bytes"] += prepared.original_bytes
+        s["uploaded_bytes"] += prepared.size
+        s["prep_s"] += prepared.prep_s
+        s["total_s"] += total_s
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = {}
+        for kind, s in self.by_type.items():
+            n = s["count"] or 1
+            out[kind] = {
+                "count": s["count"],
+                "inline": s["inline"],
+                "transformed": s["transformed"],
+                "avg_original_kb": round(s["original_bytes"] / n / 1024, 1),
+                "avg_uploaded_kb": round(s["uploaded_bytes"] / n / 1024, 1),
+                "bytes_saved_pct": round(100 * (1 - s["uploaded_bytes"] / s["original_bytes"]), 1)
+                if s["original_bytes"] else None,
+                "avg_prep_ms": round(s["prep_s"] / n * 1000, 1),
+                "avg_total_s": round(s["total_s"] / n, 3)
+            }
+        return out
@@ -1,109 +1,138 @@
+import io
 import os
-import base64
-import httpx
-import tempfile
+import time
 import asyncio
+from typing import Any, Dict
 from concurrent.futures import ThreadPoolExecutor
 import google.generativeai as genai
 from core.shared import print_error, print_info, print_success
+from services.media_cache import media_cache
+from services.media_prep import UploadStats, prepare_media
+from services.media_text_cache import media_text_cache
+from services.transcription import (GEMINI, MEDIA_TRANSCRIBER, WHISPER, TranscriberStats, WhisperTranscriber,
+                                    transcriber_name, whisper_transcriber)
+
+# Upload + geração no Gemini são bloqueantes: executor próprio e limitado, para uma rajada de
+# áudios não ocupar o thread pool padrão (usado por Redis, disco, run_in_threadpool...)
+MEDIA_THREADS = int(os.getenv("MEDIA_THREADS", os.getenv("MEDIA_WORKERS", "3")))
+GEMINI_MEDIA_MODEL = os.getenv("GEMINI_MEDIA_MODEL", "gemini-1.5-flash")
+# Até aqui a mídia vai inline no generate_content (limite da requisição do Gemini é 20MB)
+MEDIA_INLINE_MAX_BYTES = int(os.getenv("MEDIA_INLINE_MAX_MB", "15")) * 1024 * 1024
 
 class MediaService:
     def __init__(self):
         self.api_key = os.getenv("GEMINI_API_KEY")
+        self.executor = ThreadPoolExecutor(max_workers=MEDIA_THREADS, thread_name_prefix="media")
+        self.gemini_audio_stats = TranscriberStats()
+        self.upload_stats = UploadStats()
         if self.api_key:
             genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel("gemini-1.5-flash")
+            self.model = genai.GenerativeModel(GEMINI_MEDIA_MODEL)
         else:
             self.model = None
             print_error("❌ GEMINI_API_KEY not found for MediaService")
 
-    async def process_media(self, message_id: str, instance_name: str, evolution_url: str, evolution_key: str, media_type: str) -> str:
+    async def process_media(self, message_id: str, instance_name: str, evolution_url: str, evolution_key: str,
+                            media_type: str, content_sha: str = None, tenant_id: str = None,
+                            seconds: float = None) -> str:
         """
-        Baixa a mídia da Evolution API e usa o Gemini para transcrever (áudio/vídeo) ou descrever (imagem).
-        Retorna o texto gerado.
+        Baixa a mídia da Evolution API e transcreve (áudio/vídeo) ou descreve (imagem).
+        Áudio pode ir para o Whisper local conforme a empresa (services/transcription.py); o resto vai ao Gemini.
+        Retorna o texto gerado. Erros sobem para a fila de mídia (services/media_jobs.py) decidir a retentativa.
+        content_sha: fileSha256 da mensagem (hex), quando veio - mídia repetida nem é baixada.
         """
-        if not self.model:
+        backend = transcriber_name(media_type, tenant_id, instance_name)
+        if backend == WHISPER and not WhisperTranscriber.available():
+            backend = GEMINI
+        if backend == GEMINI and not self.model:
             return None
+        cache_model = whisper_transcriber.cache_model if backend == WHISPER else GEMINI_MEDIA_MODEL
 
-        print_info(f"🎬 Iniciando processamento de mídia: {message_id} ({media_type})")
+        # 0. Mídia encaminhada/repetida: texto já gerado para este conteúdo
+        cached = await media_text_cache.get(content_sha, media_type, cache_model)
+        if cached:
+            print_success(f"♻️ Mídia {message_id}: transcrição/descrição reaproveitada do cache")
+            return cached
 
-        # 1. Download Media via Evolution API (getBase64)
-        url = f"{evolution_url}/chat/getBase64FromMediaMessage/{instance_name}"
-        payload = {
-            "message": { "key": { "id": message_id } },
-            "convertToMp4": False
-        }
-        headers = {"apikey": evolution_key, "Content-Type": "application/json"}
+        print_info(f"🎬 Iniciando processamento de mídia: {message_id} ({media_type}, {backend})")
 
-        try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(url, headers=headers, json=payload, timeout=60.0)
-                if resp.status_code != 200:
-                    print_error(f"❌ Falha ao baixar mídia {message_id}: {resp.text}")
-                    return None
-                
-                data = resp.json()
-                base64_str = data.get("base64")
-                mimetype = data.get("mimetype")
-                
-                if not base64_str:
-                    print_error(f"❌ Base64 vazio para mídia {message_id}")
-                    return None
+        # 1. Download via cache de mídia (reaproveita o que o vendedor já abriu na tela)
+        entry = await media_cache.fetch(instance_name, {"key": {"id": message_id}}, evolution_key)
 
-                # 2. Salva em Arquivo Temporário (Executa em thread para não bloquear loop)
-                loop = asyncio.get_running_loop()
-                text_result = await loop.run_in_executor(
-                    None, 
-                    self._upload_and_generate, 
-                    base64_str, mimetype, media_type
-                )
-                
-                return text_result
+        # 2. Transcrição/geração, uma vez por conteúdo
+        async def generate():
+            if backend == WHISPER:
+                result = await whisper_transcriber.transcribe(entry.path)
+                return result["text"] or None
 
-        except Exception as e:
-            print_error(f"❌ Erro no processamento de mídia: {e}")
-            return None
+            # Upload + geração (Executa no executor de mídia para não bloquear loop)
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            text = await loop.run_in_executor(
+                self.executor,
+                self._upload_and_generate,
+                entry.path, entry.mimetype, media_type
+            )
+            if "audio" in media_type.lower():
+                self.gemini_audio_stats.record(time.perf_counter() - started, seconds)
+            return text
 
-    def _upload_and_generate(self, base64_str, mimetype, media_type):
-        try:
-            # Decodifica
-            file_bytes = base64.b64decode(base64_str)
-            suffix = "." + mimetype.split("/")[-1] if mimetype else ".bin"
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                tmp.write(file_bytes)
-                tmp_path = tmp.name
+        return await media_text_cache.get_or_generate(entry.sha256, media_type, cache_model, generate,
+                                                      aliases=(content_sha,))
 
-            try:
-                # Upload para Gemini
-                print_info(f"📤 Uploading para Gemini...")
-                uploaded_file = genai.upload_file(tmp_path, mime_type=mimetype)
-                
-                # Prompt adequado
-                if "audio" in media_type.lower():
-                    prompt = "Transcreva este áudio fielmente. Se houver falas, escreva-as. Se for apenas som, descreva."
-                elif "image" in media_type.lower():
-                    prompt = "Descreva esta imagem detalhadamente para que um vendedor possa entender o contexto."
-                elif "video" in media_type.lower():
-                    prompt = "Transcreva o áudio deste vídeo e descreva visualmente o que acontece de importante."
+    def transcriber_metrics(self) -> Dict[str, Any]:
+        """ Comparação remoto x local para áudio (rtf < 1 = mais rápido que tempo real). """
+        return {
+            "default": MEDIA_TRANSCRIBER,
+            "whisper_available": WhisperTranscriber.available(),
+            "gemini_audio": self.gemini_audio_stats.to_dict(),
+            WHISPER: whisper_transcriber.stats.to_dict(),
+            "uploads": self.upload_stats.to_dict()
+        }
+
+    def _upload_and_generate(self, file_path, mimetype, media_type):
+        started = time.perf_counter()
+        try:
+            # Prepara em memória (imagem reduzida, áudio opcionalmente recodificado)
+            prepared = prepare_media(file_path, mimetype, media_type)
+            inline = prepared.size <= MEDIA_INLINE_MAX_BYTES
+            if inline:
+                # Pequeno: vai junto no generate_content, sem upload separado
+                data = prepared.data
+                if data is None:
+                    with open(file_path, "rb") as f:
+                        data = f.read()
+                media_part = {"mime_type": prepared.mimetype, "data": data}
+            else:
+                print_info(f"📤 Uploading para Gemini ({prepared.size / 1024 / 1024:.1f}MB)...")
+                if prepared.data is not None:
+                    media_part = genai.upload_file(io.BytesIO(prepared.data), mime_type=prepared.mimetype)
                 else:
-                    prompt = "Descreva o conteúdo deste arquivo."
+                    # Grande e sem alteração (vídeo): sobe direto do arquivo do cache, sem carregar na memória
+                    media_part = genai.upload_file(file_path, mime_type=prepared.mimetype)
 
-                # Gera Conteúdo
-                print_info(f"🧠 Gemini processando...")
-                result = self.model.generate_content([uploaded_file, prompt])
-                text = result.text.strip()
-                
-                print_success(f"✅ Mídia processada: {text[:50]}...")
-                return text
+            # Prompt adequado
+            if "audio" in media_type.lower():
+                prompt = "Transcreva este áudio fielmente. Se houver falas, escreva-as. Se for apenas som, descreva."
+            elif "image" in media_type.lower():
+                prompt = "Descreva esta imagem detalhadamente para que um vendedor possa entender o contexto."
+            elif "video" in media_type.lower():
+                prompt = "Transcreva o áudio deste vídeo e descreva visualmente o que acontece de importante."
+            else:
+                prompt = "Descreva o conteúdo deste arquivo."
 
-            finally:
-                # Limpeza
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
-                # Opcional: genai.delete_file(uploaded_file.name)
+            # Gera Conteúdo
+            print_info(f"🧠 Gemini processando...")
+            result = self.model.generate_content([media_part, prompt])
+            text = result.text.strip()
+
+            self.upload_stats.record(media_type, prepared, inline, time.perf_counter() - started)
+            print_success(f"✅ Mídia processada ({prepared.original_bytes // 1024}KB -> {prepared.size // 1024}KB, "
+                          f"{'inline' if inline else 'upload'}): {text[:50]}...")
+            # Opcional (upload): genai.delete_file(media_part.name)
+            return text
         except Exception as e:
             print_error(f"❌ Erro interno Gemini: {e}")
-            return None
+            raise
 
 media_service = MediaService()
@@ -0,0 +1,154 @@
+# Em backend/services/media_text_cache.py
+import os
+import re
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from core.shared import print_info, print_warning
+from services.media_cache import MEDIA_CACHE_DIR, MediaCache
+
+"""
+Cache de transcrições/descrições de mídia, indexado pelo sha256 do conteúdo.
+Mídia encaminhada (o mesmo áudio/imagem de catálogo mandado para vários clientes) tem o
+mesmo sha256 - o fileSha256 do WhatsApp já vem na mensagem, então a repetição sai daqui
+sem download, sem upload e sem chamada ao Gemini.
+
+Chave = (sha256, tipo do prompt, modelo): trocar o modelo ou o tipo não reaproveita texto.
+Disco (texts/<aa>/<sha256>.<tipo>.<modelo>.json, com expiração MEDIA_TEXT_TTL) + LRU em memória.
+Pedidos simultâneos do mesmo conteúdo geram UMA geração (single-flight).
+"""
+
+MEDIA_TEXT_DIR = os.getenv("MEDIA_TEXT_DIR", os.path.join(MEDIA_CACHE_DIR, "texts"))
+MEDIA_TEXT_TTL = int(os.getenv("MEDIA_TEXT_TTL", str(30 * 86400)))
+MEDIA_TEXT_MEMORY_MAX = int(os.getenv("MEDIA_TEXT_MEMORY_MAX", "5000"))
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def prompt_kind(media_type: str) -> str:
+    media_type = (media_type or "").lower()
+    for kind in ("audio", "image", "video"):
+        if kind in media_type:
+            return kind
+    return "other"
+
+
+class MediaTextCache:
+    def __init__(self, root: str = MEDIA_TEXT_DIR, ttl: int = MEDIA_TEXT_TTL):
+        self.root = root
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[Tuple[str, str, str], Tuple[str, float]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.generations = 0
+        self.shared = 0  # pedidos que pegaram carona numa geração em andamento
+
+    def _path(self, sha: str, kind: str, model: str) -> str:
+        # modelo no nome: whisper e gemini (empresas diferentes) não sobrescrevem o arquivo um do outro
+        slug = _UNSAFE.sub("_", model).strip("_") or "default"
+        return os.path.join(self.root, sha[:2], f"{sha}.{kind}.{slug}.json")
+
+    def _remember(self, key: Tuple[str, str, str], text: str, expires_at: float):
+        with self._lock:
+            self._memory[key] = (text, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > MEDIA_TEXT_MEMORY_MAX:
+                self._memory.popitem(last=False)
+
+    def _read(self, sha: str, kind: str, model: str) -> Optional[str]:
+        """ Bloqueante (disco). """
+        key = (sha, kind, model)
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached:
+                self._memory.move_to_end(key)
+        if cached is None:
+            try:
+                with open(self._path(sha, kind, model)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                return None
+            if data.get("model") != model:
+                return None
+            cached = (data.get("text"), data.get("created_at", 0) + self.ttl)
+            self._remember(key, *cached)
+        text, expires_at = cached
+        if expires_at < time.time():
+            with self._lock:
+                self._memory.pop(key, None)
+            return None
+        return text
+
+    def _write(self, sha: str, kind: str, model: str, text: str):
+        """ Bloqueante (disco). """
+        now = time.time()
+        self._remember((sha, kind, model), text, now + self.ttl)
+        try:
+            MediaCache._atomic_write(self._path(sha, kind, model), json.dumps(
+                {"text": text, "model": model, "kind": kind, "created_at": now}, ensure_ascii=False).encode())
+        except OSError as e:
+            print_warning(f"⚠️ Cache de transcrições: não consegui gravar {sha[:12]}: {e}")
+
+    async def get(self, sha: Optional[str], media_type: str, model: str) -> Optional[str]:
+        if not sha:
+            return None
+        text = await asyncio.to_thread(self._read, sha, prompt_kind(media_type), model)
+        if text:
+            self.hits += 1
+        return text
+
+    async def get_or_generate(self, sha: str, media_type: str, model: str,
+                              generate: Callable[[], Awaitable[Optional[str]]],
+                              aliases: Tuple[Optional[str], ...] = ()) -> Optional[str]:
+        """
+        Texto do cache ou gerado (uma vez por conteúdo). 'aliases' são outros hashes do mesmo
+        conteúdo (ex.: fileSha256 da mensagem) que também passam a apontar para o resultado.
+        """
+        kind = prompt_kind(media_type)
+        text = await self.get(sha, media_type, model)
+        if text:
+            return text
+
+        key = (sha, kind, model)
+        future = self._inflight.get(key)
+        if future is None:
+            self.misses += 1
+            future = asyncio.ensure_future(self._generate(key, generate, aliases))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.shared += 1
+        return await asyncio.shield(future)
+
+    async def _generate(self, key: Tuple[str, str, str], generate: Callable[[], Awaitable[Optional[str]]],
+                        aliases: Tuple[Optional[str], ...]) -> Optional[str]:
+        sha, kind, model = key
+        text = await generate()
+        self.generations += 1
+        if text:
+            for digest in {sha, *filter(None, aliases)}:
+                await asyncio.to_thread(self._write, digest, kind, model, text)
+            print_info(f"🗃️ Transcrição/descrição guardada para {sha[:12]} ({kind})")
+        return text
+
+    def metrics(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "dir": self.root,
+            "memory_entries": len(self._memory),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+            "generations": self.generations,
+            "shared": self.shared
+        }
+
+
+# Instância global
+media_text_cache = MediaTextCache()
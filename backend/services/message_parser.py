@@ -0,0 +1,98 @@
+# Em backend/services/message_parser.py
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+"""
+Conversão dos registros de mensagem da Evolution API (findMessages) para o formato
+guardado no CONVERSATION_STATE_STORE: {content, sender, timestamp, message_id}.
+"""
+
+
+def extract_content(msg_content: Dict[str, Any]) -> Optional[str]:
+    """ None = sem conteúdo exibível (protocolo, reação, edição...): o registro é ignorado. """
+    content = (
+            msg_content.get("conversation") or
+            msg_content.get("extendedTextMessage", {}).get("text") or
+            msg_content.get("imageMessage", {}).get("caption")
+    )
+    if content:
+        return content
+    if "imageMessage" in msg_content:
+        return "📷 [Imagem]"
+    if "audioMessage" in msg_content:
+        return "🎤 [Áudio]"
+    if "videoMessage" in msg_content:
+        return "🎥 [Vídeo]"
+    if "documentMessage" in msg_content:
+        return "📄 [Documento]"
+    if "stickerMessage" in msg_content:
+        return "👾 [Figurinha]"
+    return None
+
+
+def remote_jid(record: Dict[str, Any]) -> Optional[str]:
+    """ remoteJidAlt (WhatsApp Business / LID) tem prioridade sobre remoteJid. """
+    key = record.get("key", {})
+    return key.get("remoteJidAlt") or key.get("remoteJid")
+
+
+def _timestamp(value: Any) -> int:
+    # Algumas versões da Evolution mandam messageTimestamp como string
+    try:
+        return int(value) if value else int(time.time())
+    except (TypeError, ValueError):
+        return int(time.time())
+
+
+def parse_record(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    content = extract_content(record.get("message") or {})
+    if not content:
+        return None
+    key = record.get("key", {})
+    return {
+        "content": content,
+        "sender": "vendedor" if key.get("fromMe") else "cliente",
+        "timestamp": _timestamp(record.get("messageTimestamp")),
+        "message_id": key.get("id")
+    }
+
+
+def parse_records(records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """ Retorna (mensagens ordenadas por timestamp, último pushName visto). """
+    push_name = None
+    messages = []
+    for record in records:
+        if record.get("pushName"):
+            push_name = record.get("pushName")
+        parsed = parse_record(record)
+        if parsed:
+            messages.append(parsed)
+    messages.sort(key=lambda x: x["timestamp"])
+    return messages, push_name
+
+
+def group_by_jid(records: List[Dict[str, Any]]) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, str]]:
+    """ Agrupa registros de várias conversas: (jid -> mensagens, jid -> pushName descoberto). """
+    messages_by_jid: Dict[str, List[Dict[str, Any]]] = {}
+    discovered_names: Dict[str, str] = {}
+    for record in records:
+        jid = remote_jid(record)
+        if not jid:
+            continue
+        if record.get("pushName") and not record.get("key", {}).get("fromMe"):
+            discovered_names[jid] = record.get("pushName")
+        parsed = parse_record(record)
+        if parsed:
+            messages_by_jid.setdefault(jid, []).append(parsed)
+    return messages_by_jid, discovered_names
+
+
+def merge_messages(existing: List[Dict[str, Any]], incoming: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """ Mescla por message_id. Retorna (lista final ordenada, apenas as novas). """
+    known_ids = {m.get("message_id") for m in existing}
+    new_msgs = [m for m in incoming if m.get("message_id") not in known_ids]
+    if not new_msgs:
+        return existing, []
+    final_msgs = existing + new_msgs
+    final_msgs.sort(key=lambda x: x["timestamp"])
+    return final_msgs, new_msgs
@@ -0,0 +1,203 @@
+# Em backend/services/profile_resolver.py
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from core.shared import print_error, print_info, print_warning
+from services.evolution_client import evolution_client
+from services.evolution_limits import get_instance_limiter
+
+"""
+Resolver de foto e nome de perfil do WhatsApp (fetchProfilePictureUrl / fetchProfile).
+- Single-flight: N pedidos do mesmo contato ao mesmo tempo geram UMA chamada à Evolution.
+- Cache positivo (PROFILE_TTL) e negativo (PROFILE_NEGATIVE_TTL: sem foto / privacidade);
+  erros de rede ficam só PROFILE_ERROR_TTL para não martelar uma Evolution instável.
+- Fila de baixa prioridade: mensagens novas só ENFILEIRAM o contato; um worker drena em
+  lotes respeitando PROFILE_REFRESH_RATE e entrega o resultado via callback (on_picture).
+"""
+
+PROFILE_TTL = int(os.getenv("PROFILE_TTL", str(6 * 3600)))
+PROFILE_NEGATIVE_TTL = int(os.getenv("PROFILE_NEGATIVE_TTL", "1800"))
+PROFILE_ERROR_TTL = int(os.getenv("PROFILE_ERROR_TTL", "60"))
+PROFILE_CACHE_MAX = int(os.getenv("PROFILE_CACHE_MAX", "20000"))
+# Avatares do WhatsApp expiram: conversas sem checagem há mais que isso voltam para a fila
+PROFILE_STALE_SECONDS = int(os.getenv("PROFILE_STALE_SECONDS", str(24 * 3600)))
+PROFILE_REFRESH_RATE = float(os.getenv("PROFILE_REFRESH_RATE", "2"))  # contatos/s
+PROFILE_REFRESH_BATCH = int(os.getenv("PROFILE_REFRESH_BATCH", "5"))
+PROFILE_REFRESH_QUEUE_MAX = int(os.getenv("PROFILE_REFRESH_QUEUE_MAX", "5000"))
+
+PICTURE = "picture"
+NAME = "name"
+_ACTIONS = {PICTURE: "fetchProfilePictureUrl", NAME: "fetchProfile"}
+
+PictureCallback = Callable[[str, str, Optional[str]], Awaitable[None]]
+
+
+def _number(jid: str) -> str:
+    return jid.split('@')[0]
+
+
+class _Entry:
+    __slots__ = ("value", "fetched_at", "expires_at")
+
+    def __init__(self, value: Optional[str], ttl: float):
+        self.value = value
+        self.fetched_at = time.monotonic()
+        self.expires_at = self.fetched_at + ttl
+
+
+class ProfileResolver:
+    def __init__(self):
+        self.entries: Dict[Tuple[str, str, str], _Entry] = {}
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: Set[Tuple[str, str]] = set()
+        self._worker: Optional[asyncio.Task] = None
+        self._on_picture: Optional[PictureCallback] = None
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.dropped = 0
+
+    # --- Leitura (cacheada + single-flight) ---
+
+    async def picture(self, instance_name: str, jid: str, api_key: Optional[str] = None,
+                      max_age: Optional[float] = None) -> Optional[str]:
+        return await self._resolve(PICTURE, instance_name, jid, api_key, max_age)
+
+    async def name(self, instance_name: str, jid: str, api_key: Optional[str] = None,
+                   max_age: Optional[float] = None) -> Optional[str]:
+        return await self._resolve(NAME, instance_name, jid, api_key, max_age)
+
+    async def _resolve(self, kind: str, instance_name: str, jid: str, api_key: Optional[str],
+                       max_age: Optional[float]) -> Optional[str]:
+        """ max_age: aceita o cache só se tiver no máximo N segundos (botão "atualizar perfil"). """
+        key = (kind, instance_name, _number(jid))
+        entry = self.entries.get(key)
+        now = time.monotonic()
+        if entry and now < entry.expires_at and (max_age is None or now - entry.fetched_at <= max_age):
+            self.hits += 1
+            return entry.value
+
+        self.misses += 1
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(key, api_key))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _fetch(self, key: Tuple[str, str, str], api_key: Optional[str]) -> Optional[str]:
+        kind, instance_name, number = key
+        self.fetches += 1
+        value, ttl = None, PROFILE_ERROR_TTL
+        try:
+            resp = await get_instance_limiter(instance_name).call(lambda: evolution_client.post(
+                f"/chat/{_ACTIONS[kind]}/{instance_name}", api_key=api_key, json={"number": number}, timeout=10.0
+            ))
+            if resp.status_code == 200:
+                data = resp.json() or {}
+                if kind == PICTURE:
+                    value = data.get("profilePictureUrl") or data.get("picture")
+                else:
+                    value = data.get("pushName") or data.get("name")
+                ttl = PROFILE_TTL if value else PROFILE_NEGATIVE_TTL
+            elif resp.status_code in (400, 404):
+                # Número sem WhatsApp / perfil inexistente
+                ttl = PROFILE_NEGATIVE_TTL
+        except Exception as e:
+            print_warning(f"⚠️ Erro ao buscar {kind} de {number} ({instance_name}): {e}")
+
+        self._store(key, _Entry(value, ttl))
+        return value
+
+    def _store(self, key: Tuple[str, str, str], entry: _Entry):
+        self.entries[key] = entry
+        if len(self.entries) > PROFILE_CACHE_MAX:
+            now = time.monotonic()
+            for old_key in [k for k, e in self.entries.items() if e.expires_at <= now]:
+                del self.entries[old_key]
+            # Ainda cheio: descarta os mais antigos (dict mantém a ordem de inserção)
+            while len(self.entries) > PROFILE_CACHE_MAX:
+                del self.entries[next(iter(self.entries))]
+
+    def invalidate(self, instance_name: str, jid: str):
+        number = _number(jid)
+        for kind in _ACTIONS:
+            self.entries.pop((kind, instance_name, number), None)
+
+    # --- Fila de atualização em segundo plano ---
+
+    def needs_refresh(self, conversation: Dict[str, Any]) -> bool:
+        # Sem foto (nenhuma ou privada) também é resultado: janela negativa mais curta, não a cada mensagem
+        window = PROFILE_STALE_SECONDS if conversation.get("avatar_url") else PROFILE_NEGATIVE_TTL
+        return time.time() - conversation.get("last_profile_check", 0) > window
+
+    def enqueue(self, instance_name: Optional[str], jid: str) -> bool:
+        """ Agenda a foto do contato (dedup; descarta se a fila estiver cheia). Não bloqueia. """
+        if not instance_name or self._queue is None:
+            return False
+        item = (instance_name, jid)
+        if item in self._queued:
+            return False
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self._queued.add(item)
+        return True
+
+    def start(self, on_picture: PictureCallback):
+        if self._worker:
+            return
+        self._on_picture = on_picture
+        self._queue = asyncio.Queue(maxsize=PROFILE_REFRESH_QUEUE_MAX)
+        self._worker = asyncio.create_task(self._drain())
+        print_info(f"📸 Atualizador de perfis iniciado ({PROFILE_REFRESH_RATE}/s, lotes de {PROFILE_REFRESH_BATCH})")
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def _refresh(self, instance_name: str, jid: str):
+        try:
+            url = await self.picture(instance_name, jid)
+            await self._on_picture(instance_name, jid, url)
+        except Exception as e:
+            print_error(f"Erro ao atualizar foto de {jid}: {e}")
+        finally:
+            self._queued.discard((instance_name, jid))
+
+    async def _drain(self):
+        interval = 1.0 / max(PROFILE_REFRESH_RATE, 0.01)
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < PROFILE_REFRESH_BATCH and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            started = time.monotonic()
+            await asyncio.gather(*(self._refresh(instance_name, jid) for instance_name, jid in batch))
+            # Baixa prioridade: nunca passa de PROFILE_REFRESH_RATE contatos por segundo
+            await asyncio.sleep(max(0.0, len(batch) * interval - (time.monotonic() - started)))
+
+    def metrics(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "fetches": self.fetches,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+            "queued": len(self._queued),
+            "dropped": self.dropped
+        }
+
+
+# Instância global
+profile_resolver = ProfileResolver()
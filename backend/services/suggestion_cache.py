@@ -0,0 +1,213 @@
+# Em backend/services/suggestion_cache.py
+import os
+import re
+import time
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from core.shared import print_info, print_warning
+
+"""
+Cache semântico das sugestões do copilot, na frente do SalesCopilot.
+Vendedor pergunta muito a mesma coisa (preço, funcionalidade, integração) e cada pedido
+custava retriever + uma geração inteira no Gemini. Aqui:
+- texto da chave = pergunta normalizada (minúsculas, sem acento/pontuação) + impressão do
+  contexto recente (as SUGGESTION_CACHE_CONTEXT mensagens anteriores à pergunta, normalizadas);
+- igual byte a byte -> acerto direto, sem nem calcular embedding;
+- senão o texto vira embedding e a maior similaridade de cosseno entre as entradas da mesma
+  empresa e do mesmo tipo (internal/analysis) precisa passar SUGGESTION_CACHE_THRESHOLD;
+- escopo por empresa (tenant), expiração SUGGESTION_CACHE_TTL e LRU de SUGGESTION_CACHE_MAX por empresa;
+- cada entrada carrega a versão da base de conhecimento (kb_version): base recriada = entrada velha ignorada.
+Só resposta com status "success" entra no cache.
+"""
+
+SUGGESTION_CACHE_ENABLED = os.getenv("SUGGESTION_CACHE", "1") == "1"
+SUGGESTION_CACHE_TTL = int(os.getenv("SUGGESTION_CACHE_TTL", str(6 * 3600)))
+SUGGESTION_CACHE_MAX = int(os.getenv("SUGGESTION_CACHE_MAX", "500"))  # por empresa
+SUGGESTION_CACHE_THRESHOLD = float(os.getenv("SUGGESTION_CACHE_THRESHOLD", "0.92"))
+SUGGESTION_CACHE_CONTEXT = int(os.getenv("SUGGESTION_CACHE_CONTEXT", "2"))
+SUGGESTION_CACHE_CONTEXT_CHARS = int(os.getenv("SUGGESTION_CACHE_CONTEXT_CHARS", "200"))
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return _SPACES.sub(" ", _NON_WORD.sub(" ", text)).strip()
+
+
+def context_fingerprint(history: List[Dict[str, Any]], query: str, limit: int = SUGGESTION_CACHE_CONTEXT) -> str:
+    """ Últimas 'limit' mensagens ANTES da pergunta (a própria pergunta costuma ser a última do cliente). """
+    if not limit or not history:
+        return ""
+    normalized_query = normalize_text(query)
+    messages = list(history)
+    while messages and normalize_text(messages[-1].get("content", "")) == normalized_query:
+        messages.pop()
+    return " | ".join(
+        f"{m.get('sender', '?')}: {normalize_text(m.get('content', ''))[:SUGGESTION_CACHE_CONTEXT_CHARS]}"
+        for m in messages[-limit:]
+    )
+
+
+class CachedSuggestion:
+    __slots__ = ("kind", "vector", "result", "kb_version", "created_at", "hits")
+
+    def __init__(self, kind: str, vector: Optional[np.ndarray], result: Dict[str, Any], kb_version: Optional[str]):
+        self.kind = kind
+        self.vector = vector
+        self.result = result
+        self.kb_version = kb_version
+        self.created_at = time.time()
+        self.hits = 0
+
+
+class SuggestionLookup:
+    """ Resultado da consulta; num miss guarda o embedding para o store() não recalcular. """
+    __slots__ = ("tenant_id", "kind", "key", "vector", "kb_version", "result", "similarity")
+
+    def __init__(self, tenant_id: str, kind: str, key: str, kb_version: Optional[str]):
+        self.tenant_id = tenant_id
+        self.kind = kind
+        self.key = key
+        self.kb_version = kb_version
+        self.vector: Optional[np.ndarray] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.similarity: Optional[float] = None
+
+
+class SuggestionCache:
+    def __init__(self, threshold: float = SUGGESTION_CACHE_THRESHOLD, ttl: int = SUGGESTION_CACHE_TTL,
+                 max_per_tenant: int = SUGGESTION_CACHE_MAX, enabled: bool = SUGGESTION_CACHE_ENABLED):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_per_tenant = max_per_tenant
+        self.enabled = enabled
+        self._tenants: Dict[str, "OrderedDict[str, CachedSuggestion]"] = {}
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.stale = 0  # versão da base de conhecimento mudou
+        self.embed_errors = 0
+        self._embed_calls = 0
+        self._embed_total = 0.0
+        self._similarity_total = 0.0
+
+    def _valid(self, entries: "OrderedDict[str, CachedSuggestion]", key: str, entry: CachedSuggestion,
+               kb_version: Optional[str], now: float) -> bool:
+        if entry.created_at + self.ttl < now:
+            entries.pop(key, None)
+            self.expired += 1
+            return False
+        if entry.kb_version != kb_version:
+            entries.pop(key, None)
+            self.stale += 1
+            return False
+        return True
+
+    def _hit(self, lookup: SuggestionLookup, entries, key: str, entry: CachedSuggestion, similarity: float,
+             exact: bool = False):
+        entries.move_to_end(key)
+        entry.hits += 1
+        lookup.result = entry.result
+        lookup.similarity = similarity
+        if exact:
+            self.exact_hits += 1
+        else:
+            self.semantic_hits += 1
+            self._similarity_total += similarity
+
+    async def lookup(self, tenant_id: Optional[str], query_type: str, query: str, history: List[Dict[str, Any]],
+                     embeddings, kb_version: Optional[str]) -> SuggestionLookup:
+        kind = "internal" if query_type == "internal" else "analysis"
+        text = f"{normalize_text(query)}\n{context_fingerprint(history, query)}"
+        key = hashlib.sha256(f"{kind}\n{text}".encode()).hexdigest()
+        lookup = SuggestionLookup(tenant_id or "", kind, key, kb_version)
+        if not self.enabled:
+            return lookup
+
+        entries = self._tenants.setdefault(lookup.tenant_id, OrderedDict())
+        now = time.time()
+        entry = entries.get(key)
+        if entry and self._valid(entries, key, entry, kb_version, now):
+            self._hit(lookup, entries, key, entry, 1.0, exact=True)
+            return lookup
+
+        if embeddings is not None:
+            started = time.perf_counter()
+            try:
+                vector = np.asarray(await embeddings.aembed_query(text), dtype=np.float32)
+                norm = float(np.linalg.norm(vector))
+                lookup.vector = vector / norm if norm else None
+            except Exception as e:
+                self.embed_errors += 1
+                print_warning(f"⚠️ Cache de sugestões: falha no embedding, seguindo sem cache semântico: {e}")
+            self._embed_calls += 1
+            self._embed_total += time.perf_counter() - started
+
+        if lookup.vector is not None:
+            candidates = [(k, e) for k, e in list(entries.items())
+                          if e.kind == kind and e.vector is not None and self._valid(entries, k, e, kb_version, now)]
+            if candidates:
+                scores = np.stack([e.vector for _, e in candidates]) @ lookup.vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    best_key, best_entry = candidates[best]
+                    self._hit(lookup, entries, best_key, best_entry, float(scores[best]))
+                    print_info(f"🧠 Cache de sugestões: acerto semântico ({scores[best]:.3f}) na empresa {tenant_id}")
+                    return lookup
+
+        self.misses += 1
+        return lookup
+
+    def store(self, lookup: SuggestionLookup, result: Dict[str, Any]):
+        if not self.enabled or not result or result.get("status") != "success":
+            return
+        entries = self._tenants.setdefault(lookup.tenant_id, OrderedDict())
+        entries[lookup.key] = CachedSuggestion(lookup.kind, lookup.vector, result, lookup.kb_version)
+        entries.move_to_end(lookup.key)
+        while len(entries) > self.max_per_tenant:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, tenant_id: Optional[str] = None) -> int:
+        """ Apaga tudo (ou só uma empresa). Devolve quantas entradas saíram. """
+        if tenant_id is not None:
+            return len(self._tenants.pop(tenant_id, None) or {})
+        removed = sum(len(entries) for entries in self._tenants.values())
+        self._tenants.clear()
+        return removed
+
+    def metrics(self) -> Dict[str, Any]:
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "tenants": len(self._tenants),
+            "entries": sum(len(entries) for entries in self._tenants.values()),
+            "hits": hits,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 3) if total else None,
+            "avg_semantic_similarity": round(self._similarity_total / self.semantic_hits, 4)
+            if self.semantic_hits else None,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "stale": self.stale,
+            "embed_errors": self.embed_errors,
+            "avg_embed_ms": round(self._embed_total / self._embed_calls * 1000, 1) if self._embed_calls else None
+        }
+
+
+# Instância global
+suggestion_cache = SuggestionCache()
@@ -0,0 +1,358 @@
+# Em backend/services/sync_service.py
+import os
+import time
+import asyncio
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from core.shared import print_error, print_info, print_success
+from core.state import CONVERSATION_STATE_STORE, STATE_LOCK, conversation_lock
+from services.evolution_client import evolution_client
+from services.evolution_limits import get_instance_limiter
+from services.json_stream import RecordStream
+from services.message_parser import group_by_jid, merge_messages, parse_records
+
+"""
+Sync incremental das conversas já conhecidas.
+Cada conversa guarda um cursor ("sync_cursor": {"ts", "id"}) junto do próprio registro
+(logo, vai para o Redis com ela). O sync:
+  1. faz UMA chamada findChats para saber a última atividade de cada chat;
+  2. busca findMessages só dos chats com atividade depois do cursor, pedindo apenas
+     registros mais novos que o cursor, em paralelo dentro do limitador da instância.
+Se findChats não trouxer timestamps, todos os chats são consultados (ainda só o delta).
+
+TenantHistorySync é o sync completo de uma instância (todas as páginas de findMessages),
+em pipeline: busca de páginas com prefetch limitado -> agrupamento por JID fora de lock ->
+merge de cada conversa numa seção crítica curta (lock da conversa, não o STATE_LOCK).
+As páginas são lidas em streaming (services/json_stream.py): os primeiros registros já
+são mesclados enquanto o resto da página ainda está chegando.
+"""
+
+SYNC_PAGE_LIMIT = int(os.getenv("SYNC_PAGE_LIMIT", "50"))
+SYNC_MAX_PAGES = int(os.getenv("SYNC_MAX_PAGES", "5"))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "500"))
+HISTORY_PREFETCH = int(os.getenv("HISTORY_PREFETCH", "4"))
+HISTORY_MAX_PAGES = int(os.getenv("HISTORY_MAX_PAGES", "200"))
+HISTORY_PERSIST_BATCH = int(os.getenv("HISTORY_PERSIST_BATCH", "50"))
+# Registros por lote repassado ao merge enquanto a página ainda está chegando
+HISTORY_STREAM_BATCH = int(os.getenv("HISTORY_STREAM_BATCH", "100"))
+
+
+def _to_epoch(value: Any) -> Optional[int]:
+    """ messageTimestamp vem como int, string numérica ou ISO (updatedAt). """
+    if value is None or value == "":
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return int(datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return None
+
+
+def get_cursor(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    """ Cursor salvo ou, para conversas antigas, derivado da última mensagem guardada. """
+    cursor = conversation.get("sync_cursor")
+    if cursor:
+        return cursor
+    messages = conversation.get("messages") or []
+    if not messages:
+        return {"ts": 0, "id": None}
+    last = messages[-1]
+    return {"ts": _to_epoch(last.get("timestamp")) or 0, "id": last.get("message_id")}
+
+
+def advance_cursor(conversation: Dict[str, Any]):
+    """ Move o cursor para a mensagem mais recente da conversa. """
+    messages = conversation.get("messages") or []
+    if messages:
+        last = messages[-1]
+        conversation["sync_cursor"] = {"ts": _to_epoch(last.get("timestamp")) or 0, "id": last.get("message_id")}
+
+
+class ActiveConversationSync:
+    def __init__(self, instance_name: str, api_token: str, persist: Callable[[List[str]], None]):
+        self.instance_name = instance_name
+        self.api_token = api_token
+        self.persist = persist
+        self.limiter = get_instance_limiter(instance_name)
+        self.requests = 0
+
+    async def _post(self, path: str, payload: Dict[str, Any]):
+        self.requests += 1
+        return await self.limiter.call(lambda: evolution_client.post(
+            f"/chat/{path}/{self.instance_name}", api_key=self.api_token, json=payload
+        ))
+
+    async def _remote_activity(self) -> Optional[Dict[str, int]]:
+        """ jid -> timestamp da última atividade, via uma única chamada findChats. """
+        try:
+            resp = await self._post("findChats", {})
+            if resp.status_code != 200:
+                return None
+            chats = resp.json()
+            if isinstance(chats, dict):
+                chats = chats.get("records") or []
+            activity = {}
+            for chat in chats:
+                jid = chat.get("remoteJid") or chat.get("id")
+                last_message = chat.get("lastMessage") or {}
+                ts = _to_epoch(last_message.get("messageTimestamp")) or _to_epoch(chat.get("updatedAt"))
+                if jid and ts:
+                    activity[jid] = ts
+            return activity or None
+        except Exception as e:
+            print_error(f"findChats indisponível para sync incremental: {e}")
+            return None
+
+    async def _fetch_since(self, jid: str, cursor: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """ Só registros com messageTimestamp >= cursor (o próprio cursor é descartado no merge). """
+        where: Dict[str, Any] = {"key": {"remoteJid": jid}}
+        if cursor.get("ts"):
+            where["messageTimestamp"] = {"$gte": cursor["ts"]}
+
+        records: List[Dict[str, Any]] = []
+        for page in range(1, SYNC_MAX_PAGES + 1):
+            resp = await self._post("findMessages", {"where": where, "limit": SYNC_PAGE_LIMIT, "page": page})
+            if resp.status_code != 200:
+                raise RuntimeError(f"Evolution respondeu {resp.status_code}")
+            batch = resp.json().get("messages", {}).get("records", [])
+            # Servidor que ignora o filtro devolve as mais recentes: paramos quando passamos do cursor
+            fresh = [r for r in batch if (_to_epoch(r.get("messageTimestamp")) or 0) >= (cursor.get("ts") or 0)]
+            records.extend(fresh)
+            if len(batch) < SYNC_PAGE_LIMIT or len(fresh) < len(batch):
+                break
+        return records
+
+    async def run(self, jids: List[str]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        async with STATE_LOCK:
+            cursors = {jid: get_cursor(CONVERSATION_STATE_STORE[jid])
+                       for jid in jids if jid in CONVERSATION_STATE_STORE}
+
+        activity = await self._remote_activity()
+        if activity is None:
+            candidates = list(cursors)
+        else:
+            # jid fora do findChats (paginação/limite do servidor) é desconhecido, não "sem novidade": busca
+            candidates = [jid for jid, cursor in cursors.items()
+                          if jid not in activity or activity[jid] > (cursor.get("ts") or 0)]
+        print_info(f"🔄 Sync incremental: {len(candidates)}/{len(cursors)} conversas com atividade nova")
+
+        results = await asyncio.gather(*(self._fetch_since(jid, cursors[jid]) for jid in candidates),
+                                       return_exceptions=True)
+
+        changed, failed = [], 0
+        async with STATE_LOCK:
+            for jid, records in zip(candidates, results):
+                if isinstance(records, Exception):
+                    failed += 1
+                    print_error(f"Erro ao sincronizar {jid}: {records}")
+                    continue
+                conversation = CONVERSATION_STATE_STORE.get(jid)
+                if conversation is None or not records:
+                    continue
+                incoming, _ = parse_records(records)
+                final_msgs, new_msgs = merge_messages(conversation.get("messages", []), incoming)
+                if new_msgs:
+                    conversation["messages"] = final_msgs
+                    conversation["lastUpdated"] = max(conversation.get("lastUpdated", 0),
+                                                      (_to_epoch(final_msgs[-1]["timestamp"]) or 0) * 1000)
+                    print_success(f"✅ {jid.split('@')[0]}: +{len(new_msgs)} mensagens")
+                previous_cursor = conversation.get("sync_cursor")
+                advance_cursor(conversation)
+                # Só o que mudou de fato é persistido/contado (registros repetidos do cursor não contam)
+                if new_msgs or conversation.get("sync_cursor") != previous_cursor:
+                    changed.append(jid)
+
+        if changed:
+            try:
+                self.persist(changed)
+            except Exception as e:
+                print_error(f"Erro ao persistir sync: {e}")
+
+        return {
+            "checked": len(cursors),
+            "fetched": len(candidates),
+            "updated": len(changed),
+            "failed": failed,
+            "requests": self.requests,
+            "elapsed_s": round(time.perf_counter() - started, 2)
+        }
+
+
+class TenantHistorySync:
+    def __init__(self, instance_name: str, api_token: str, persist: Callable[[List[str]], None],
+                 page_size: int = HISTORY_PAGE_SIZE, prefetch: int = HISTORY_PREFETCH):
+        self.instance_name = instance_name
+        self.api_token = api_token
+        self.persist = persist
+        self.page_size = page_size
+        self.prefetch = max(1, prefetch)
+        self.limiter = get_instance_limiter(instance_name)
+
+        self.pages = 0
+        self.messages = 0
+        self.first_commit_s: Optional[float] = None
+        self._dirty: List[str] = []
+        self._names: Dict[str, str] = {}
+        self._avatars: Dict[str, str] = {}
+
+    async def _stream_page(self, page: int, queue: asyncio.Queue) -> Dict[str, int]:
+        """ Busca uma página e repassa os registros para a fila em lotes, à medida que chegam. """
+        resp = await self.limiter.call(lambda: evolution_client.open_stream(
+            "POST", f"/chat/findMessages/{self.instance_name}", api_key=self.api_token,
+            json={"limit": self.page_size, "page": page}, timeout=60.0
+        ))
+        if resp.status_code != 200:
+            raise RuntimeError(f"findMessages página {page}: Evolution respondeu {resp.status_code}")
+        stream = RecordStream("records")
+        async for batch in stream.iterate(resp, min_batch=HISTORY_STREAM_BATCH):
+            await queue.put(batch)
+        self.pages += 1
+        return {**stream.meta, "count": stream.count}
+
+    async def _fetch_contacts(self) -> List[Dict[str, Any]]:
+        try:
+            resp = await self.limiter.call(lambda: evolution_client.post(
+                f"/chat/findContacts/{self.instance_name}", api_key=self.api_token, json={}, timeout=60.0
+            ))
+            contacts = resp.json() if resp.status_code == 200 else []
+            return contacts if isinstance(contacts, list) else []
+        except Exception as e:
+            print_error(f"Erro ao buscar contatos para sync: {e}")
+            return []
+
+    async def _produce(self, queue: asyncio.Queue):
+        """
+        Página 1 informa o total de páginas; as demais são buscadas por 'prefetch' workers.
+        A fila tem tamanho 'prefetch': se o merge atrasar, a busca espera (backpressure).
+        Sem total informado, segue página a página até vir uma página incompleta.
+        """
+        try:
+            first = await self._stream_page(1, queue)
+            total_pages = first.get("pages")
+
+            if total_pages:
+                pending = iter(range(2, min(int(total_pages), HISTORY_MAX_PAGES) + 1))
+
+                async def worker():
+                    for page in pending:
+                        await self._stream_page(page, queue)
+
+                workers = [asyncio.create_task(worker()) for _ in range(self.prefetch)]
+                try:
+                    await asyncio.gather(*workers)
+                except BaseException:
+                    # Uma página falhou (ou fomos cancelados): os outros workers param junto
+                    for task in workers:
+                        task.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
+                    raise
+            else:
+                page, count = 1, first["count"]
+                while count >= self.page_size and page < HISTORY_MAX_PAGES:
+                    page += 1
+                    count = (await self._stream_page(page, queue))["count"]
+        finally:
+            # Nunca bloqueia aqui: com a fila cheia o consumidor encerra pelo producer.done()
+            try:
+                queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+
+    def _display_name(self, jid: str, discovered: Optional[str]) -> str:
+        # Nome salvo na agenda > pushName descoberto > número
+        name = self._names.get(jid) or discovered or jid.split('@')[0]
+        if name.isdigit() and len(name) > 10:
+            name = f"+{name}"
+        return name
+
+    async def _commit(self, jid: str, msgs: List[Dict[str, Any]], discovered: Optional[str]):
+        """ Seção crítica curta: só o merge desta conversa, sem I/O. """
+        msgs.sort(key=lambda x: x["timestamp"])
+        async with conversation_lock(jid):
+            conversation = CONVERSATION_STATE_STORE.get(jid)
+            if conversation is None:
+                CONVERSATION_STATE_STORE[jid] = conversation = {
+                    "name": self._display_name(jid, discovered),
+                    "avatar_url": self._avatars.get(jid, ""),
+                    "messages": msgs,
+                    "unread": False,
+                    "unreadCount": 0,
+                    "lastUpdated": msgs[-1]["timestamp"] * 1000 if msgs else int(time.time()) * 1000
+                }
+            else:
+                final_msgs, new_msgs = merge_messages(conversation.get("messages", []), msgs)
+                if new_msgs:
+                    conversation["messages"] = final_msgs
+                    conversation["lastUpdated"] = final_msgs[-1]["timestamp"] * 1000
+                if jid in self._names or discovered:
+                    conversation["name"] = self._display_name(jid, discovered)
+                if jid in self._avatars:
+                    conversation["avatar_url"] = self._avatars[jid]
+            advance_cursor(conversation)
+        self._dirty.append(jid)
+
+    def _flush(self, force: bool = False):
+        if self._dirty and (force or len(self._dirty) >= HISTORY_PERSIST_BATCH):
+            batch, self._dirty = list(dict.fromkeys(self._dirty)), []
+            try:
+                self.persist(batch)
+            except Exception as e:
+                print_error(f"Erro ao persistir sync de histórico: {e}")
+
+    async def run(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        contacts_task = asyncio.create_task(self._fetch_contacts())
+        # Fila em lotes (não páginas): ~'prefetch' páginas em trânsito
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.prefetch * max(1, self.page_size // HISTORY_STREAM_BATCH))
+        producer = asyncio.create_task(self._produce(queue))
+
+        contacts = await contacts_task
+        for contact in contacts:
+            jid = contact.get("remoteJid")
+            if not jid or "@g.us" in jid:
+                continue
+            official_name = contact.get("name") or contact.get("pushName")
+            if official_name:
+                self._names[jid] = official_name
+            self._avatars[jid] = contact.get("profilePicUrl") or ""
+
+        touched = set()
+        try:
+            while not (producer.done() and queue.empty()):
+                records = await queue.get()
+                if records is None:
+                    break
+                self.messages += len(records)
+                # Agrupamento fora de qualquer lock
+                messages_by_jid, discovered = group_by_jid(records)
+                for jid, msgs in messages_by_jid.items():
+                    if "@g.us" in jid:
+                        continue
+                    await self._commit(jid, msgs, discovered.get(jid))
+                    touched.add(jid)
+                if self.first_commit_s is None and touched:
+                    self.first_commit_s = round(time.perf_counter() - started, 3)
+                self._flush()
+            # Propaga erro da busca (se houve)
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+
+        # Contatos da agenda sem nenhuma mensagem no histórico também entram na lista
+        for jid in self._avatars:
+            if jid not in touched:
+                await self._commit(jid, [], None)
+        self._flush(force=True)
+
+        elapsed = time.perf_counter() - started
+        print_success(f"✅ Histórico sincronizado: {self.pages} páginas, {self.messages} mensagens, "
+                      f"{len(touched)} conversas em {elapsed:.1f}s")
+        return {"pages": self.pages, "messages": self.messages, "conversations": len(touched),
+                "contacts": len(self._avatars), "first_commit_s": self.first_commit_s,
+                "elapsed_s": round(elapsed, 2)}
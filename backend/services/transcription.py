@@ -0,0 +1,161 @@
+# Em backend/services/transcription.py
+import os
+import time
+import asyncio
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+from core.shared import print_info, print_success, print_warning
+
+"""
+Backends de transcrição de áudio do MediaService.
+- "gemini": upload do arquivo + generate_content (remoto; paga por chamada e sobe o arquivo);
+- "whisper": Whisper local em CPU (openai-whisper, o mesmo dos scripts de ingestão), num
+  pool de PROCESSOS com o modelo carregado uma vez por worker (o GIL e a RAM do app ficam
+  livres; o processo principal só manda o caminho do arquivo do cache de mídia).
+
+Escolha: MEDIA_TRANSCRIBER (padrão) e MEDIA_TRANSCRIBER_TENANTS="empresa-x:whisper,empresa-y:gemini"
+(chave = id da empresa ou nome da instância). Imagem/vídeo continuam sempre no Gemini.
+Métricas por backend incluem o fator de tempo real (RTF = tempo de processamento / duração do áudio).
+O Whisper é opcional (pip install openai-whisper + ffmpeg no PATH); sem ele, tudo vai ao Gemini.
+Benchmark: scripts/bench_transcription.py.
+"""
+
+MEDIA_TRANSCRIBER = os.getenv("MEDIA_TRANSCRIBER", "gemini").lower()
+MEDIA_TRANSCRIBER_TENANTS = os.getenv("MEDIA_TRANSCRIBER_TENANTS", "")
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", "1"))
+WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE", "pt")
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", "0"))  # 0 = padrão do torch
+
+GEMINI = "gemini"
+WHISPER = "whisper"
+
+
+def _parse_overrides(raw: str) -> Dict[str, str]:
+    overrides = {}
+    for item in raw.split(","):
+        if ":" in item:
+            key, backend = item.rsplit(":", 1)
+            overrides[key.strip()] = backend.strip().lower()
+    return overrides
+
+
+_TENANT_BACKENDS = _parse_overrides(MEDIA_TRANSCRIBER_TENANTS)
+
+
+def transcriber_name(media_type: str, tenant_id: Optional[str] = None, instance_name: Optional[str] = None) -> str:
+    """ Backend para esta mídia/empresa. Só áudio pode ir para o Whisper. """
+    if "audio" not in (media_type or "").lower():
+        return GEMINI
+    return _TENANT_BACKENDS.get(tenant_id or "") or _TENANT_BACKENDS.get(instance_name or "") or MEDIA_TRANSCRIBER
+
+
+# --- Worker (roda dentro dos processos do pool) ---
+
+_WORKER_MODEL = None
+
+
+def _init_whisper_worker(model_name: str, threads: int):
+    global _WORKER_MODEL
+    import whisper
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    _WORKER_MODEL = whisper.load_model(model_name, device="cpu")
+
+
+def _whisper_transcribe(path: str, language: Optional[str]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    result = _WORKER_MODEL.transcribe(path, language=language or None, fp16=False, verbose=None)
+    segments = result.get("segments") or []
+    return {
+        "text": (result.get("text") or "").strip(),
+        "duration": segments[-1]["end"] if segments else None,
+        "elapsed": time.perf_counter() - started
+    }
+
+
+class TranscriberStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.processing_s = 0.0
+        self.audio_s = 0.0  # só chamadas com duração conhecida entram no RTF
+        self.timed_processing_s = 0.0
+
+    def record(self, elapsed: float, duration: Optional[float]):
+        self.calls += 1
+        self.processing_s += elapsed
+        if duration:
+            self.audio_s += duration
+            self.timed_processing_s += elapsed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "avg_s": round(self.processing_s / self.calls, 3) if self.calls else None,
+            "audio_s": round(self.audio_s, 1),
+            "rtf": round(self.timed_processing_s / self.audio_s, 3) if self.audio_s else None
+        }
+
+
+class WhisperTranscriber:
+    name = WHISPER
+
+    def __init__(self, model_name: str = WHISPER_MODEL, workers: int = WHISPER_WORKERS):
+        self.model_name = model_name
+        self.workers = workers
+        self.cache_model = f"whisper-{model_name}"  # chave no cache de transcrições
+        self.stats = TranscriberStats()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @staticmethod
+    def available() -> bool:
+        return importlib.util.find_spec("whisper") is not None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: não herda threads/event loop do servidor (fork com threads é perigoso)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_whisper_worker, initargs=(self.model_name, WHISPER_THREADS)
+            )
+            print_info(f"🎙️ Pool Whisper iniciado ({self.workers} processo(s), modelo '{self.model_name}')")
+        return self._pool
+
+    async def transcribe(self, path: str, language: Optional[str] = WHISPER_LANGUAGE) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._get_pool(), _whisper_transcribe, path, language)
+        except Exception:
+            self.stats.errors += 1
+            raise
+        self.stats.record(result["elapsed"], result["duration"])
+        print_success(f"✅ Whisper: {result['duration'] or 0:.1f}s de áudio em {result['elapsed']:.1f}s")
+        return result
+
+    def warmup(self):
+        """ Sobe os processos e carrega o modelo antes do primeiro áudio. """
+        pool = self._get_pool()
+        for _ in range(self.workers):
+            pool.submit(time.sleep, 0)
+
+    def shutdown(self):
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def whisper_configured() -> bool:
+    return WHISPER in (MEDIA_TRANSCRIBER, *_TENANT_BACKENDS.values())
+
+
+# Instância global
+whisper_transcriber = WhisperTranscriber()
+
+if whisper_configured() and not WhisperTranscriber.available():
+    print_warning("⚠️ Whisper configurado mas 'openai-whisper' não está instalado: áudios vão para o Gemini")
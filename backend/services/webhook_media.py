@@ -0,0 +1,55 @@
+# Em backend/services/webhook_media.py
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from core.shared import print_info, print_warning
+from services.json_stream import Base64Field
+from services.media_cache import BlobWriter, CachedMedia, media_cache, media_fingerprint
+
+"""
+Leitura do corpo do webhook da Evolution em streaming.
+Com WEBHOOK_BASE64=1 a Evolution manda a mídia junto no messages.upsert (data.message.base64):
+em vez de montar um dict com vários MB de base64 (e logar tudo), o corpo é lido por pedaços,
+o base64 é decodificado direto para o cache de mídia e só o resto do JSON vira o 'body'.
+A fila de transcrição e a tela do vendedor acham a mídia no cache sem chamar
+getBase64FromMediaMessage de novo. Sem base64 no corpo, o resultado é o JSON normal.
+"""
+
+# Opt-in: liga o webhookBase64 na configuração do webhook das instâncias
+WEBHOOK_BASE64 = os.getenv("WEBHOOK_BASE64", "0") == "1"
+
+
+async def read_webhook(request) -> Tuple[Dict[str, Any], Optional[CachedMedia]]:
+    """ (corpo sem o base64, mídia já gravada no cache ou None). """
+    field = Base64Field("base64")
+    writer: Optional[BlobWriter] = None
+    try:
+        async for chunk in request.stream():
+            decoded = field.feed(chunk)
+            if decoded:
+                writer = writer or media_cache.writer()
+                await writer.write(decoded)
+        tail = field.finish()
+        if tail:
+            writer = writer or media_cache.writer()
+            await writer.write(tail)
+
+        body = field.envelope
+        if writer is None:
+            return body, None
+
+        data = body.get("data") or {}
+        message_id = (data.get("key") or {}).get("id")
+        instance_name = body.get("instance")
+        if not (message_id and instance_name):
+            print_warning("⚠️ Webhook com base64 mas sem instância/key.id: mídia descartada")
+            writer.abort()
+            return body, None
+
+        entry = await writer.commit(f"{instance_name}:{message_id}", media_fingerprint(data)[1])
+        print_info(f"📥 Mídia {message_id} recebida no webhook ({entry.size // 1024}KB) direto para o cache")
+        return body, entry
+    except BaseException:
+        if writer:
+            writer.abort()
+        raise
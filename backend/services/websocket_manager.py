@@ -1,40 +1,392 @@
 # /websocket_manager.py
-from typing import Dict, List
+import os
+import json
+import time
+import uuid
+import asyncio
+from collections import deque
+from typing import Dict, List, Optional, Any, Set
 from fastapi import WebSocket
 
+from core.shared import print_error, print_info, print_warning
+
+# Quantos eventos por tenant ficam guardados para replay após reconexão
+WS_REPLAY_BUFFER_SIZE = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "500"))
+# Eventos sem tenant conhecido caem neste stream (e vão para todas as conexões)
+GLOBAL_TENANT = "_global"
+# Heartbeat: ping a cada N s; sem nenhum frame do cliente por WS_IDLE_TIMEOUT, a conexão é derrubada
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "25"))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "75"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+# Fila de saída por conexão: cheia = cliente não acompanha, a conexão é derrubada
+WS_SEND_QUEUE_MAX = max(int(os.getenv("WS_SEND_QUEUE_MAX", "1000")), WS_REPLAY_BUFFER_SIZE + 16)
+# Canal de resumos da lista de conversas
+LIST_CHANNEL = "list"
+
+
+class TenantEventLog:
+    """
+    Sequência monotônica + ring buffer dos últimos eventos de um tenant.
+    Se houver Redis, o buffer sobrevive a deploys (reconexões pós-deploy continuam baratas).
+    A gravação no Redis é write-behind: o append só mexe no deque e os eventos pendentes
+    vão em lote, numa thread, sem segurar o event loop.
+    """
+
+    def __init__(self, tenant_id: str, maxlen: int = WS_REPLAY_BUFFER_SIZE, redis_client=None):
+        self.tenant_id = tenant_id
+        self.redis_client = redis_client
+        self.events: deque = deque(maxlen=maxlen)
+        self.seq = 0
+        # stream_id muda quando a sequência é reiniciada (restart sem Redis)
+        self.stream_id = uuid.uuid4().hex[:12]
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _key(self, name: str) -> str:
+        return f"ws:{name}:{self.tenant_id}"
+
+    def restore_from_redis(self):
+        """ Bloqueante (Redis): chamar via asyncio.to_thread. """
+        if not self.redis_client:
+            return
+        try:
+            stream_id = self.redis_client.get(self._key("stream"))
+            if not stream_id:
+                self.redis_client.set(self._key("stream"), self.stream_id)
+                return
+            self.stream_id = stream_id
+            self.seq = int(self.redis_client.get(self._key("seq")) or 0)
+            for raw in self.redis_client.lrange(self._key("events"), -self.events.maxlen, -1):
+                self.events.append(json.loads(raw))
+            print_info(f"📼 Replay WS restaurado do Redis: {self.tenant_id} (seq={self.seq}, {len(self.events)} eventos)")
+        except Exception as e:
+            print_error(f"Erro ao restaurar replay WS do Redis: {e}")
+
+    def append(self, event: Dict[str, Any], summary: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Carimba o evento com o próximo seq e guarda no buffer.
+        Cada entrada guarda o evento completo e (opcional) o resumo para o canal da lista.
+        """
+        self.seq += 1
+        entry = {"seq": self.seq, "event": {**event, "seq": self.seq}, "summary": summary}
+        self.events.append(entry)
+
+        if self.redis_client:
+            self._pending.append(entry)
+            if not self._flush_task or self._flush_task.done():
+                self._flush_task = asyncio.get_running_loop().create_task(self._flush())
+        return entry
+
+    async def _flush(self):
+        # uma tarefa por vez: os lotes chegam ao Redis na ordem do seq
+        while self._pending:
+            batch, self._pending = self._pending, []
+            await asyncio.to_thread(self._persist, batch)
+
+    def _persist(self, batch: List[Dict[str, Any]]):
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.set(self._key("seq"), batch[-1]["seq"])
+            pipe.rpush(self._key("events"), *[json.dumps(entry) for entry in batch])
+            pipe.ltrim(self._key("events"), -self.events.maxlen, -1)
+            pipe.expire(self._key("events"), 60 * 60 * 24)
+            pipe.execute()
+        except Exception as e:
+            print_error(f"Erro ao salvar eventos WS no Redis ({len(batch)}): {e}")
+
+    def since(self, last_seq: int, stream_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Entradas com seq > last_seq.
+        Retorna None quando o replay é impossível (lacuna fora do buffer ou stream reiniciado):
+        nesse caso o cliente precisa de um resync completo.
+        """
+        if stream_id and stream_id != self.stream_id:
+            return None
+        if last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+        oldest = self.events[0]["seq"] if self.events else self.seq + 1
+        if last_seq + 1 < oldest:
+            return None
+        return [e for e in self.events if e["seq"] > last_seq]
+
+
+class ClientConnection:
+    """
+    Estado de uma conexão: empresa + assinaturas.
+    - Canal 'list': recebe resumos compactos (id, preview, unread, lastUpdated) de todas as conversas.
+    - Conversas assinadas: recebem eventos completos (mensagens, reações, transcrições).
+    Enquanto o cliente não assina nada, é tratado como legado e recebe tudo completo.
+    Todo frame para o socket passa pela 'outbox' (um writer por conexão, ordem preservada).
+    """
+
+    def __init__(self, websocket: WebSocket, tenant_id: Optional[str] = None, username: Optional[str] = None):
+        self.websocket = websocket
+        self.tenant_id = tenant_id
+        self.username = username
+        self.subscribed = False
+        self.list_channel = False
+        self.conversations: Set[str] = set()
+        self.last_seen = time.monotonic()
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_MAX)
+        self.writer: Optional[asyncio.Task] = None
+
+    def subscribe(self, targets: List[str]):
+        self.subscribed = True
+        for target in targets:
+            if target == LIST_CHANNEL:
+                self.list_channel = True
+            elif target:
+                self.conversations.add(target)
+
+    def unsubscribe(self, targets: List[str]):
+        for target in targets:
+            if target == LIST_CHANNEL:
+                self.list_channel = False
+            else:
+                self.conversations.discard(target)
+
+    def project(self, entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """ Decide o que esta conexão recebe de um evento: completo, resumo ou nada. """
+        event = entry["event"]
+        if not self.subscribed:
+            return event
+
+        conversation_id = event.get("conversation_id")
+        if not conversation_id or conversation_id in self.conversations:
+            return event
+        if self.list_channel and entry.get("summary"):
+            return {"type": "conversation_summary", "seq": entry["seq"], **entry["summary"]}
+        return None
+
+
+def _parse_targets(data: Dict[str, Any]) -> List[str]:
+    targets = []
+    if data.get("channel"):
+        targets.append(data["channel"])
+    if data.get("conversation_id"):
+        targets.append(data["conversation_id"])
+    targets.extend(data.get("conversation_ids") or [])
+    return targets
+
+
 class ConnectionManager:
     def __init__(self):
-        # Dicionário para guardar conexões por usuário (ou ID da instância)
-        # Formato: { "user_id_1": [websocket1, websocket2] }
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        # Conexões ativas (tenant None = cliente legado sem token, recebe tudo)
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self.event_logs: Dict[str, TenantEventLog] = {}
+        self.redis_client = None
+        # Um lock por stream (tenant): serializa criação do log + carimbo + enfileiramento.
+        # O envio em si é feito fora dele, pelo writer de cada conexão.
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+        # Métricas (expostas em /ws/metrics)
+        self.send_latencies_ms: deque = deque(maxlen=1000)
+        self.frames_sent = 0
+        self.dropped_frames = 0
+        self.reaped_connections = 0
 
-    async def connect(self, user_id: str, websocket: WebSocket):
-        """ Aceita e armazena uma nova conexão WebSocket. """
+    def attach_redis(self, redis_client):
+        """ Habilita persistência do buffer de replay no Redis. """
+        self.redis_client = redis_client
+
+    def _lock_for(self, tenant_id: Optional[str]) -> asyncio.Lock:
+        return self._locks.setdefault(tenant_id or GLOBAL_TENANT, asyncio.Lock())
+
+    async def get_event_log(self, tenant_id: Optional[str]) -> TenantEventLog:
+        """ Chamar com o lock do tenant. Primeira vez: restaura o buffer do Redis numa thread. """
+        key = tenant_id or GLOBAL_TENANT
+        if key not in self.event_logs:
+            log = TenantEventLog(key, redis_client=self.redis_client)
+            await asyncio.to_thread(log.restore_from_redis)
+            self.event_logs[key] = log
+        return self.event_logs[key]
+
+    async def connect(self, websocket: WebSocket, tenant_id: Optional[str] = None,
+                      last_seq: Optional[int] = None, stream_id: Optional[str] = None,
+                      subscriptions: Optional[List[str]] = None, username: Optional[str] = None):
+        """
+        Aceita a conexão e, se o cliente informar last_seq, reenvia só os eventos perdidos.
+        Se a lacuna já saiu do buffer, envia 'resync_required' para o cliente recarregar tudo.
+        'subscriptions' (ex: ["list", "5541...@s.whatsapp.net"]) já filtra o replay.
+        """
         await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
-        print(f"Nova conexão: Usuário {user_id} conectado.")
+        client = ClientConnection(websocket, tenant_id, username)
+        if subscriptions:
+            client.subscribe(subscriptions)
 
-    def disconnect(self, user_id: str, websocket: WebSocket):
+        async with self._lock_for(tenant_id):
+            # Sob o lock só o snapshot + registro; o replay sai pelo writer da conexão,
+            # antes de qualquer evento ao vivo (mesma fila), com o timeout de envio de sempre.
+            log = await self.get_event_log(tenant_id)
+            frames = [{"type": "stream_info", "stream_id": log.stream_id, "seq": log.seq}]
+            if last_seq is not None:
+                missed = log.since(last_seq, stream_id)
+                if missed is None:
+                    print_warning(f"🔁 WS resync completo necessário (tenant={tenant_id}, last_seq={last_seq})")
+                    frames.append({"type": "resync_required", "stream_id": log.stream_id, "seq": log.seq})
+                else:
+                    replay = [p for p in (client.project(entry) for entry in missed) if p is not None]
+                    frames.extend(replay)
+                    print_info(f"🔁 WS retomado (tenant={tenant_id}): {len(replay)} eventos reenviados")
+
+            self.active_connections[websocket] = client
+            for frame in frames:
+                client.outbox.put_nowait(frame)
+            client.writer = asyncio.create_task(self._writer(client))
+
+    def disconnect(self, websocket: WebSocket):
         """ Remove uma conexão WebSocket. """
-        if user_id in self.active_connections:
-            self.active_connections[user_id].remove(websocket)
-            print(f"Desconexão: Usuário {user_id} desconectado.")
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
-
-    async def broadcast(self, user_id: str, message_json: dict):
-        """ Envia uma mensagem JSON para todas as conexões de um usuário. """
-        if user_id in self.active_connections:
-            connections = self.active_connections[user_id]
-            for connection in connections:
-                try:
-                    await connection.send_json(message_json)
-                except Exception as e:
-                    print(f"Erro ao enviar para {user_id}: {e}")
-                    # Remove conexões quebradas (opcional, mas bom)
-                    # self.disconnect(user_id, connection)
+        client = self.active_connections.pop(websocket, None)
+        if client and client.writer:
+            client.writer.cancel()
+
+    def handle_client_message(self, websocket: WebSocket, raw: str):
+        """
+        Mensagens do cliente:
+        {"type": "subscribe", "channel": "list"} | {"type": "subscribe", "conversation_id": "..."}
+        {"type": "unsubscribe", ...} com os mesmos campos.
+        {"type": "pong"} em resposta ao ping do servidor (qualquer frame conta como sinal de vida).
+        """
+        client = self.active_connections.get(websocket)
+        if not client:
+            return
+        client.last_seen = time.monotonic()
+        try:
+            data = json.loads(raw)
+        except (TypeError, ValueError):
+            return
+        if not isinstance(data, dict):
+            return
+
+        if data.get("type") == "subscribe":
+            client.subscribe(_parse_targets(data))
+        elif data.get("type") == "unsubscribe":
+            client.unsubscribe(_parse_targets(data))
+
+    def _enqueue(self, client: ClientConnection, payload: Dict[str, Any]):
+        """ Não bloqueia: o writer da conexão envia. Fila cheia = cliente lento, derrubado. """
+        try:
+            client.outbox.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.dropped_frames += 1
+            print_warning(f"🔌 WS removido: fila de saída cheia ({WS_SEND_QUEUE_MAX}, tenant={client.tenant_id})")
+            asyncio.create_task(self._reap(client.websocket))
+
+    async def _writer(self, client: ClientConnection):
+        while True:
+            payload = await client.outbox.get()
+            if not await self._send(client.websocket, payload):
+                return
+
+    async def _send(self, websocket: WebSocket, payload: Dict[str, Any]) -> bool:
+        """ Envia com timeout. Socket lento/morto é removido do fan-out e fechado. """
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(websocket.send_json(payload), timeout=WS_SEND_TIMEOUT)
+            self.send_latencies_ms.append((time.perf_counter() - started) * 1000)
+            self.frames_sent += 1
+            return True
+        except Exception as e:
+            self.dropped_frames += 1
+            print_warning(f"🔌 WS removido após falha de envio: {type(e).__name__} {e}")
+            await self._reap(websocket)
+            return False
+
+    async def _reap(self, websocket: WebSocket):
+        client = self.active_connections.pop(websocket, None)
+        if client is not None:
+            self.reaped_connections += 1
+            if client.writer and client.writer is not asyncio.current_task():
+                client.writer.cancel()
+        try:
+            await websocket.close(code=1001)
+        except Exception:
+            pass
+
+    async def broadcast(self, message: dict, tenant_id: Optional[str] = None,
+                        summary: Optional[Dict[str, Any]] = None):
+        """
+        Carimba o evento no stream do tenant e envia para as conexões desse tenant
+        (e para clientes legados sem tenant). Sem tenant, envia para todos.
+        'summary' é a versão compacta enviada a quem só assina o canal da lista.
+        """
+        async with self._lock_for(tenant_id):
+            log = await self.get_event_log(tenant_id)
+            entry = log.append(message, summary)
+            # Só enfileira: um cliente lento atrasa a própria fila, não o broadcast dos outros
+            for client in list(self.active_connections.values()):
+                if tenant_id and client.tenant_id and client.tenant_id != tenant_id:
+                    continue
+                payload = client.project(entry)
+                if payload is not None:
+                    self._enqueue(client, payload)
+
+    async def send_to_user(self, username: str, message: dict):
+        """
+        Evento direto para as conexões de um usuário (ex: progresso de importação).
+        Não entra no stream do tenant: não tem seq nem replay.
+        """
+        for client in list(self.active_connections.values()):
+            if client.username == username:
+                self._enqueue(client, message)
+
+    # --- Heartbeat ---
+    def start_heartbeat(self):
+        if not self._heartbeat_task or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop_heartbeat(self):
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+
+    async def _heartbeat_loop(self):
+        """ Envia ping periódico e derruba conexões sem sinal de vida (half-open). """
+        while True:
+            await asyncio.sleep(WS_PING_INTERVAL)
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                print_error(f"Erro no heartbeat WS: {e}")
+
+    async def heartbeat(self):
+        now = time.monotonic()
+        for connection, client in list(self.active_connections.items()):
+            if now - client.last_seen > WS_IDLE_TIMEOUT:
+                print_warning(f"💀 WS inativo há {int(now - client.last_seen)}s, removendo (tenant={client.tenant_id})")
+                await self._reap(connection)
+                continue
+            # mesma fila dos eventos: o ping nunca concorre com um envio no mesmo socket
+            self._enqueue(client, {"type": "ping", "ts": int(time.time() * 1000)})
+
+    def metrics(self) -> Dict[str, Any]:
+        latencies = sorted(self.send_latencies_ms)
+
+        def pct(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 2) if latencies else None
+
+        by_tenant: Dict[str, int] = {}
+        for client in self.active_connections.values():
+            key = client.tenant_id or GLOBAL_TENANT
+            by_tenant[key] = by_tenant.get(key, 0) + 1
+
+        return {
+            "live_connections": len(self.active_connections),
+            "live_connections_by_tenant": by_tenant,
+            "frames_sent": self.frames_sent,
+            "dropped_frames": self.dropped_frames,
+            "queued_frames": sum(c.outbox.qsize() for c in self.active_connections.values()),
+            "reaped_connections": self.reaped_connections,
+            "send_latency_ms": {"p50": pct(0.50), "p99": pct(0.99), "samples": len(latencies)}
+        }
+
 
 # Instância global do gerenciador
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager()
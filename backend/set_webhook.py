@@ -25,14 +25,21 @@ async def configure_webhook():
             "enabled": True,
             "url": WEBHOOK_URL,
             "webhookByEvents": False,
-            "webhookBase64": False,
+            "webhookBase64": os.getenv("WEBHOOK_BASE64", "0") == "1",
             "events": [
                 "QRCODE_UPDATED",
                 "MESSAGES_UPSERT",
                 "MESSAGES_UPDATE",
                 "MESSAGES_DELETE",
                 "SEND_MESSAGE",
-                "CONNECTION_UPDATE"
+                "CONNECTION_UPDATE",
+                "CONTACTS_UPSERT",
+                "CONTACTS_UPDATE",
+                "CONTACTS_SET",
+                "CHATS_UPSERT",
+                "CHATS_UPDATE",
+                "CHATS_DELETE",
+                "CHATS_SET"
             ]
         }
     }
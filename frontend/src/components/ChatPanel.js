@@ -57,6 +57,39 @@ const AsyncMedia = ({ media, rawMessage, onImageClick }) => {
 
       // 3. Se tem rawMessage, tenta baixar do backend
       if (rawMessage) {
+        // 3a. Binário direto do cache do backend (sem base64, com ETag)
+        const messageId = rawMessage.key?.id;
+
+        // Áudio/vídeo: link assinado direto no src; o player baixa só o trecho que precisa (Range)
+        if (messageId && (media.type === 'audio' || media.type === 'video')) {
+          try {
+            const res = await api.get(`/evolution/media/${encodeURIComponent(messageId)}/link`);
+            if (isMounted && res.data && res.data.url) {
+              setSrc(`${api.defaults.baseURL}${res.data.url}`);
+              setLoading(false);
+              return;
+            }
+          } catch (err) {
+            console.warn("AsyncMedia: link assinado indisponível:", err);
+          }
+        }
+
+        if (messageId) {
+          try {
+            const res = await api.get(`/evolution/media/${encodeURIComponent(messageId)}`, { responseType: 'blob' });
+            if (isMounted && res.data && res.data.size > 0) {
+              const blobSrc = URL.createObjectURL(res.data);
+              if (cacheKey) MEDIA_CACHE.set(cacheKey, blobSrc);
+              setSrc(blobSrc);
+              setLoading(false);
+              return;
+            }
+          } catch (err) {
+            console.warn("AsyncMedia: binário indisponível, tentando base64:", err);
+          }
+        }
+
+        // 3b. Fallback: base64 com a mensagem completa
         try {
           const res = await api.post('/evolution/media/download', { message: rawMessage });
 
@@ -75,7 +75,7 @@ const MainLayout = ({ onLogout }) => {
     // --- ESTADOS E HOOKS ---
     const [notification, setNotification] = useState(null);
     const notify = (msg, type = 'success') => setNotification({ message: msg, type });
-    const { conversations, currentChat, selectChat, deselectChat, refreshConversations, isCopilotOpen, handleDeleteConversation, loadInitialConversations, isLoadingInitial } = useChat();
+    const { conversations, currentChat, selectChat, deselectChat, refreshConversations, isCopilotOpen, handleDeleteConversation, loadInitialConversations, isLoadingInitial, initialLoadProgress, cancelInitialLoad, importProgress, setImportProgress } = useChat();
     const { token } = useAuth();
 
     // Controle de Modais
@@ -200,15 +200,15 @@ const MainLayout = ({ onLogout }) => {
                 body: JSON.stringify({ jids: Array.from(selectedJids) })
             });
             if (res.ok) {
+                const data = await res.json();
                 setShowImportModal(false);
                 setSelectedJids(new Set());
 
                 // SUBSTITUÍDO: alert(...) POR notify(...)
                 notify("Importação iniciada! Atualizando lista...", "success");
 
-                // Refresh escalonado
-                setTimeout(() => { if (refreshConversations) refreshConversations(); }, 2000);
-                setTimeout(() => { if (refreshConversations) refreshConversations(); }, 5000);
+                // O progresso chega pelo WebSocket (import_progress / import_finished)
+                setImportProgress({ job_id: data.job_id, total: data.total, done: 0, failed: 0, remaining: data.total });
             }
         } catch (error) { notify("Erro ao solicitar importação.", "error"); } finally { setIsImporting(false); }
     };
@@ -236,6 +236,23 @@ const MainLayout = ({ onLogout }) => {
                     </div>
                 </div>
 
+                {/* PROGRESSO DA IMPORTAÇÃO */}
+                {importProgress && (
+                    <div className="import-progress" style={{ padding: '6px 16px', fontSize: '12px', opacity: 0.8 }}>
+                        Importando: {importProgress.done}/{importProgress.total}
+                        {importProgress.failed > 0 && ` · ${importProgress.failed} falhas`}
+                    </div>
+                )}
+
+                {/* PROGRESSO DA CARGA INICIAL (conversas já aparecem enquanto carrega) */}
+                {isLoadingInitial && conversations.length > 0 && (
+                    <div className="import-progress" style={{ padding: '6px 16px', fontSize: '12px', opacity: 0.8 }}>
+                        Carregando conversas: {initialLoadProgress?.conversations ?? conversations.length}
+                        {' · '}
+                        <span onClick={cancelInitialLoad} style={{ cursor: 'pointer', textDecoration: 'underline' }}>cancelar</span>
+                    </div>
+                )}
+
                 {/* BARRA DE PESQUISA (RESTAURADA) */}
                 <div className="sidebar-search-bar">
                     <div className="sidebar-search-wrapper">
@@ -47,6 +47,9 @@ export const ChatProvider = ({ children }) => {
     // Sugestões agora são mapeadas por conversation ID
     const [suggestionsByConversation, setSuggestionsByConversation] = useState({});
 
+    // 📥 Progresso da importação de conversas (eventos do servidor só para este usuário)
+    const [importProgress, setImportProgress] = useState(null);
+
     // 🚦 Fila de Carregamento (Loading por conversa)
     const [loadingStates, setLoadingStates] = useState({}); // { [convId]: true/false }
 
@@ -75,6 +78,9 @@ export const ChatProvider = ({ children }) => {
     const currentChat = conversations.find(c => c.id === activeConversationId) || null;
     const activeConversationIdRef = useRef(activeConversationId);
     const wsRef = useRef(null);
+    // 🔁 Posição no stream de eventos do servidor (para retomar sem refetch completo)
+    const lastSeqRef = useRef(null);
+    const streamIdRef = useRef(null);
 
     useEffect(() => { activeConversationIdRef.current = activeConversationId; }, [activeConversationId]);
 
@@ -92,6 +98,53 @@ export const ChatProvider = ({ children }) => {
         setQueryType('analysis');
     }, [activeConversationId]);
 
+    // Sugestão em streaming (SSE): o texto aparece token a token; o payload final substitui tudo.
+    // Se o streaming não estiver disponível, cai na rota antiga (resposta inteira de uma vez).
+    const streamSuggestion = async (conversationId, query, type) => {
+        const body = JSON.stringify({ conversation_id: conversationId, query, type });
+        const headers = { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` };
+        const setSuggestion = (value) => setSuggestionsByConversation(prev => ({ ...prev, [conversationId]: value }));
+
+        const response = await fetch(`${API_BASE_URL}/ai/generate_suggestion/stream`, { method: 'POST', headers, body });
+        if (!response.ok || !response.body) {
+            const fallback = await fetch(`${API_BASE_URL}/ai/generate_suggestion`, { method: 'POST', headers, body });
+            const data = await fallback.json();
+            if (data.status === 'success') setSuggestion(data.suggestions);
+            return;
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let partial = '';
+        for (;;) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const frames = buffer.split('\n\n');
+            buffer = frames.pop();
+            for (const frame of frames) {
+                const event = (frame.match(/^event: (.*)$/m) || [])[1];
+                const dataLine = (frame.match(/^data: (.*)$/m) || [])[1];
+                if (!event || !dataLine) continue;
+                const data = JSON.parse(dataLine);
+                if (event === 'token') {
+                    partial += data.text;
+                    setSuggestion({ immediate_answer: partial, follow_up_options: [], streaming: true });
+                    // Primeiro token: some o "carregando", o texto vai aparecendo
+                    setLoadingStates(prev => {
+                        if (!prev[conversationId]) return prev;
+                        const newState = { ...prev };
+                        delete newState[conversationId];
+                        return newState;
+                    });
+                } else if (event === 'final' && data.status === 'success') {
+                    setSuggestion(data.suggestions);
+                }
+            }
+        }
+    };
+
     // Ação: Analisar mensagem do cliente (Botão direito ou Automático)
     const handleSuggestionRequest = async (text, conversationId) => {
         if (!text) return;
@@ -105,19 +158,7 @@ export const ChatProvider = ({ children }) => {
         if (!isCopilotOpen) setIsCopilotOpen(true);
 
         try {
-            // Rota do backend que criamos no main.py
-            const response = await fetch(`${API_BASE_URL}/ai/generate_suggestion`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
-                body: JSON.stringify({ conversation_id: conversationId, query: text, type: 'analysis' })
-            });
-            const data = await response.json();
-            if (data.status === 'success') {
-                setSuggestionsByConversation(prev => ({
-                    ...prev,
-                    [conversationId]: data.suggestions
-                }));
-            }
+            await streamSuggestion(conversationId, text, 'analysis');
         } catch (e) { console.error(e); }
         finally {
             setLoadingStates(prev => {
@@ -138,18 +179,7 @@ export const ChatProvider = ({ children }) => {
         setQueryType('internal');
 
         try {
-            const response = await fetch(`${API_BASE_URL}/ai/generate_suggestion`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
-                body: JSON.stringify({ conversation_id: currentId, query: query, type: 'internal' })
-            });
-            const data = await response.json();
-            if (data.status === 'success') {
-                setSuggestionsByConversation(prev => ({
-                    ...prev,
-                    [currentId]: data.suggestions
-                }));
-            }
+            await streamSuggestion(currentId, query, 'internal');
         } catch (e) { console.error(e); }
         finally {
             setLoadingStates(prev => {
@@ -300,7 +330,16 @@ export const ChatProvider = ({ children }) => {
                 wsRef.current.close();
             }
 
-            const ws = new WebSocket(WS_URL);
+            // Na reconexão, informa o último seq recebido: o servidor reenvia só o que perdemos
+            // 📡 Assinaturas: resumos da lista + eventos completos só da conversa aberta
+            const subscriptions = ['list'];
+            if (activeConversationIdRef.current) subscriptions.push(activeConversationIdRef.current);
+            const params = new URLSearchParams({ token, subscriptions: subscriptions.join(',') });
+            if (lastSeqRef.current !== null && streamIdRef.current) {
+                params.set('last_seq', lastSeqRef.current);
+                params.set('stream_id', streamIdRef.current);
+            }
+            const ws = new WebSocket(`${WS_URL}?${params.toString()}`);
             wsRef.current = ws;
 
             ws.onopen = () => {
@@ -330,6 +369,57 @@ export const ChatProvider = ({ children }) => {
                 try {
                     const data = JSON.parse(event.data);
 
+                    // 💓 Heartbeat do servidor: responde para não ser derrubado como conexão morta
+                    if (data.type === 'ping') {
+                        if (ws.readyState === WebSocket.OPEN) ws.send(JSON.stringify({ type: 'pong', ts: data.ts }));
+                        return;
+                    }
+
+                    // 🔁 Controle do stream (seq/replay)
+                    if (data.type === 'stream_info') {
+                        if (streamIdRef.current !== data.stream_id || lastSeqRef.current === null) {
+                            lastSeqRef.current = data.seq;
+                        }
+                        streamIdRef.current = data.stream_id;
+                        return;
+                    }
+                    if (data.type === 'resync_required') {
+                        // Lacuna fora do buffer do servidor: recarrega lista e conversa aberta
+                        console.log('🔁 WS: resync completo necessário');
+                        streamIdRef.current = data.stream_id;
+                        lastSeqRef.current = data.seq;
+                        fetchConversations();
+                        if (activeConversationIdRef.current) {
+                            messagesCache.current.delete(activeConversationIdRef.current);
+                            fetchMessages(activeConversationIdRef.current);
+                        }
+                        return;
+                    }
+                    // 📥 Progresso da importação (evento direto, sem seq)
+                    if (data.type === 'import_progress') {
+                        setImportProgress(data);
+                        return;
+                    }
+                    // 🚀 Carga inicial em andamento / concluída
+                    if (data.type === 'initial_load_progress') {
+                        if (initialLoadJobRef.current === data.job_id) setInitialLoadProgress(data);
+                        return;
+                    }
+                    if (data.type === 'initial_load_finished') {
+                        finishInitialLoad(data.job_id);
+                        return;
+                    }
+                    if (data.type === 'import_finished') {
+                        setImportProgress(null);
+                        fetchConversations();
+                        return;
+                    }
+
+                    if (typeof data.seq === 'number') {
+                        if (lastSeqRef.current !== null && data.seq <= lastSeqRef.current) return; // já visto
+                        lastSeqRef.current = data.seq;
+                    }
+
                     // 👍 Processar reações
                     if (data.type === 'message_reaction') {
                         const { conversation_id, message_id, reaction, from } = data;
@@ -379,20 +469,51 @@ export const ChatProvider = ({ children }) => {
                         return;
                     }
 
+                    // 📋 Resumo compacto (canal 'list'): atualiza só a linha da conversa
+                    if (data.type === 'conversation_summary') {
+                        const { conversation_id, name, avatar_url, preview, unread, unreadCount, lastUpdated } = data;
+                        setConversations(prev => {
+                            const exists = prev.some(c => c.id === conversation_id);
+                            const updated = exists
+                                ? prev.map(c => c.id === conversation_id ? {
+                                    ...c,
+                                    name: name || c.name,
+                                    avatar_url: avatar_url || c.avatar_url,
+                                    lastMessage: preview,
+                                    unread: activeConversationIdRef.current === conversation_id ? false : unread,
+                                    unreadCount: activeConversationIdRef.current === conversation_id ? 0 : unreadCount,
+                                    lastUpdated
+                                } : c)
+                                : [...prev, { id: conversation_id, name, avatar_url, lastMessage: preview, unread, unreadCount, lastUpdated }];
+                            return updated.sort((a, b) => (b.lastUpdated || 0) - (a.lastUpdated || 0));
+                        });
+                        return;
+                    }
+
                     if (data.type === 'new_message') {
                         const { conversation_id, message } = data;
 
-                        // 1. Se for a conversa ativa, busca mensagens atualizadas do backend
-                        if (activeConversationIdRef.current === conversation_id) {
-                            console.log(`🔄 WS: Nova mensagem em ${conversation_id}, atualizando...`);
-                            fetchMessages(conversation_id);
+                        // 1. Evento completo: aplica a mensagem localmente (nova ou atualizada, ex: transcrição)
+                        if (activeConversationIdRef.current === conversation_id && message) {
+                            setMessages(prev => {
+                                const idx = prev.findIndex(m => m.message_id === message.message_id);
+                                const next = idx >= 0
+                                    ? prev.map((m, i) => i === idx ? { ...m, ...message } : m)
+                                    : [...prev, message];
+                                messagesCache.current.set(conversation_id, next);
+                                return next;
+                            });
                         }
 
-                        // 2. Atualiza a lista de conversas (para ordenar e mostrar unread)
-                        fetchConversations();
-
-                        // (Opcional) Mantemos a atualização otimista local se quiser, 
-                        // mas o fetch garante a verdade absoluta (incluindo transcrições que o backend fizer)
+                        // 2. Atualiza a linha da conversa na lista (sem refetch de /conversations)
+                        setConversations(prev => {
+                            return prev.map(c => c.id === conversation_id ? {
+                                ...c,
+                                lastMessage: message?.content ?? c.lastMessage,
+                                unreadCount: data.unreadCount ?? c.unreadCount,
+                                lastUpdated: (message?.timestamp || 0) * 1000 || c.lastUpdated
+                            } : c).sort((a, b) => (b.lastUpdated || 0) - (a.lastUpdated || 0));
+                        });
                     }
                 } catch (e) {
                     console.error("🔴 Erro ao processar mensagem WS:", e);
@@ -412,7 +533,19 @@ export const ChatProvider = ({ children }) => {
                 wsRef.current.close(1000, "Component unmounting");
             }
         };
-    }, [token, WS_URL, fetchConversations]);
+    }, [token, WS_URL, fetchConversations, fetchMessages]);
+
+    // 📡 Mantém a assinatura de eventos completos apenas na conversa aberta
+    useEffect(() => {
+        const ws = wsRef.current;
+        if (!activeConversationId || !ws || ws.readyState !== WebSocket.OPEN) return;
+        ws.send(JSON.stringify({ type: 'subscribe', conversation_id: activeConversationId }));
+        return () => {
+            if (ws.readyState === WebSocket.OPEN) {
+                ws.send(JSON.stringify({ type: 'unsubscribe', conversation_id: activeConversationId }));
+            }
+        };
+    }, [activeConversationId]);
 
     // --- 3. AÇÕES ---
     const selectChat = async (chat) => {
@@ -580,35 +713,75 @@ export const ChatProvider = ({ children }) => {
         }
     };
 
-    // 🚀 Carrega conversas iniciais (últimas 20 conversas, 40 mensagens cada)
+    // 🚀 Carga inicial em job de fundo: as conversas chegam pelo WebSocket (mais recentes primeiro)
     const [isLoadingInitial, setIsLoadingInitial] = useState(false);
+    const [initialLoadProgress, setInitialLoadProgress] = useState(null);
+    const initialLoadJobRef = useRef(null);
+
+    const finishInitialLoad = (jobId) => {
+        if (initialLoadJobRef.current !== jobId) return;
+        initialLoadJobRef.current = null;
+        setIsLoadingInitial(false);
+        setInitialLoadProgress(null);
+        fetchConversations();
+    };
 
     const loadInitialConversations = async () => {
         if (!token) return false;
         setIsLoadingInitial(true);
 
         try {
-            console.log("🚀 Carregando conversas iniciais...");
+            console.log("🚀 Iniciando carga inicial...");
             const response = await fetch(`${API_BASE_URL}/sync/initial_load`, {
                 method: 'POST',
                 headers: { 'Authorization': `Bearer ${token}` }
             });
+            if (!response.ok) {
+                setIsLoadingInitial(false);
+                return false;
+            }
 
-            if (response.ok) {
-                const data = await response.json();
-                console.log(`✅ ${data.loaded} conversas carregadas de ${data.total_available} disponíveis`);
+            const job = await response.json();
+            initialLoadJobRef.current = job.job_id;
+            setInitialLoadProgress(job.progress || null);
 
-                // Atualiza lista de conversas
-                await fetchConversations();
-                return true;
+            // Polling de segurança (caso o evento initial_load_finished do WebSocket se perca)
+            while (initialLoadJobRef.current === job.job_id) {
+                await new Promise(r => setTimeout(r, 3000));
+                if (initialLoadJobRef.current !== job.job_id) break;
+                const statusRes = await fetch(`${API_BASE_URL}/sync/jobs/${job.job_id}`, {
+                    headers: { 'Authorization': `Bearer ${token}` }
+                });
+                if (!statusRes.ok) break;
+                const status = await statusRes.json();
+                setInitialLoadProgress(status.progress);
+                if (!['pending', 'running'].includes(status.status)) {
+                    console.log(`✅ Carga inicial ${status.status}: ${status.result?.loaded ?? 0} conversas`);
+                    break;
+                }
             }
-            return false;
+            finishInitialLoad(job.job_id);
+            return true;
         } catch (e) {
             console.error('Erro ao carregar conversas:', e);
-            return false;
-        } finally {
+            initialLoadJobRef.current = null;
             setIsLoadingInitial(false);
+            return false;
+        }
+    };
+
+    const cancelInitialLoad = async () => {
+        const jobId = initialLoadJobRef.current;
+        if (!jobId || !token) return;
+        try {
+            await fetch(`${API_BASE_URL}/sync/jobs/${jobId}`, {
+                method: 'DELETE',
+                headers: { 'Authorization': `Bearer ${token}` }
+            });
+        } catch (e) {
+            console.error('Erro ao cancelar carga inicial:', e);
         }
+        finishInitialLoad(jobId);
     };
 
     // --- EXPORTS ---
@@ -618,7 +791,9 @@ export const ChatProvider = ({ children }) => {
         selectChat, deselectChat, handleSendMessage, handleSendReaction, handleUpdateCustomName, handleRefreshProfile, handleDeleteConversation, handleStartConversation,
         fetchConversations, refreshConversations: fetchConversations,
         // Initial Load
-        loadInitialConversations, isLoadingInitial,
+        loadInitialConversations, isLoadingInitial, initialLoadProgress, cancelInitialLoad,
+        // Importação
+        importProgress, setImportProgress,
         // Copilot
         suggestions, isCopilotLoading, lastAnalyzedMessage, queryType,
         handleSuggestionRequest, handleInternalQuery, clearSuggestions,